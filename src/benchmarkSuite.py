@@ -0,0 +1,261 @@
+# Libraries
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+import contextlib
+from datetime import datetime
+
+from dumpGenerator import DumpGenerator, VOCABULARY_SIZE, ZIPF_EXPONENT, BODY_WORDS, INFOBOX_FIELDS, CATEGORY_COUNT, REFERENCE_COUNT, EXTERNAL_LINK_COUNT, SEED
+from pageExtractor import PageExtractor
+from fastPreprocessor import PREPROCESSORS
+from wikiHandler import WikiHandler
+from secondaryIndexHandler import SecondaryIndexHandler
+from queryTrace import PERCENTILES, get_percentile
+import numpyScorer
+import wikiSearch
+
+# Global Variables
+PAGE_COUNT = 5000
+QUERY_COUNT = 500
+MAX_WORD_CAP = 30
+TITLE_FILE_CAP = 20000
+# A small memory budget, so the pages are spilled into several temporary indexes to merge.
+INVERTED_INDEX_MEMORY_BUDGET_MB = 8
+FINAL_INDEX_FILE_CAP = 100000000
+SECONDARY_INDEX_SAMPLE_RATE = 64
+PREPROCESSOR = "nltk"
+SCORERS = ["pruned", "exhaustive", "numpy"]
+# Fraction of the queries that are field queries, and the number of words of a query.
+FIELD_QUERY_FRACTION = 0.25
+MIN_QUERY_WORDS = 1
+MAX_QUERY_WORDS = 4
+FIELD_QUERY_PREFIXES = ["title:", "infobox:", "body:", "category:", "links:", "reference:"]
+
+
+def get_git_commit():
+    # The commit of the source tree being benchmarked, or None outside of a git checkout.
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd = os.path.dirname(os.path.abspath(__file__)), stderr = subprocess.DEVNULL, text = True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def read_dump_pages(wiki_dump_path):
+    # Read the (title, text) of every page of a wiki xml dump, the way the indexer does.
+    pageExtractor = PageExtractor()
+    return list(pageExtractor.iter_file_pages(wiki_dump_path))
+
+def benchmark_preprocessor(backend, pages):
+    # Preprocess every page with a backend, and measure its throughput.
+    preprocessor = PREPROCESSORS[backend](MAX_WORD_CAP)
+    start_time = time.perf_counter()
+    for title, text in pages:
+        preprocessor.process_title(title)
+        preprocessor.process_text(text)
+    total_time = time.perf_counter() - start_time
+    return {
+        "seconds": total_time,
+        "pages_per_second": len(pages) / total_time,
+        "tokens_per_second": preprocessor.TotalWordsEncountered / total_time
+    }
+
+def benchmark_indexing(pages, wiki_dump_size, index_folder_path, memory_budget_mb):
+    # Index the pages with a WikiHandler, timing the page indexing apart from the merge of the temporary indexes,
+    # then build the secondary index.
+    wikiHandler = WikiHandler(index_folder_path, MAX_WORD_CAP, TITLE_FILE_CAP, memory_budget_mb << 20, FINAL_INDEX_FILE_CAP, PREPROCESSOR = PREPROCESSOR)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        start_time = time.perf_counter()
+        for title, text in pages:
+            wikiHandler.add_page(title, text)
+        index_time = time.perf_counter() - start_time
+        wikiHandler.finish()
+        finish_time = time.perf_counter() - start_time - index_time
+
+        secondary_start_time = time.perf_counter()
+        secondaryIndexHandler = SecondaryIndexHandler(index_folder_path, SECONDARY_INDEX_SAMPLE_RATE)
+        secondaryIndexHandler.build_secondary_index()
+        secondary_time = time.perf_counter() - secondary_start_time
+
+    index_size = sum(entry.stat().st_size for entry in os.scandir(index_folder_path) if entry.is_file())
+    return {
+        "index": {
+            "seconds": index_time,
+            "pages_per_second": len(pages) / index_time,
+            "dump_mb_per_second": wiki_dump_size / index_time / (1024 * 1024),
+            "temp_index_file_count": wikiHandler.TitleFileCount
+        },
+        "merge": {
+            "seconds": wikiHandler.MergeTime,
+            "mb_per_second": (wikiHandler.MergeBytesRead / wikiHandler.MergeTime / (1024 * 1024)) if wikiHandler.MergeTime > 0 else 0.0,
+            "temp_index_mb": wikiHandler.MergeBytesRead / (1024 * 1024),
+            "finish_seconds": finish_time
+        },
+        "secondary_index": {
+            "seconds": secondary_time
+        },
+        "stages": wikiHandler.get_build_stats()["stages"],
+        "total_pages_per_second": len(pages) / (index_time + finish_time + secondary_time),
+        "index_mb": index_size / (1024 * 1024),
+        "unique_words": wikiHandler.TotalUniqueWords
+    }
+
+def make_queries(dumpGenerator, query_count, field_query_fraction):
+    # Draw Zipfian queries from the vocabulary of the dump, a fraction of them field queries.
+    queries = []
+    for _ in range(query_count):
+        words = dumpGenerator.get_words(dumpGenerator.random.randint(MIN_QUERY_WORDS, MAX_QUERY_WORDS))
+        if(dumpGenerator.random.random() < field_query_fraction):
+            queries.append(" ".join(dumpGenerator.random.choice(FIELD_QUERY_PREFIXES) + word for word in words))
+        else:
+            queries.append(" ".join(words))
+    return queries
+
+def set_scorer(scorer):
+    # Select the scorer used by process_query.
+    wikiSearch.USE_NUMPY_SCORING = (scorer == "numpy")
+    wikiSearch.USE_DYNAMIC_PRUNING = (scorer == "pruned")
+
+def benchmark_queries(queries):
+    # Run every query through process_query once, with cold posting-list and query-result caches,
+    # and return the latency percentiles in milliseconds.
+    wikiSearch.queryCache.clear()
+    wikiSearch.postingCache.clear()
+    latencies = {"all": [], "field": [], "plain": []}
+    start_time = time.perf_counter()
+    for query in queries:
+        query_start_time = time.perf_counter()
+        wikiSearch.process_query(query)
+        latency = (time.perf_counter() - query_start_time) * 1000
+        latencies["all"].append(latency)
+        latencies["field" if ":" in query else "plain"].append(latency)
+    total_time = time.perf_counter() - start_time
+
+    result = {"queries_per_second": len(queries) / total_time}
+    for query_type, query_latencies in latencies.items():
+        query_latencies.sort()
+        for percentile in PERCENTILES:
+            result[query_type + "_p" + str(percentile) + "_ms"] = get_percentile(query_latencies, percentile)
+    return result
+
+def flatten_results(results, prefix = ""):
+    # Flatten nested results into {"a.b.c": value} metrics, to compare two runs.
+    metrics = {}
+    for key, value in results.items():
+        if(isinstance(value, dict)):
+            metrics.update(flatten_results(value, prefix + key + "."))
+        elif(isinstance(value, (int, float))):
+            metrics[prefix + key] = value
+    return metrics
+
+def compare_results(baseline, results):
+    # Print every metric of the results next to its baseline value and their ratio.
+    baseline_metrics = flatten_results(baseline["results"])
+    metrics = flatten_results(results["results"])
+    print("Baseline commit: \t" + str(baseline.get("git_commit")))
+    if(baseline.get("config") != results.get("config")):
+        print("Warning: the baseline was run with another configuration")
+    for metric in sorted(metrics):
+        if(metric not in baseline_metrics):
+            continue
+        baseline_value = baseline_metrics[metric]
+        ratio = (metrics[metric] / baseline_value) if baseline_value != 0 else float("inf")
+        print("%-45s %12.3f %12.3f %8.2fx" % (metric, baseline_value, metrics[metric], ratio))
+
+
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser(description = "Benchmark preprocessing, indexing, merging and querying on a synthetic wiki dump, writing the results as JSON.")
+    argParser.add_argument("--output", default = None, help = "JSON file to write the results to (default: print them)")
+    argParser.add_argument("--compare", default = None, help = "JSON results of an earlier run to compare against")
+    argParser.add_argument("--pages", type = int, default = PAGE_COUNT, help = "number of pages of the synthetic dump (default: %(default)s)")
+    argParser.add_argument("--queries", type = int, default = QUERY_COUNT, help = "number of queries (default: %(default)s)")
+    argParser.add_argument("--field-query-fraction", type = float, default = FIELD_QUERY_FRACTION, help = "fraction of the queries that are field queries (default: %(default)s)")
+    argParser.add_argument("--vocabulary-size", type = int, default = VOCABULARY_SIZE, help = "number of distinct words (default: %(default)s)")
+    argParser.add_argument("--zipf-exponent", type = float, default = ZIPF_EXPONENT, help = "exponent of the Zipfian word distribution (default: %(default)s)")
+    argParser.add_argument("--body-words", type = int, default = BODY_WORDS, help = "mean number of body words per page (default: %(default)s)")
+    argParser.add_argument("--seed", type = int, default = SEED, help = "random seed of the dump and the queries (default: %(default)s)")
+    argParser.add_argument("--memory-budget-mb", type = int, default = INVERTED_INDEX_MEMORY_BUDGET_MB, help = "memory budget of the in-memory inverted index, in MB (default: %(default)s)")
+    argParser.add_argument("--preprocessor", choices = sorted(PREPROCESSORS), default = PREPROCESSOR, help = "preprocessing backend of the indexer and the queries (default: %(default)s)")
+    argParser.add_argument("--scorers", nargs = "+", choices = SCORERS, default = SCORERS, help = "scorers to measure the query latency of (default: all)")
+    argParser.add_argument("--work-dir", default = None, help = "folder to write the dump and the index to, kept afterwards (default: a temporary folder)")
+    args = argParser.parse_args()
+
+    PREPROCESSOR = args.preprocessor
+    config = {
+        "pages": args.pages,
+        "queries": args.queries,
+        "field_query_fraction": args.field_query_fraction,
+        "vocabulary_size": args.vocabulary_size,
+        "zipf_exponent": args.zipf_exponent,
+        "body_words": args.body_words,
+        "seed": args.seed,
+        "memory_budget_mb": args.memory_budget_mb,
+        "preprocessor": PREPROCESSOR
+    }
+
+    work_dir = args.work_dir if args.work_dir is not None else tempfile.mkdtemp(prefix = "wikiSearchBenchmark_")
+    os.makedirs(work_dir, exist_ok = True)
+    wiki_dump_path = os.path.join(work_dir, "synthetic_dump.xml")
+    index_folder_path = os.path.join(work_dir, "indexFolder")
+    shutil.rmtree(index_folder_path, ignore_errors = True)
+    os.mkdir(index_folder_path)
+
+    results = {}
+    try:
+        # Generate the dump, and read its pages up front so that reading the xml isn't timed.
+        dumpGenerator = DumpGenerator(args.seed, args.vocabulary_size, args.zipf_exponent, args.body_words, INFOBOX_FIELDS, CATEGORY_COUNT, REFERENCE_COUNT, EXTERNAL_LINK_COUNT)
+        with open(wiki_dump_path, "w", encoding = "utf-8") as dump_fp:
+            dumpGenerator.write_dump(dump_fp, args.pages)
+        wiki_dump_size = os.path.getsize(wiki_dump_path)
+        pages = read_dump_pages(wiki_dump_path)
+        results["dump_mb"] = wiki_dump_size / (1024 * 1024)
+        print("Pages: \t\t\t" + str(len(pages)) + " (%.1f MB)" % results["dump_mb"])
+
+        results["preprocessor"] = {}
+        for backend in sorted(PREPROCESSORS):
+            results["preprocessor"][backend] = benchmark_preprocessor(backend, pages)
+            print("Preprocessor %s: \t%.1f pages/second" % (backend, results["preprocessor"][backend]["pages_per_second"]))
+
+        results.update(benchmark_indexing(pages, wiki_dump_size, index_folder_path, args.memory_budget_mb))
+        print("Indexing: \t\t%.1f pages/second, %d temporary indexes" % (results["index"]["pages_per_second"], results["index"]["temp_index_file_count"]))
+        print("Merging: \t\t%.1f MB/second" % results["merge"]["mb_per_second"])
+
+        # Query the index with the query-result cache disabled, so every query is scored.
+        wikiSearch.PREPROCESSOR = PREPROCESSOR
+        wikiSearch.QUERY_CACHE_SIZE = 0
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            wikiSearch.load_index(index_folder_path)
+        queries = make_queries(dumpGenerator, args.queries, args.field_query_fraction)
+        results["query"] = {}
+        for scorer in args.scorers:
+            if(scorer == "numpy" and not numpyScorer.is_available()):
+                print("NumPy isn't installed, skipping the numpy scorer")
+                continue
+            set_scorer(scorer)
+            results["query"][scorer] = benchmark_queries(queries)
+            query_result = results["query"][scorer]
+            print("Query %s: \t\tp50 %.2f ms, p95 %.2f ms, p99 %.2f ms" % (scorer, query_result["all_p50_ms"], query_result["all_p95_ms"], query_result["all_p99_ms"]))
+    finally:
+        if(args.work_dir is None):
+            shutil.rmtree(work_dir, ignore_errors = True)
+
+    report = {
+        "git_commit": get_git_commit(),
+        "date": datetime.utcnow().isoformat() + "Z",
+        "python": sys.version.split()[0],
+        "config": config,
+        "results": results
+    }
+    if(args.output is not None):
+        with open(args.output, "w", encoding = "utf-8") as output_fp:
+            json.dump(report, output_fp, indent = 2)
+        print("Results written to the file '" + args.output + "'")
+    else:
+        print(json.dumps(report, indent = 2))
+
+    if(args.compare is not None):
+        with open(args.compare, "r", encoding = "utf-8") as baseline_fp:
+            compare_results(json.load(baseline_fp), report)
@@ -0,0 +1,63 @@
+import threading
+from collections import OrderedDict
+
+class CacheHandler:
+    def __init__(self, MAX_CACHE_SIZE, MAX_ENTRY_FRACTION = 0.25):
+        # Initialize an LRU cache bounded by the estimated size in bytes of its entries.
+        # Entries larger than MAX_ENTRY_FRACTION of the cache aren't admitted, so one huge
+        # entry can't flush every hot one. A MAX_CACHE_SIZE of 0 disables the cache.
+        self.MAX_CACHE_SIZE = MAX_CACHE_SIZE
+        self.MAX_ENTRY_SIZE = MAX_CACHE_SIZE * MAX_ENTRY_FRACTION
+        self.entries = OrderedDict()
+        self.cache_size = 0
+        self.lock = threading.Lock()
+
+        # Initialize counters for statistics.
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        # Return the cached value of a key, or None, and mark it as most recently used.
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, size):
+        # Cache a value of the given estimated size, evicting the least recently used entries to make room.
+        if(size > self.MAX_ENTRY_SIZE):
+            return
+        with self.lock:
+            if key in self.entries:
+                self.cache_size -= self.entries.pop(key)[1]
+            self.entries[key] = (value, size)
+            self.cache_size += size
+            while(self.cache_size > self.MAX_CACHE_SIZE):
+                evicted_key, (evicted_value, evicted_size) = self.entries.popitem(last = False)
+                self.cache_size -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        # Drop every entry, for instance once the index has changed.
+        with self.lock:
+            self.entries.clear()
+            self.cache_size = 0
+
+    def get_stats(self):
+        # Return the cache counters, read under the lock so they're consistent with each other.
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "size": self.cache_size,
+                "max_size": self.MAX_CACHE_SIZE,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups > 0 else 0.0,
+                "evictions": self.evictions
+            }
@@ -0,0 +1,28 @@
+import os
+
+from invertedIndexHandler import TERM_DICTIONARY_FILE_NAME
+
+class DictionaryHandler:
+    def __init__(self, INDEX_FOLDER_PATH):
+        # Initialize the DictionaryHandler with the folder path.
+        self.INDEX_FOLDER_PATH = INDEX_FOLDER_PATH
+        self.term_dictionary_file_name = TERM_DICTIONARY_FILE_NAME
+        self.term_locations = {}
+
+    def has_term_dictionary(self):
+        # Check whether the index was built with a term dictionary.
+        return os.path.isfile(os.path.join(self.INDEX_FOLDER_PATH, self.term_dictionary_file_name))
+
+    def load_term_dictionary(self):
+        # Load the term dictionary into memory.
+
+        with open(os.path.join(self.INDEX_FOLDER_PATH, self.term_dictionary_file_name), "r", encoding='utf-8') as dictionary_fp:
+            for line in dictionary_fp:
+                word, index_file_idx, offset, length = line.rstrip("\n").split("=")
+                self.term_locations[word] = (int(index_file_idx), int(offset), int(length))
+
+        print("Term Dictionary Got Loaded")
+
+    def get_term_location(self, word):
+        # Get the (index file, byte offset, byte length) of a word's line, or None if the word isn't indexed.
+        return self.term_locations.get(word)
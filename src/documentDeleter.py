@@ -0,0 +1,39 @@
+# Libraries
+import os
+import argparse
+
+from segmentHandler import SEGMENT_MANIFEST_FILE_NAME, get_title_count, read_segment_manifest, write_segment_manifest, lock_segment_manifest, find_title_docIDs, delete_documents
+
+# Global Variables
+INDEX_FOLDER_PATH = "indexFolder"
+
+
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser(description = "Delete documents from an index, by docID or by title.")
+    argParser.add_argument("index_folder_path", help = "path to the index folder")
+    argParser.add_argument("--doc-id", type = int, nargs = "+", default = [], help = "docIDs of the documents to delete")
+    argParser.add_argument("--title", nargs = "+", default = [], help = "titles of the documents to delete")
+    argParser.add_argument("--title-file", default = None, help = "file with the titles of the documents to delete, one per line")
+    args = argParser.parse_args()
+
+    INDEX_FOLDER_PATH = os.path.abspath(args.index_folder_path)
+    if(get_title_count(INDEX_FOLDER_PATH) == 0 and not os.path.isfile(os.path.join(INDEX_FOLDER_PATH, SEGMENT_MANIFEST_FILE_NAME))):
+        print("Invalid index folder path")
+        exit(1)
+
+    titles = list(args.title)
+    if(args.title_file is not None):
+        with open(args.title_file, "r", encoding='utf-8') as title_fp:
+            titles += [line.rstrip("\n") for line in title_fp if line.strip() != ""]
+
+    # Deleted documents are marked in the tombstone bitmaps of their segments, and the manifest update
+    # makes searchers reload the index and skip them. Their postings are dropped by the next merge of their segment.
+    with lock_segment_manifest(INDEX_FOLDER_PATH):
+        manifest = read_segment_manifest(INDEX_FOLDER_PATH)
+        total_doc_count = sum(segment["doc_count"] for segment in manifest["segments"])
+        docIDs = [docID for docID in args.doc_id if 0 <= docID < total_doc_count]
+        if(len(titles) > 0):
+            docIDs += find_title_docIDs(INDEX_FOLDER_PATH, manifest, titles)
+        deleted_count = delete_documents(INDEX_FOLDER_PATH, manifest, docIDs)
+        write_segment_manifest(INDEX_FOLDER_PATH, manifest)
+    print("Deleted", deleted_count, "documents")
@@ -0,0 +1,145 @@
+# Libraries
+import random
+import argparse
+from itertools import accumulate
+from xml.sax.saxutils import escape
+
+# Global Variables
+PAGE_COUNT = 10000
+VOCABULARY_SIZE = 50000
+ZIPF_EXPONENT = 1.0
+BODY_WORDS = 300
+INFOBOX_FIELDS = 6
+CATEGORY_COUNT = 3
+REFERENCE_COUNT = 4
+EXTERNAL_LINK_COUNT = 2
+SEED = 42
+
+# Syllables the words of the vocabulary are made of.
+ONSETS = ["b", "c", "d", "f", "g", "h", "j", "k", "l", "m", "n", "p", "r", "s", "t", "v", "w", "z", "br", "ch", "gr", "sh", "st", "tr"]
+VOWELS = ["a", "e", "i", "o", "u", "ai", "ea", "io", "ou"]
+CODAS = ["", "", "", "n", "r", "s", "l", "nd", "st", "m"]
+
+INFOBOX_TYPES = ["person", "settlement", "film", "company", "river", "album", "football club", "university"]
+INFOBOX_KEYS = ["name", "birth_date", "location", "country", "genre", "founded", "occupation", "area", "population", "language", "label", "website"]
+SECTION_TITLES = ["History", "Early life", "Career", "Geography", "Reception", "Legacy", "Background", "Plot"]
+
+
+class DumpGenerator:
+    def __init__(self, SEED, VOCABULARY_SIZE, ZIPF_EXPONENT, BODY_WORDS, INFOBOX_FIELDS, CATEGORY_COUNT, REFERENCE_COUNT, EXTERNAL_LINK_COUNT):
+        # Initialize a generator of MediaWiki xml dumps, whose words are drawn from a Zipfian vocabulary.
+        # The same seed and sizes always generate the same dump.
+        self.SEED = SEED
+        self.VOCABULARY_SIZE = VOCABULARY_SIZE
+        self.ZIPF_EXPONENT = ZIPF_EXPONENT
+        self.BODY_WORDS = BODY_WORDS
+        self.INFOBOX_FIELDS = INFOBOX_FIELDS
+        self.CATEGORY_COUNT = CATEGORY_COUNT
+        self.REFERENCE_COUNT = REFERENCE_COUNT
+        self.EXTERNAL_LINK_COUNT = EXTERNAL_LINK_COUNT
+
+        self.random = random.Random(SEED)
+        self.vocabulary = self._make_vocabulary()
+
+        # The word of rank r is drawn with a probability proportional to 1 / r^ZIPF_EXPONENT.
+        self.cum_weights = list(accumulate(1.0 / (rank ** ZIPF_EXPONENT) for rank in range(1, VOCABULARY_SIZE + 1)))
+
+    def _make_vocabulary(self):
+        # Make VOCABULARY_SIZE distinct pronounceable words of 1 to 4 syllables, shorter words ranking first.
+        vocabulary = []
+        seen = set()
+        while(len(vocabulary) < self.VOCABULARY_SIZE):
+            syllable_count = min(1 + int(self.random.expovariate(1.0) * (1 + len(vocabulary) / 5000)), 4)
+            word = "".join(self.random.choice(ONSETS) + self.random.choice(VOWELS) + self.random.choice(CODAS) for _ in range(syllable_count))
+            if(word not in seen):
+                seen.add(word)
+                vocabulary.append(word)
+        return vocabulary
+
+    def get_words(self, count):
+        # Draw count words from the Zipfian vocabulary.
+        return self.random.choices(self.vocabulary, cum_weights = self.cum_weights, k = count)
+
+    def _get_phrase(self, low, high):
+        # A phrase of between low and high words.
+        return " ".join(self.get_words(self.random.randint(low, high)))
+
+    def _get_body(self, title):
+        # Paragraphs of body text with internal links, references and a few sections.
+        word_count = max(1, int(self.random.gauss(self.BODY_WORDS, self.BODY_WORDS / 3)))
+        words = self.get_words(word_count)
+        parts = ["'''" + title + "''' "]
+        reference_positions = set(self.random.sample(range(word_count), min(self.REFERENCE_COUNT, word_count)))
+        for idx, word in enumerate(words):
+            if(self.random.random() < 0.03):
+                parts.append("[[" + word + " " + self._get_phrase(0, 2) + "|" + word + "]] ")
+            else:
+                parts.append(word + " ")
+            if(idx in reference_positions):
+                parts.append("<ref>" + self._get_phrase(3, 10) + "</ref> ")
+            if(idx > 0 and idx % 120 == 0):
+                parts.append("\n\n== " + self.random.choice(SECTION_TITLES) + " ==\n")
+        return "".join(parts)
+
+    def get_page_text(self, title):
+        # Wikitext of a page: an infobox, the body, references, external links and categories.
+        lines = ["{{Infobox " + self.random.choice(INFOBOX_TYPES)]
+        for key in self.random.sample(INFOBOX_KEYS, min(self.INFOBOX_FIELDS, len(INFOBOX_KEYS))):
+            lines.append("| " + key + " = " + self._get_phrase(1, 4))
+        lines.append("}}")
+        lines.append(self._get_body(title))
+        lines.append("")
+        lines.append("== References ==")
+        lines.append("{{Reflist}} " + self._get_phrase(2, 6))
+        lines.append("")
+        lines.append("==External links==")
+        for _ in range(self.EXTERNAL_LINK_COUNT):
+            lines.append("* [http://www." + self.get_words(1)[0] + ".org/" + self.get_words(1)[0] + " " + self._get_phrase(1, 4) + "]")
+        lines.append("")
+        for _ in range(self.CATEGORY_COUNT):
+            lines.append("[[Category:" + self._get_phrase(1, 3) + "]]")
+        return "\n".join(lines) + "\n"
+
+    def iter_pages(self, page_count):
+        # Generate page_count (title, text) pages.
+        for _ in range(page_count):
+            title = " ".join(word.capitalize() for word in self.get_words(self.random.randint(1, 3)))
+            if(self.random.random() < 0.2):
+                title += " (" + self.get_words(1)[0] + ")"
+            yield title, self.get_page_text(title)
+
+    def write_dump(self, fp, page_count):
+        # Write a MediaWiki xml dump of page_count pages to an open text file.
+        fp.write('<mediawiki xmlns="http://www.mediawiki.org/xml/export-0.10/" version="0.10" xml:lang="en">\n')
+        fp.write("  <siteinfo>\n    <sitename>Synthetic Wiki</sitename>\n  </siteinfo>\n")
+        for page_idx, (title, text) in enumerate(self.iter_pages(page_count)):
+            fp.write("  <page>\n")
+            fp.write("    <title>" + escape(title) + "</title>\n")
+            fp.write("    <ns>0</ns>\n")
+            fp.write("    <id>" + str(page_idx + 1) + "</id>\n")
+            fp.write("    <revision>\n")
+            fp.write("      <id>" + str(page_idx + 1) + "</id>\n")
+            fp.write('      <text bytes="' + str(len(text.encode("utf-8"))) + '" xml:space="preserve">' + escape(text) + "</text>\n")
+            fp.write("    </revision>\n")
+            fp.write("  </page>\n")
+        fp.write("</mediawiki>\n")
+
+
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser(description = "Generate a deterministic synthetic MediaWiki xml dump.")
+    argParser.add_argument("output_path", help = "path of the xml dump to write")
+    argParser.add_argument("--pages", type = int, default = PAGE_COUNT, help = "number of pages (default: %(default)s)")
+    argParser.add_argument("--vocabulary-size", type = int, default = VOCABULARY_SIZE, help = "number of distinct words (default: %(default)s)")
+    argParser.add_argument("--zipf-exponent", type = float, default = ZIPF_EXPONENT, help = "exponent of the Zipfian word distribution (default: %(default)s)")
+    argParser.add_argument("--body-words", type = int, default = BODY_WORDS, help = "mean number of body words per page (default: %(default)s)")
+    argParser.add_argument("--infobox-fields", type = int, default = INFOBOX_FIELDS, help = "number of infobox fields per page (default: %(default)s)")
+    argParser.add_argument("--categories", type = int, default = CATEGORY_COUNT, help = "number of categories per page (default: %(default)s)")
+    argParser.add_argument("--references", type = int, default = REFERENCE_COUNT, help = "number of inline references per page (default: %(default)s)")
+    argParser.add_argument("--external-links", type = int, default = EXTERNAL_LINK_COUNT, help = "number of external links per page (default: %(default)s)")
+    argParser.add_argument("--seed", type = int, default = SEED, help = "random seed (default: %(default)s)")
+    args = argParser.parse_args()
+
+    dumpGenerator = DumpGenerator(args.seed, args.vocabulary_size, args.zipf_exponent, args.body_words, args.infobox_fields, args.categories, args.references, args.external_links)
+    with open(args.output_path, "w", encoding = "utf-8") as dump_fp:
+        dumpGenerator.write_dump(dump_fp, args.pages)
+    print("Wrote", args.pages, "pages to", args.output_path)
@@ -0,0 +1,160 @@
+import re
+import time
+
+from preprocessor import Preprocessor
+
+# Characters that make nltk's word_tokenize split a word, among those left once _filter_content has run.
+# Text without any of them is tokenized by splitting on whitespace.
+TOKEN_SPLIT_CHARS_PATTERN = re.compile("[«“‘„`:@$&‒-―<>»”’]")
+
+# The rules of nltk's word tokenizer that can still match filtered text, in the order it applies them.
+TOKEN_SPLIT_RULES = [
+    (re.compile("([«“‘„]|[`]+)"), r" \1 "),
+    (re.compile(r"(``)"), r" \1 "),
+    (re.compile(r"([:,])([^\d])"), r" \1 \2"),
+    (re.compile(r"([:,])$"), r" \1 "),
+    (re.compile(r"[;@#$%&]"), r" \g<0> "),
+    (re.compile(r"[‒-―]"), r" \g<0> "),
+    (re.compile(r"[\]\[\(\)\{\}\<\>]"), r" \g<0> "),
+    (re.compile("([»”’])"), r" \1 ")
+]
+
+# The contractions nltk's word tokenizer splits that don't need an apostrophe, which _filter_content removes.
+CONTRACTIONS_PATTERN = re.compile(r"(?i)cannot|gimme|gonna|gotta|lemme|wanna")
+CONTRACTION_RULES = [
+    re.compile(r"(?i)\b(can)(not)\b"),
+    re.compile(r"(?i)\b(gim)(me)\b"),
+    re.compile(r"(?i)\b(gon)(na)\b"),
+    re.compile(r"(?i)\b(got)(ta)\b"),
+    re.compile(r"(?i)\b(lem)(me)\b"),
+    re.compile(r"(?i)\b(wan)(na)(?=\s)")
+]
+
+
+class FastPreprocessor(Preprocessor):
+    def __init__(self, MAX_WORD_CAP, STEM_CACHE_SIZE = 200000):
+        # Constructor to initialize a FastPreprocessor, which returns the same tokens as Preprocessor in fewer passes.
+
+        super().__init__(MAX_WORD_CAP, STEM_CACHE_SIZE)
+
+        # Compile every pattern once, instead of on each call
+        self.tagRegex = re.compile("<.*?>")
+        self.urlRegex = re.compile(self.wiki_pattern["url"])
+        self.wwwRegex = re.compile(self.wiki_pattern["www"])
+        self.categoryRegex = re.compile(self.wiki_pattern["category"], flags = re.IGNORECASE)
+        self.externalLinksRegex = re.compile(self.externalLinksPattern, flags = re.IGNORECASE)
+        self.referencesRegex = re.compile(self.referencesPattern, flags = re.DOTALL | re.MULTILINE | re.IGNORECASE)
+        self.removeSymbolsRegex = re.compile(self.removeSymbolsPattern)
+        self.nonLettersRegex = re.compile("[^a-zA-Z ]")
+        self.curlyBracesRegex = re.compile(self.wiki_pattern["curly_braces"])
+        self.squareBracesRegex = re.compile(self.wiki_pattern["square_braces"])
+        self.bracesRegex = re.compile("[{}]")
+        self.footerRegexes = [re.compile("== %s ==" % (label), flags = re.IGNORECASE) for label in self.footer_labels]
+
+        # Map every filter character to a space in a single translate table
+        self.filterTable = str.maketrans({f: ' ' for f in self.filters})
+
+    def _remove_all_tags(self, text):
+        # Remove all HTML tags from the input text
+        return self.tagRegex.sub('', text)
+
+    def _remove_all_urls(self, text):
+        # Remove URLs and website links from the input text
+        text = self.urlRegex.sub(' ', text)
+        return self.wwwRegex.sub(' ', text)
+
+    def _filter_content(self, text):
+        # Replace filter characters with spaces and collapse whitespace, in one translate and one split
+        return ' '.join(text.translate(self.filterTable).split())
+
+    def _strip_footers(self, text):
+        # Remove certain footer labels (e.g., references, further reading) from the text
+        for footerRegex in self.footerRegexes:
+            found = footerRegex.search(text)
+            if found is not None:
+                text = text[0:found.start()-1]
+        return text
+
+    def _find_infobox_end(self, text, start_idx):
+        # Find where the infobox ends like Preprocessor does, jumping from brace to brace instead of walking every character
+        end_idx = len(text)
+        bracket_cnt = 2
+
+        for brace in self.bracesRegex.finditer(text, start_idx):
+            idx = brace.start()
+            if(text[idx] == '{'):
+                bracket_cnt += 1
+            else:
+                bracket_cnt -= 1
+            # The infobox ends at the first other character read while the braces are balanced.
+            if(bracket_cnt == 0 and idx + 1 < end_idx and text[idx + 1] not in "{}"):
+                return idx + 1
+
+        # Otherwise the scan reaches the end of the text.
+        return max(end_idx - 1, start_idx)
+
+    def _extract_category_content(self, text):
+        # Extract and clean category content from the text
+        category_content = ' '.join(self.categoryRegex.findall(text))
+        category_content = self._remove_all_urls(category_content)
+        category_content = self._filter_content(category_content)
+        category_content = self._remove_all_tags(category_content)
+        text = self.categoryRegex.sub(' ', text)
+        return text, category_content
+
+    def _extract_external_links_content(self, text):
+        # Extract and clean external links content from the text
+        external_links_content = ' '.join(self.externalLinksRegex.findall(text))
+        external_links_content = external_links_content[20:]
+        external_links_content = self.nonLettersRegex.sub(' ', external_links_content)
+        text = self.externalLinksRegex.sub(' ', text)
+        return text, external_links_content
+
+    def _extract_references_content(self, text):
+        # Extract and clean references content from the text
+        references_content = ' '.join(self.referencesRegex.findall(text))
+        references_content = self.removeSymbolsRegex.sub(' ', references_content)
+        text = self.referencesRegex.sub(' ', text)
+        return text, references_content
+
+    def _extract_body_content(self, text):
+        # Extract and clean the main body content from the text
+        body_content = self.curlyBracesRegex.sub(' ', text)
+        body_content = self.squareBracesRegex.sub(' ', body_content)
+        body_content = self._remove_all_tags(body_content)
+        body_content = self._remove_all_urls(body_content)
+        body_content = self._strip_footers(body_content)
+        return body_content
+
+    def _tokenize(self, text):
+        # Tokenize filtered text like nltk's word_tokenize, splitting on whitespace unless one of its rules can match
+        if TOKEN_SPLIT_CHARS_PATTERN.search(text) is not None:
+            for regex, substitution in TOKEN_SPLIT_RULES:
+                text = regex.sub(substitution, text)
+        if CONTRACTIONS_PATTERN.search(text) is not None:
+            text = " " + text + " "
+            for regex in CONTRACTION_RULES:
+                text = regex.sub(r" \1 \2 ", text)
+        return text.split()
+
+    def process(self, text):
+        # Preprocess and tokenize the input text
+
+        # Remove filter characters, convert to lowercase, and tokenize
+        start_time = time.perf_counter()
+        text = self._filter_content(text).lower()
+        tokenized_text = self._tokenize(text)
+        tokenize_end_time = time.perf_counter()
+        self.TokenizeTime += tokenize_end_time - start_time
+
+        # Update the word count statistic
+        self.TotalWordsEncountered += len(tokenized_text)
+
+        # Remove stopwords and words longer than MAX_WORD_CAP, and stem the rest with the Porter Stemmer
+        stemmed_text = [self._stem(word) for word in tokenized_text if len(word) < self.MAX_WORD_CAP and word not in self.stopwords]
+        self.StemTime += time.perf_counter() - tokenize_end_time
+        return stemmed_text
+
+
+# Preprocessing backends, selectable by name.
+PREPROCESSORS = {"nltk": Preprocessor, "fast": FastPreprocessor}
@@ -0,0 +1,86 @@
+# Libraries
+import os
+import sys
+
+import postingCodec
+from invertedIndexHandler import TERM_DICTIONARY_FILE_NAME
+from secondaryIndexHandler import SecondaryIndexHandler
+from titleHandler import TitleHandler
+
+# Global Variables
+INDEX_FOLDER_PATH = "indexFolder"
+TITLE_FILE_CAP = 20000
+TEXT_INDEX_FILE_EXTENSION = ".txt"
+
+
+def get_text_files(file_name_prefix):
+    # List the numbered text files ("<prefix>N.txt") of the index folder in numeric order.
+    text_files = []
+    for file in os.listdir(INDEX_FOLDER_PATH):
+        if(file.startswith(file_name_prefix) and file.endswith(TEXT_INDEX_FILE_EXTENSION)):
+            file_idx = file[len(file_name_prefix): -len(TEXT_INDEX_FILE_EXTENSION)]
+            if(file_idx.isdigit()):
+                text_files.append((int(file_idx), file))
+    text_files.sort()
+    return text_files
+
+def convert_index_file(index_file_idx, text_index_file_name, dictionary_fp):
+    # Convert one text index file ("word=idf=doc_count=word_freq=posting_list" lines) into a binary index file.
+    binary_index_file_name = "index_" + str(index_file_idx) + postingCodec.INDEX_FILE_EXTENSION
+    with open(os.path.join(INDEX_FOLDER_PATH, text_index_file_name), "r", encoding='utf-8') as text_fp, \
+         open(os.path.join(INDEX_FOLDER_PATH, binary_index_file_name), "wb") as binary_fp:
+        postingCodec.write_index_file_header(binary_fp)
+        offset = len(postingCodec.INDEX_FILE_HEADER)
+        for line in text_fp:
+            line = line.strip("\n")
+            if(line == ""):
+                continue
+            word, idf, doc_count, word_freq, posting_list = line.split("=")
+            postings = postingCodec.parse_text_posting_list(posting_list)
+            blocks, block_count, max_field_counts = postingCodec.encode_posting_list(postings)
+            # The word's field term records share its IDF, and the term dictionary doesn't locate them.
+            field_records = postingCodec.encode_field_records(postings, float(idf))
+            record = postingCodec.encode_term_record(word, float(idf), int(doc_count), int(word_freq), max_field_counts, blocks, block_count, field_records)
+            binary_fp.write(record)
+            dictionary_fp.write(word + "=" + str(index_file_idx) + "=" + str(offset) + "=" + str(len(postingCodec.get_word_record(record))) + "\n")
+            offset += len(record)
+
+def convert_title_files(title_files):
+    # Pack the text title files (one title per line) into the title store.
+    titleHandler = TitleHandler(INDEX_FOLDER_PATH, TITLE_FILE_CAP)
+    for title_file_idx, title_file_name in title_files:
+        with open(os.path.join(INDEX_FOLDER_PATH, title_file_name), "r", encoding='utf-8') as title_fp:
+            for line in title_fp:
+                titleHandler.add_title(line.strip("\n"))
+    titleHandler.add_title(title = None, isLast = True)
+
+
+if __name__ == "__main__":
+    if(len(sys.argv) != 2):
+        print("Invalid number of arguments")
+        print("Expected 1 argument: <path_to_index_folder>")
+        exit(1)
+
+    INDEX_FOLDER_PATH = os.path.abspath(sys.argv[1])
+
+    text_index_files = get_text_files("index_")
+    title_files = get_text_files("title_")
+    if(len(text_index_files) == 0):
+        print("No text index files found in '" + INDEX_FOLDER_PATH + "'")
+        exit(1)
+
+    # Convert every text index file and write a fresh term dictionary.
+    with open(os.path.join(INDEX_FOLDER_PATH, TERM_DICTIONARY_FILE_NAME), "w", encoding='utf-8') as dictionary_fp:
+        for index_file_idx, text_index_file_name in text_index_files:
+            convert_index_file(index_file_idx, text_index_file_name, dictionary_fp)
+            print("Converted", text_index_file_name)
+
+    # Pack the titles into the title store.
+    convert_title_files(title_files)
+    print("Converted", len(title_files), "title files")
+
+    # Rebuild the secondary index over the binary index files, then drop the text ones.
+    secondaryIndexHandler = SecondaryIndexHandler(INDEX_FOLDER_PATH)
+    secondaryIndexHandler.build_secondary_index()
+    for file_idx, text_file_name in text_index_files + title_files:
+        os.remove(os.path.join(INDEX_FOLDER_PATH, text_file_name))
@@ -1,208 +1,514 @@
 import os
+import sys
 import math
+import time
 import heapq
-from collections import defaultdict
+from bisect import bisect_left
+from array import array
+from multiprocessing import Pool
+
+import postingCodec
+
+# Fields in posting order.
+FIELDS = ["title", "infobox", "body", "category", "link", "reference"]
+
+# Maps every word to the index file, byte offset and byte length of its term record.
+TERM_DICTIONARY_FILE_NAME = "term_dictionary.txt"
+
+# Memory held by a term of the temporary index besides its postings: its word is counted separately,
+# this covers its two empty posting arrays, its slots in the per-term lists and arrays and its term_ids entry.
+TERM_MEMORY_OVERHEAD = 2 * sys.getsizeof(array('I')) + 3 * 8 + 8 + 48
+
+# Every TEMP_INDEX_SAMPLE_RATE-th word of a temporary index file is sampled with its byte offset,
+# to seek the file to a word and to pick the merge partition boundaries.
+TEMP_INDEX_SAMPLE_RATE = 64
+
+# Buffer size of the temporary and final index files, which are written and read sequentially.
+INDEX_FILE_BUFFER_SIZE = 1 << 20
+
+
+def count_words(wiki_data):
+    # Count the occurrences of every word in each field of a processed document.
+    # Returns a dict of word -> [title, infobox, body, category, link, reference] counts.
+    word_counts = {}
+    for field_idx, field in enumerate(FIELDS):
+        for word in wiki_data[field]:
+            if word not in word_counts:
+                word_counts[word] = [0, 0, 0, 0, 0, 0]
+            word_counts[word][field_idx] += 1
+    return word_counts
+
+def get_temp_index_file_name(idx):
+    # Name of the temporary index file with the given index.
+    return "temp_index_" + str(idx) + ".bin"
+
+def get_temp_index_sample_file_name(idx):
+    # Name of the file holding the sampled words and byte offsets of a temporary index file.
+    return "temp_index_" + str(idx) + ".idx"
+
+def get_partition_file_prefix(partition_idx):
+    # Prefix of the index files written by a merge partition, before they're renumbered.
+    return "temp_index_part_" + str(partition_idx) + "_"
+
+def read_temp_index_samples(INDEX_FOLDER_PATH, idx):
+    # Read the sampled (word, byte offset) pairs of a temporary index file, in word order.
+    samples = []
+    with open(os.path.join(INDEX_FOLDER_PATH, get_temp_index_sample_file_name(idx)), "r", encoding='utf-8') as sample_fp:
+        for line in sample_fp:
+            word, offset = line.rstrip("\n").rsplit("=", 1)
+            samples.append((word, int(offset)))
+    return samples
+
+def find_word_offset(temp_index_fp, samples, word):
+    # Byte offset of the first run record of a temporary index file whose word isn't less than word.
+    # Starts from the last sampled word before word, and reads the records after it.
+    sample_idx = bisect_left(samples, (word, -1))
+    offset = samples[sample_idx - 1][1] if sample_idx > 0 else 0
+    temp_index_fp.seek(offset)
+    while(True):
+        record = postingCodec.read_run_record(temp_index_fp)
+        if(record is None or postingCodec.decode_run_word(record) >= word):
+            return offset
+        offset += postingCodec.RUN_RECORD_LENGTH_STRUCT.size + len(record)
+
+def merge_partition(INDEX_FOLDER_PATH, FINAL_INDEX_FILE_CAP, temp_index_file_count, total_doc_count, partition_idx, low_word, high_word):
+    # Merge the words from low_word (inclusive) to high_word (exclusive) of the temporary index files in a worker process.
+    # The partition writes its own index files and term dictionary, named with its partition prefix.
+    # Returns the partition's index file count, unique word count, word count, temporary index bytes read and index bytes written.
+    invertedIndexHandler = InvertedIndexHandler(INDEX_FOLDER_PATH, 0, FINAL_INDEX_FILE_CAP)
+    invertedIndexHandler.total_doc_count = total_doc_count
+    invertedIndexHandler.final_index_file_prefix = get_partition_file_prefix(partition_idx)
+    invertedIndexHandler.term_dictionary_file_name = get_partition_file_prefix(partition_idx) + TERM_DICTIONARY_FILE_NAME
+
+    temp_index_fp_list = []
+    for idx in range(temp_index_file_count):
+        temp_index_path = os.path.join(INDEX_FOLDER_PATH, get_temp_index_file_name(idx))
+        temp_index_fp = open(temp_index_path, "rb", buffering = INDEX_FILE_BUFFER_SIZE)
+        if(low_word is not None):
+            temp_index_fp.seek(find_word_offset(temp_index_fp, read_temp_index_samples(INDEX_FOLDER_PATH, idx), low_word))
+        temp_index_fp_list.append(temp_index_fp)
+
+    invertedIndexHandler._merge_temp_index_files(temp_index_fp_list, high_word)
+    return invertedIndexHandler.final_index_file_count, invertedIndexHandler.total_unique_words, invertedIndexHandler.total_words, invertedIndexHandler.merge_bytes_read, invertedIndexHandler.merge_bytes_written
+
 
 class InvertedIndexHandler:
-    def __init__(self, INDEX_FOLDER_PATH, INVERTED_INDEX_TEMP_FILE_CAP, FINAL_INDEX_FILE_CAP):
+    def __init__(self, INDEX_FOLDER_PATH, INVERTED_INDEX_MEMORY_BUDGET, FINAL_INDEX_FILE_CAP):
         # Initialize the InvertedIndexHandler with folder paths and caps.
+        # The temporary index is written to a file once its memory use reaches INVERTED_INDEX_MEMORY_BUDGET bytes.
         self.INDEX_FOLDER_PATH = INDEX_FOLDER_PATH
-        self.INVERTED_INDEX_TEMP_FILE_CAP = INVERTED_INDEX_TEMP_FILE_CAP
+        self.INVERTED_INDEX_MEMORY_BUDGET = INVERTED_INDEX_MEMORY_BUDGET
         self.FINAL_INDEX_FILE_CAP = FINAL_INDEX_FILE_CAP
         
         # Initialize data structures for temporary and final inverted indexes.
-        self.inverted_index = {}
+        # Words of the temporary index are interned to integer term ids, which index its per-term arrays:
+        # the docIDs of its postings, and their field counts as a field bitmap followed by the non-zero counts.
+        self.term_ids = {}
+        self.terms = []
+        self.total_counts = array('Q')
+        self.doc_id_lists = []
+        self.field_count_lists = []
         self.inverted_index_size = 0
         self.temp_index_file_count = 0
+
+        # Called after each temporary index file is written while documents are still being added,
+        # and every 1000 words merged by a merge showing its progress.
+        self.on_temp_index_dumped = None
+        self.on_merge_progress = None
         
-        self.final_inverted_index = {}
-        self.final_inverted_index_size = 0
+        # The final index file being written by the merge, its size so far, and the term dictionary.
+        self.final_index_fp = None
+        self.final_index_file_size = 0
+        self.dictionary_fp = None
+        # The word whose term record is written once its field run records, which follow it, have been nested into it.
+        self.pending_word = None
+        self.pending_run_records = None
+        self.pending_field_records = None
         self.final_index_file_count = 0
+        self.final_index_file_prefix = "index_"
+        self.term_dictionary_file_name = TERM_DICTIONARY_FILE_NAME
 
         # Initialize counters for document statistics.
         self.total_doc_count = 0
         self.total_unique_words = 0
         self.total_words = 0
+        self.max_term_count = 0
+        self.max_term_table_size = 0
+        self.max_inverted_index_memory = 0
+        self.merge_bytes_read = 0
+        self.merge_bytes_written = 0
+        self.merge_time = 0.0
+
+        # Seconds spent adding postings to the temporary index and writing temporary index files, and the bytes written to them.
+        self.invert_time = 0.0
+        self.spill_time = 0.0
+        self.spill_bytes_written = 0
 
     def _dump_inverted_index_to_temp_index_file(self):
-        # Write the current temporary inverted index to a file.
-        temp_index_file_name = "temp_index_" + str(self.temp_index_file_count) + ".txt"
-        with open(os.path.join(self.INDEX_FOLDER_PATH, temp_index_file_name), "w", encoding='utf-8') as temp_index_fp:
-            for word in sorted(self.inverted_index):
-                doc_count = self.inverted_index[word]["doc_count"]
-                total_count = self.inverted_index[word]["total_count"]
-                posting_list = '|'.join(self.inverted_index[word]["posting_list"])
-                temp_index_fp.write(word + "=" + str(doc_count) + "=" + str(total_count) + "=" + posting_list + "\n")
-        
+        # Write the current temporary inverted index to a file of run records in word order, encoding each
+        # posting list in blocks, and sample its words to the temporary index's sample file.
+        # Each word's run record is followed by the run records of its fields, under their field keys.
+        start_time = time.perf_counter()
+        temp_index_path = os.path.join(self.INDEX_FOLDER_PATH, get_temp_index_file_name(self.temp_index_file_count))
+        sample_path = os.path.join(self.INDEX_FOLDER_PATH, get_temp_index_sample_file_name(self.temp_index_file_count))
+        with open(temp_index_path, "wb", buffering = INDEX_FILE_BUFFER_SIZE) as temp_index_fp, open(sample_path, "w", encoding='utf-8') as sample_fp:
+            offset = 0
+            for rank, term_id in enumerate(sorted(range(len(self.terms)), key = self.terms.__getitem__)):
+                postings = self._get_postings(term_id)
+                blocks, block_count, max_field_counts = postingCodec.encode_posting_list(postings)
+                record = postingCodec.encode_run_record(self.terms[term_id], len(self.doc_id_lists[term_id]), self.total_counts[term_id], max_field_counts, blocks, block_count)
+                if(rank % TEMP_INDEX_SAMPLE_RATE == 0):
+                    sample_fp.write(self.terms[term_id] + "=" + str(offset) + "\n")
+                temp_index_fp.write(record)
+                offset += len(record)
+
+                for field, field_postings in postingCodec.split_field_postings(postings):
+                    blocks, block_count, max_field_counts = postingCodec.encode_posting_list(field_postings)
+                    record = postingCodec.encode_run_record(postingCodec.get_field_key(self.terms[term_id], field), len(field_postings), sum(posting[1][field] for posting in field_postings), max_field_counts, blocks, block_count)
+                    temp_index_fp.write(record)
+                    offset += len(record)
+
+        # Record the size of the term table and of the whole temporary index for statistics.
+        self.spill_bytes_written += offset
+        self.spill_time += time.perf_counter() - start_time
+        self.max_term_count = max(self.max_term_count, len(self.terms))
+        self.max_term_table_size = max(self.max_term_table_size, self._get_term_table_size())
+        self.max_inverted_index_memory = max(self.max_inverted_index_memory, self._get_inverted_index_memory())
+
         # Reset the temporary inverted index.
         self.temp_index_file_count += 1
-        self.inverted_index = {}
+        self.term_ids = {}
+        self.terms = []
+        self.total_counts = array('Q')
+        self.doc_id_lists = []
+        self.field_count_lists = []
         self.inverted_index_size = 0
+
+    def _get_postings(self, term_id):
+        # The (docID, field counts) postings of a term of the temporary index.
+        field_counts = self.field_count_lists[term_id]
+        postings = []
+        pos = 0
+        for docID in self.doc_id_lists[term_id]:
+            fields = [0, 0, 0, 0, 0, 0]
+            bitmap = field_counts[pos]
+            pos += 1
+            for field_idx in postingCodec.BITMAP_FIELDS[bitmap]:
+                fields[field_idx] = field_counts[pos]
+                pos += 1
+            postings.append((docID, fields))
+        return postings
+
+    def restore_temp_indexes(self, temp_index_file_count, total_doc_count, max_term_count, max_term_table_size, max_inverted_index_memory):
+        # Carry on from the first temp_index_file_count temporary index files, which hold the first total_doc_count documents.
+        # Temporary index files written after them, and the files of an interrupted merge, are deleted.
+        for file in os.listdir(self.INDEX_FOLDER_PATH):
+            if(file.startswith("temp_index_part_")):
+                os.remove(os.path.join(self.INDEX_FOLDER_PATH, file))
+        idx = temp_index_file_count
+        while(os.path.isfile(os.path.join(self.INDEX_FOLDER_PATH, get_temp_index_file_name(idx)))):
+            os.remove(os.path.join(self.INDEX_FOLDER_PATH, get_temp_index_file_name(idx)))
+            if(os.path.isfile(os.path.join(self.INDEX_FOLDER_PATH, get_temp_index_sample_file_name(idx)))):
+                os.remove(os.path.join(self.INDEX_FOLDER_PATH, get_temp_index_sample_file_name(idx)))
+            idx += 1
+
+        self.temp_index_file_count = temp_index_file_count
+        self.total_doc_count = total_doc_count
+        self.max_term_count = max_term_count
+        self.max_term_table_size = max_term_table_size
+        self.max_inverted_index_memory = max_inverted_index_memory
+
+    def _get_term_table_size(self):
+        # Memory used in bytes by the term table: the word to term id dict, and the interned words.
+        return sys.getsizeof(self.term_ids) + sys.getsizeof(self.terms) + sum(sys.getsizeof(word) for word in self.terms)
+
+    def _get_inverted_index_memory(self):
+        # Memory used in bytes by the temporary index: the term table, and the per-term arrays and the lists holding them.
+        posting_memory = sum(sys.getsizeof(doc_ids) for doc_ids in self.doc_id_lists) + sum(sys.getsizeof(field_counts) for field_counts in self.field_count_lists)
+        return self._get_term_table_size() + sys.getsizeof(self.total_counts) + sys.getsizeof(self.doc_id_lists) + sys.getsizeof(self.field_count_lists) + posting_memory
     
     def add_inverted_index(self, docID, wiki_data, isLast = False):
         # Add document data to the inverted index.
 
+        word_counts = None
+        if(isLast == False):
+            start_time = time.perf_counter()
+            word_counts = count_words(wiki_data)
+            self.invert_time += time.perf_counter() - start_time
+        self.add_word_counts(docID, word_counts, isLast)
+
+    def add_word_counts(self, docID, word_counts, isLast = False):
+        # Add the per-field word counts of a document (see count_words) to the inverted index.
+
         if(isLast == False):
             # Update document count for statistics.
+            start_time = time.perf_counter()
             self.total_doc_count = docID + 1
 
-            # Separate document data into different sections.
-            title = wiki_data['title']
-            infobox = wiki_data['infobox']
-            body = wiki_data['body']
-            category = wiki_data['category']
-            link = wiki_data['link']
-            reference = wiki_data['reference']
-
-            # Initialize dictionaries to count word occurrences.
-            combined_dict = defaultdict(int)
-            title_dict = defaultdict(int)
-            infobox_dict = defaultdict(int)
-            body_dict = defaultdict(int)
-            category_dict = defaultdict(int)
-            link_dict = defaultdict(int)
-            reference_dict = defaultdict(int)
-
-            # Count word occurrences in each section.
-            for word in title:
-                title_dict[word] += 1
-                combined_dict[word] += 1
-
-            for word in infobox:
-                infobox_dict[word] += 1
-                combined_dict[word] += 1
-
-            for word in body:
-                body_dict[word] += 1
-                combined_dict[word] += 1
-
-            for word in category:
-                category_dict[word] += 1
-                combined_dict[word] += 1
-
-            for word in link:
-                link_dict[word] += 1
-                combined_dict[word] += 1
-
-            for word in reference:
-                reference_dict[word] += 1
-                combined_dict[word] += 1
-
-            # Create an index string for each word and update the inverted index.
-            for word, word_count_in_doc in combined_dict.items():
-                index_string = str(docID) + " "
-                if(title_dict[word] > 0):
-                    index_string += "t" + str(title_dict[word]) + "-"
-                if(infobox_dict[word] > 0):
-                    index_string += "i" + str(infobox_dict[word]) + "-"
-                if(body_dict[word] > 0):
-                    index_string += "b" + str(body_dict[word]) + "-"
-                if(category_dict[word] > 0):
-                    index_string += "c" + str(category_dict[word]) + "-"
-                if(link_dict[word] > 0):
-                    index_string += "l" + str(link_dict[word]) + "-"
-                if(reference_dict[word] > 0):
-                    index_string += "r" + str(reference_dict[word]) + "-"
-                index_string = index_string[:-1]
-
-                if word not in self.inverted_index:
-                    self.inverted_index[word] = {"doc_count":0, "total_count": 0, "posting_list": []}
-                self.inverted_index[word]["doc_count"] += 1
-                self.inverted_index[word]["total_count"] += word_count_in_doc
-                self.inverted_index[word]["posting_list"].append(index_string)
-                self.inverted_index_size += len(index_string)
-
-        if(isLast == True or self.inverted_index_size >= self.INVERTED_INDEX_TEMP_FILE_CAP):
+            # Append a posting to the arrays of each word, accounting for the memory it takes.
+            for word, field_counts in word_counts.items():
+                term_id = self.term_ids.get(word)
+                if term_id is None:
+                    term_id = len(self.terms)
+                    self.term_ids[word] = term_id
+                    self.terms.append(word)
+                    self.total_counts.append(0)
+                    self.doc_id_lists.append(array('I'))
+                    self.field_count_lists.append(array('I'))
+                    self.inverted_index_size += sys.getsizeof(word) + TERM_MEMORY_OVERHEAD
+
+                bitmap = 0
+                posting = [0]
+                for field_idx, field_count in enumerate(field_counts):
+                    if(field_count > 0):
+                        bitmap |= 1 << field_idx
+                        posting.append(field_count)
+                posting[0] = bitmap
+                self.doc_id_lists[term_id].append(docID)
+                self.field_count_lists[term_id].extend(posting)
+                self.total_counts[term_id] += sum(field_counts)
+
+                # Arrays grow by up to 1/16 of their length on top of the 4 bytes of every item.
+                posting_size = 4 * (len(posting) + 1)
+                self.inverted_index_size += posting_size + (posting_size >> 4)
+            self.invert_time += time.perf_counter() - start_time
+
+        if(isLast == True or self.inverted_index_size >= self.INVERTED_INDEX_MEMORY_BUDGET):
             # If the temporary index is full or it's the last document, dump it to a file.
             self._dump_inverted_index_to_temp_index_file()
+            if(isLast == False and self.on_temp_index_dumped is not None):
+                self.on_temp_index_dumped()
 
 
-    def _dump_final_inverted_index_to_file(self):
-        # Write the final inverted index to a file.
-        final_index_file_name = "index_" + str(self.final_index_file_count) + ".txt"
-        with open(os.path.join(self.INDEX_FOLDER_PATH, final_index_file_name), "w", encoding='utf-8') as final_index_fp:
-            for word in sorted(self.final_inverted_index):
-                final_index_fp.write(self.final_inverted_index[word] + "\n")
-        
-        # Reset the final inverted index.
+    def _open_final_index_file(self):
+        # Start the next binary index file.
+        final_index_file_name = self.final_index_file_prefix + str(self.final_index_file_count) + postingCodec.INDEX_FILE_EXTENSION
+        self.final_index_fp = open(os.path.join(self.INDEX_FOLDER_PATH, final_index_file_name), "wb", buffering = INDEX_FILE_BUFFER_SIZE)
+        postingCodec.write_index_file_header(self.final_index_fp)
+        self.final_index_file_size = len(postingCodec.INDEX_FILE_HEADER)
+
+    def _close_final_index_file(self):
+        # Finish the binary index file being written.
+        self.final_index_fp.close()
+        self.final_index_fp = None
         self.final_index_file_count += 1
-        self.final_inverted_index = {}
-        self.final_inverted_index_size = 0
 
     def _get_IDF(self, doc_count):
         # Calculate and return the Inverse Document Frequency (IDF) for a word.
         return math.log10(self.total_doc_count / doc_count)
 
-    def _add_final_inverted_index(self, word, doc_count, word_freq, posting_list, isLast = False):
-        # Add word and its associated data to the final inverted index.
+    def _add_final_inverted_index(self, word, run_records, isLast = False):
+        # Add a word's term record to the final index file, and its byte location to the term dictionary.
+        # run_records holds the word's decoded run record from each temporary index file, in docID order.
+        # The field run records following a word are nested into its term record as field term records,
+        # so the term record is written when the next word arrives.
 
         if(isLast == False):
-            idf = self._get_IDF(doc_count)
-            self.final_inverted_index[word] = word + "=" + str(idf) + "=" + str(doc_count) + "=" + str(word_freq) + "=" + posting_list
-            self.final_inverted_index_size += len(self.final_inverted_index[word])
-            self.total_unique_words += 1
-            self.total_words += word_freq
+            if(postingCodec.is_field_key(word)):
+                # A word whose postings were all dropped has no field postings either.
+                field_word, field = postingCodec.split_field_key(word)
+                if(field_word == self.pending_word):
+                    self.pending_field_records[field] = self._encode_field_term_record(self._get_IDF(sum(run_record[1] for run_record in self.pending_run_records)), run_records)
+                return
+            self._write_pending_term_record()
+            self.pending_word = word
+            self.pending_run_records = run_records
+            self.pending_field_records = [b""] * postingCodec.FIELD_COUNT
+            return
 
-        if(isLast == True or self.final_inverted_index_size >= self.FINAL_INDEX_FILE_CAP):
-            # If the final index is full or it's the last index, dump it to a file.
-            self._dump_final_inverted_index_to_file()
+        self._write_pending_term_record()
+        # Close the final index file when it's the last word. An empty index writes a single empty file.
+        if(self.final_index_fp is None and self.final_index_file_count == 0):
+            self._open_final_index_file()
+        if(self.final_index_fp is not None):
+            self._close_final_index_file()
 
-    def merge_temp_indexes(self):
-        print("Primary Index Merging Started")
-        temp_index_fp_list = []
-        temp_inverted_idx = {}
-        
-        cur_word = ""
-        cur_doc_count = 0
-        cur_word_freq = 0
-        cur_posting_list = ""
+    def _get_run_record_stats(self, run_records):
+        # Sum the statistics of a word's run records: doc count, word frequency, maximum field counts, block count and blocks length.
+        doc_count = sum(run_record[1] for run_record in run_records)
+        word_freq = sum(run_record[2] for run_record in run_records)
+        # The maximum count of each field bounds the score of the word's postings at query time.
+        max_field_counts = [max(counts) for counts in zip(*[run_record[3] for run_record in run_records])]
+        block_count = sum(run_record[4] for run_record in run_records)
+        blocks_len = sum(len(run_record[5]) for run_record in run_records)
+        return doc_count, word_freq, max_field_counts, block_count, blocks_len
+
+    def _encode_field_term_record(self, IDF, run_records):
+        # Encode a field term record from the run records of a field key, sharing the IDF of its word.
+        doc_count, word_freq, max_field_counts, block_count, blocks_len = self._get_run_record_stats(run_records)
+        return postingCodec.encode_term_record("", IDF, doc_count, word_freq, max_field_counts, b"".join(run_record[5] for run_record in run_records), block_count)
+
+    def _write_pending_term_record(self):
+        # Write the pending word's term record: a header with the summed statistics of its run records,
+        # their blocks copied as they are, and its field term records.
+        if(self.pending_word is None):
+            return
+        doc_count, word_freq, max_field_counts, block_count, blocks_len = self._get_run_record_stats(self.pending_run_records)
+        field_record_lengths = [len(field_record) for field_record in self.pending_field_records]
+        header = postingCodec.encode_term_header(self.pending_word, self._get_IDF(doc_count), doc_count, word_freq, max_field_counts, block_count, blocks_len, field_record_lengths)
+        record_len = len(header) + blocks_len + sum(field_record_lengths)
+
+        if(self.final_index_fp is None):
+            self._open_final_index_file()
+        self.final_index_fp.write(header)
+        for run_record in self.pending_run_records:
+            self.final_index_fp.write(run_record[5])
+        for field_record in self.pending_field_records:
+            self.final_index_fp.write(field_record)
+        # The term dictionary only locates the header and blocks, which plain query terms read.
+        self.dictionary_fp.write(self.pending_word + "=" + str(self.final_index_file_count) + "=" + str(self.final_index_file_size) + "=" + str(len(header) + blocks_len) + "\n")
+        self.final_index_file_size += record_len
+        self.merge_bytes_written += record_len
+        self.total_unique_words += 1
+        self.total_words += word_freq
+        self.pending_word = None
+        self.pending_run_records = None
+        self.pending_field_records = None
+
+        # Close the final index file when it's full.
+        if(self.final_index_file_size >= self.FINAL_INDEX_FILE_CAP):
+            self._close_final_index_file()
+
+    def _iter_temp_index_records(self, temp_index_fp, high_word = None):
+        # Iterate over the decoded run records of a temporary index file from its current position up to high_word (exclusive).
+        with temp_index_fp:
+            while(True):
+                record = postingCodec.read_run_record(temp_index_fp)
+                if(record is None):
+                    return
+                self.merge_bytes_read += postingCodec.RUN_RECORD_LENGTH_STRUCT.size + len(record)
+                run_record = postingCodec.decode_run_record(record)
+                if(high_word is not None and run_record[0] >= high_word):
+                    return
+                yield run_record
+
+    def _merge_temp_index_files(self, temp_index_fp_list, high_word = None, show_progress = False):
+        # Heap merge the sorted temporary index files, read from their current positions up to high_word (exclusive),
+        # into the final index files and the term dictionary.
+        self.merge_run_records([self._iter_temp_index_records(temp_index_fp, high_word) for temp_index_fp in temp_index_fp_list], show_progress)
+
+    def merge_run_records(self, run_record_iterators, show_progress = False):
+        # Heap merge iterators over decoded run records in word order (see postingCodec.decode_run_record),
+        # given in docID order, into the final index files and the term dictionary.
+        run_records = {}
+
+        cur_word = None
+        cur_run_records = []
 
         min_heap = []
 
-        # Open temporary index files and initialize the min heap.
-        for idx in range(self.temp_index_file_count):
-            temp_index_file_name = "temp_index_" + str(idx) + ".txt"
-            temp_index_fp = open(os.path.join(self.INDEX_FOLDER_PATH, temp_index_file_name), "r", encoding='utf-8')
-            temp_index_fp_list.append(temp_index_fp)
-            line = temp_index_fp_list[idx].readline().strip("\n")
-            if(line != ""):
-                word, doc_count, word_freq, posting_list = line.split("=")
-                temp_inverted_idx[idx] = {"doc_count": int(doc_count), "total_count": int(word_freq), "posting_list": posting_list}
-                min_heap.append((word, idx))
-            else :
-                temp_index_fp_list[idx].close()
-
-        heapq.heapify(min_heap)
+        def read_next_record(idx):
+            # Push the next word of a run record iterator on the heap.
+            run_record = next(run_record_iterators[idx], None)
+            if(run_record is not None):
+                run_records[idx] = run_record
+                heapq.heappush(min_heap, (run_record[0], idx))
+
+        self.dictionary_fp = open(os.path.join(self.INDEX_FOLDER_PATH, self.term_dictionary_file_name), "a", encoding='utf-8')
+
+        # Initialize the min heap with the first word of each iterator.
+        for idx in range(len(run_record_iterators)):
+            read_next_record(idx)
 
         while(len(min_heap) > 0) :
             word, idx = heapq.heappop(min_heap)
             if(word == cur_word):
-                cur_doc_count += temp_inverted_idx[idx]["doc_count"]
-                cur_word_freq += temp_inverted_idx[idx]["total_count"]
-                cur_posting_list += "|" + temp_inverted_idx[idx]["posting_list"]
+                cur_run_records.append(run_records[idx])
             else:
-                if(cur_word != ""):
+                if(cur_word is not None):
                     # Add the current word's data to the final inverted index.
-                    self._add_final_inverted_index(cur_word, cur_doc_count, cur_word_freq, cur_posting_list)
-                    if(self.total_unique_words % 1000 == 0):
+                    self._add_final_inverted_index(cur_word, cur_run_records)
+                    if(show_progress and self.total_unique_words % 1000 == 0):
                         print("Words Processed :", self.total_unique_words, end = "\r")
+                        if(self.on_merge_progress is not None):
+                            self.on_merge_progress()
                 cur_word = word
-                cur_doc_count = temp_inverted_idx[idx]["doc_count"]
-                cur_word_freq = temp_inverted_idx[idx]["total_count"]
-                cur_posting_list = temp_inverted_idx[idx]["posting_list"]
-
-            line = temp_index_fp_list[idx].readline().strip("\n")
-            if(line != ""):
-                word, doc_count, word_freq, posting_list = line.split("=")
-                temp_inverted_idx[idx] = {"doc_count": int(doc_count), "total_count": int(word_freq), "posting_list": posting_list}
-                heapq.heappush(min_heap, (word, idx))
-            else :
-                temp_index_fp_list[idx].close()
+                cur_run_records = [run_records[idx]]
+
+            read_next_record(idx)
         
         # Add the final word's data to the final inverted index.
-        self._add_final_inverted_index(cur_word, cur_doc_count, cur_word_freq, cur_posting_list)
-        print("Words Processed :", self.total_unique_words)
+        if(cur_word is not None):
+            self._add_final_inverted_index(cur_word, cur_run_records)
         
         # Mark the end of the final index.
-        self._add_final_inverted_index(word = None, doc_count = None, word_freq = None, posting_list = None, isLast = True)
+        self._add_final_inverted_index(word = None, run_records = None, isLast = True)
+        self.dictionary_fp.close()
+        self.dictionary_fp = None
+
+    def _get_partition_boundaries(self, partition_count):
+        # Pick the words splitting the temporary index files into partition_count term ranges of similar size.
+        # The sampled words of each file weigh the bytes up to the next sample.
+        samples = []
+        for idx in range(self.temp_index_file_count):
+            file_size = os.path.getsize(os.path.join(self.INDEX_FOLDER_PATH, get_temp_index_file_name(idx)))
+            temp_index_samples = read_temp_index_samples(self.INDEX_FOLDER_PATH, idx)
+            for sample_idx, (word, offset) in enumerate(temp_index_samples):
+                next_offset = temp_index_samples[sample_idx + 1][1] if sample_idx + 1 < len(temp_index_samples) else file_size
+                samples.append((word, next_offset - offset))
+        samples.sort()
+
+        boundaries = []
+        total_weight = sum(weight for word, weight in samples)
+        cur_weight = 0
+        for word, weight in samples:
+            cur_weight += weight
+            if(cur_weight >= total_weight * (len(boundaries) + 1) / partition_count and len(boundaries) < partition_count - 1):
+                if(len(boundaries) == 0 or word > boundaries[-1]):
+                    boundaries.append(word)
+        return boundaries
+
+    def _renumber_partition_files(self, partition_file_counts):
+        # Rename the partitions' index files to consecutive index_N files, and concatenate their term dictionaries.
+        with open(os.path.join(self.INDEX_FOLDER_PATH, TERM_DICTIONARY_FILE_NAME), "w", encoding='utf-8') as dictionary_fp:
+            for partition_idx, partition_file_count in enumerate(partition_file_counts):
+                partition_file_prefix = get_partition_file_prefix(partition_idx)
+                for idx in range(partition_file_count):
+                    os.rename(os.path.join(self.INDEX_FOLDER_PATH, partition_file_prefix + str(idx) + postingCodec.INDEX_FILE_EXTENSION),
+                              os.path.join(self.INDEX_FOLDER_PATH, "index_" + str(self.final_index_file_count + idx) + postingCodec.INDEX_FILE_EXTENSION))
+
+                partition_dictionary_path = os.path.join(self.INDEX_FOLDER_PATH, partition_file_prefix + TERM_DICTIONARY_FILE_NAME)
+                with open(partition_dictionary_path, "r", encoding='utf-8') as partition_dictionary_fp:
+                    for line in partition_dictionary_fp:
+                        word, index_file_idx, offset, length = line.rstrip("\n").rsplit("=", 3)
+                        dictionary_fp.write(word + "=" + str(self.final_index_file_count + int(index_file_idx)) + "=" + offset + "=" + length + "\n")
+                os.remove(partition_dictionary_path)
+                self.final_index_file_count += partition_file_count
+
+    def merge_temp_indexes(self, MERGE_WORKER_COUNT = 1):
+        # Merge the temporary index files into the final index files and the term dictionary.
+        # With several workers, the words are split into term ranges merged in parallel, each into its own index files.
+        print("Primary Index Merging Started")
+        start_time = time.perf_counter()
+        term_dictionary_path = os.path.join(self.INDEX_FOLDER_PATH, TERM_DICTIONARY_FILE_NAME)
+        if(os.path.exists(term_dictionary_path)):
+            os.remove(term_dictionary_path)
+
+        boundaries = []
+        if(MERGE_WORKER_COUNT > 1):
+            boundaries = self._get_partition_boundaries(MERGE_WORKER_COUNT)
+
+        if(len(boundaries) == 0):
+            temp_index_fp_list = []
+            for idx in range(self.temp_index_file_count):
+                temp_index_fp_list.append(open(os.path.join(self.INDEX_FOLDER_PATH, get_temp_index_file_name(idx)), "rb", buffering = INDEX_FILE_BUFFER_SIZE))
+            self._merge_temp_index_files(temp_index_fp_list, show_progress = True)
+        else:
+            partitions = []
+            for partition_idx in range(len(boundaries) + 1):
+                low_word = boundaries[partition_idx - 1] if partition_idx > 0 else None
+                high_word = boundaries[partition_idx] if partition_idx < len(boundaries) else None
+                partitions.append((self.INDEX_FOLDER_PATH, self.FINAL_INDEX_FILE_CAP, self.temp_index_file_count, self.total_doc_count, partition_idx, low_word, high_word))
+            with Pool(min(MERGE_WORKER_COUNT, len(partitions))) as pool:
+                partition_results = pool.starmap(merge_partition, partitions)
+
+            for partition_file_count, unique_words, words, bytes_read, bytes_written in partition_results:
+                self.total_unique_words += unique_words
+                self.total_words += words
+                self.merge_bytes_read += bytes_read
+                self.merge_bytes_written += bytes_written
+            self._renumber_partition_files([partition_result[0] for partition_result in partition_results])
+
+        self.merge_time = time.perf_counter() - start_time
+        print("Words Processed :", self.total_unique_words)
         print("Primary Index Merging Completed")
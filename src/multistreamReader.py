@@ -0,0 +1,82 @@
+import os
+import bz2
+import multiprocessing
+from collections import deque
+
+# Size of the chunks a dump is decompressed in when it has no stream index.
+READ_CHUNK_SIZE = 1 << 20
+
+
+def decompress_stream(wiki_dump_path, start_offset, end_offset):
+    # Decompress the bz2 stream stored between two byte offsets of a dump, inside a worker process.
+    with open(wiki_dump_path, "rb") as wiki_dump_fp:
+        wiki_dump_fp.seek(start_offset)
+        return bz2.decompress(wiki_dump_fp.read(end_offset - start_offset))
+
+def read_stream_offsets(stream_index_path):
+    # Read the byte offsets of the bz2 streams listed in a multistream index ("offset:pageID:title" lines, bz2 compressed or not).
+    offsets = set()
+    open_index = bz2.open if stream_index_path.endswith(".bz2") else open
+    with open_index(stream_index_path, "rt", encoding='utf-8') as stream_index_fp:
+        for line in stream_index_fp:
+            if(line.strip() != ""):
+                offsets.add(int(line.split(":", 1)[0]))
+    return sorted(offsets)
+
+def get_stream_index_path(wiki_dump_path):
+    # Path of the stream index published next to a multistream dump, or None if there isn't one.
+    if(not wiki_dump_path.endswith("multistream.xml.bz2")):
+        return None
+    stream_index_path = wiki_dump_path[:-len("multistream.xml.bz2")] + "multistream-index.txt.bz2"
+    if(not os.path.isfile(stream_index_path)):
+        return None
+    return stream_index_path
+
+
+class MultistreamReader:
+    def __init__(self, WIKI_DUMP_PATH, STREAM_INDEX_PATH, WORKER_COUNT, MAX_PENDING_STREAMS):
+        # Initialize a MultistreamReader, which decompresses the independent bz2 streams of a multistream dump
+        # in a pool of worker processes, and hands the decompressed streams over in file order.
+        # Without a stream index, the dump is decompressed serially.
+        self.WIKI_DUMP_PATH = WIKI_DUMP_PATH
+        self.STREAM_INDEX_PATH = STREAM_INDEX_PATH
+        self.WORKER_COUNT = WORKER_COUNT
+        self.MAX_PENDING_STREAMS = MAX_PENDING_STREAMS
+
+        # Initialize counters for statistics.
+        self.StreamCount = 0
+        self.CompressedBytesRead = 0
+
+    def _get_stream_ranges(self):
+        # Byte ranges of the streams: the index lists the page streams, the header and footer streams lie around them.
+        offsets = read_stream_offsets(self.STREAM_INDEX_PATH)
+        boundaries = sorted(set([0] + offsets + [os.path.getsize(self.WIKI_DUMP_PATH)]))
+        return list(zip(boundaries[:-1], boundaries[1:]))
+
+    def _iter_serial_chunks(self):
+        # Decompress the whole dump in a single stream of chunks.
+        with bz2.open(self.WIKI_DUMP_PATH, "rb") as wiki_dump_fp:
+            while(True):
+                chunk = wiki_dump_fp.read(READ_CHUNK_SIZE)
+                if(len(chunk) == 0):
+                    break
+                yield chunk
+        self.CompressedBytesRead = os.path.getsize(self.WIKI_DUMP_PATH)
+
+    def iter_chunks(self):
+        # Yield the decompressed content of the dump as byte chunks, in file order.
+        if(self.STREAM_INDEX_PATH is None or self.WORKER_COUNT <= 1):
+            yield from self._iter_serial_chunks()
+            return
+
+        pending_streams = deque()
+        with multiprocessing.Pool(self.WORKER_COUNT) as pool:
+            for start_offset, end_offset in self._get_stream_ranges():
+                # Keep a bounded number of streams in flight, so decompressed streams don't pile up in memory.
+                while(len(pending_streams) >= self.MAX_PENDING_STREAMS):
+                    yield pending_streams.popleft().get()
+                pending_streams.append(pool.apply_async(decompress_stream, (self.WIKI_DUMP_PATH, start_offset, end_offset)))
+                self.StreamCount += 1
+                self.CompressedBytesRead += end_offset - start_offset
+            while(len(pending_streams) > 0):
+                yield pending_streams.popleft().get()
@@ -0,0 +1,93 @@
+import postingCodec
+
+# NumPy is optional: without it, wikiSearch keeps scoring in pure Python.
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Little-endian dtypes for each packed byte width.
+WIDTH_DTYPES = {1: "<u1", 2: "<u2", 4: "<u4"}
+
+
+def is_available():
+    # Check whether NumPy can be imported.
+    return np is not None
+
+def decode_term_arrays(record):
+    # Decode a term record into a vector of docIDs and an N x 6 matrix of field counts.
+    # Returns the docIDs, the field counts and the term's IDF.
+    word, IDF, doc_count, word_freq, max_field_counts, block_count, blocks_start, blocks_end, field_record_lengths = postingCodec.decode_term_header(record)
+
+    # Only the block headers are read in Python, the payloads are viewed as arrays.
+    docID_deltas = []
+    bitmaps = []
+    counts = []
+    prev_docID = 0
+    pos = blocks_start
+    while(pos < blocks_end):
+        posting_count, first_docID, last_docID, gap_width, count_width, count_total, block_max_field_counts, payload_start, block_end = postingCodec.decode_block_header(record, pos)
+        gaps_end = payload_start + (posting_count - 1) * gap_width
+        bitmaps_end = gaps_end + posting_count
+
+        # Turn each block's first docID into a delta from the previous block's last one, so one cumsum restores them all.
+        docID_deltas.append(np.array([first_docID - prev_docID], dtype = np.int64))
+        docID_deltas.append(np.frombuffer(record, dtype = WIDTH_DTYPES[gap_width], count = posting_count - 1, offset = payload_start))
+        bitmaps.append(np.frombuffer(record, dtype = np.uint8, count = posting_count, offset = gaps_end))
+        counts.append(np.frombuffer(record, dtype = WIDTH_DTYPES[count_width], count = count_total, offset = bitmaps_end))
+        prev_docID = last_docID
+        pos = block_end
+
+    if(len(bitmaps) == 0):
+        return np.zeros(0, dtype = np.int64), np.zeros((0, postingCodec.FIELD_COUNT)), IDF
+
+    docIDs = np.cumsum(np.concatenate(docID_deltas).astype(np.int64))
+    bitmaps = np.concatenate(bitmaps)
+
+    # Bit i of a bitmap tells whether field i has a count, and the counts follow in posting then field order,
+    # which is the row-major order of the set cells.
+    field_mask = ((bitmaps[:, None] >> np.arange(postingCodec.FIELD_COUNT, dtype = np.uint8)) & 1).astype(bool)
+    field_counts = np.zeros((len(bitmaps), postingCodec.FIELD_COUNT))
+    field_counts[field_mask] = np.concatenate(counts)
+    return docIDs, field_counts, IDF
+
+def get_term_scores(record, field_weights, IDF = None):
+    # Score every posting of a term record: the IDF-weighted sum of its field counts times field_weights.
+    # The IDF stored in the record is used unless another one is given.
+    # Returns the docIDs and scores of the postings with a positive score.
+    docIDs, field_counts, record_IDF = decode_term_arrays(record)
+    if IDF is None:
+        IDF = record_IDF
+    # Products are summed field by field, in the same order as the pure Python scorer, so scores are identical.
+    scores = (field_counts * np.asarray(field_weights, dtype = np.float64) * IDF).sum(axis = 1)
+    positive = scores > 0
+    return docIDs[positive], scores[positive]
+
+def get_top_k(term_records, k, deleted_docs = None):
+    # Retrieve the top-k (docID, score) pairs over (term record, field weights, IDF) query terms given in query order.
+    # Documents with equal scores rank by docID, like the other scorers.
+    # Documents marked in the deleted_docs tombstone bitmap are left out.
+    if(len(term_records) == 0):
+        return []
+    term_scores = [get_term_scores(record, field_weights, IDF) for record, field_weights, IDF in term_records]
+    docIDs = np.concatenate([term_docIDs for term_docIDs, scores in term_scores])
+    scores = np.concatenate([scores for term_docIDs, scores in term_scores])
+    if(deleted_docs is not None and len(docIDs) > 0):
+        deleted = (np.frombuffer(deleted_docs, dtype = np.uint8)[docIDs >> 3] >> (docIDs & 7).astype(np.uint8)) & 1
+        docIDs = docIDs[deleted == 0]
+        scores = scores[deleted == 0]
+    if(len(docIDs) == 0):
+        return []
+
+    # Scatter-add the term scores per document; bincount adds them in query order.
+    unique_docIDs, doc_idx = np.unique(docIDs, return_inverse = True)
+    docs_scores = np.bincount(doc_idx, weights = scores, minlength = len(unique_docIDs))
+
+    # Keep the k best, by score then docID: the unique docIDs are sorted, so their indexes order them.
+    if(len(unique_docIDs) > k):
+        kth_score = np.partition(docs_scores, len(docs_scores) - k)[len(docs_scores) - k]
+        candidates = np.nonzero(docs_scores >= kth_score)[0]
+    else:
+        candidates = np.arange(len(unique_docIDs))
+    order = candidates[np.lexsort((candidates, -docs_scores[candidates]))][:k]
+    return [(int(unique_docIDs[idx]), float(docs_scores[idx])) for idx in order]
@@ -0,0 +1,132 @@
+# Libraries
+import os
+import time
+import argparse
+from xml.parsers import expat
+
+# Global Variables
+READ_CHUNK_SIZE = 1 << 20
+TEXT_BUFFER_SIZE = 1 << 20
+
+# Root element fed to the parser before the content of a dump read from the middle, at a page boundary.
+RESUME_ROOT_ELEMENT = b"<mediawiki>"
+PAGE_END_TAG_LENGTH = len(b"</page>")
+
+
+def read_chunks(fp, chunk_size = READ_CHUNK_SIZE):
+    # Read a binary file in chunks.
+    while(True):
+        chunk = fp.read(chunk_size)
+        if(len(chunk) == 0):
+            break
+        yield chunk
+
+def skip_chunk_bytes(chunks, byte_count):
+    # Drop the first byte_count bytes of an iterable of byte chunks.
+    for chunk in chunks:
+        if(byte_count >= len(chunk)):
+            byte_count -= len(chunk)
+            continue
+        yield chunk[byte_count:]
+        byte_count = 0
+
+
+class PageExtractor:
+    def __init__(self):
+        # Initialize a PageExtractor, which streams the (title, text) of the pages of a wiki xml dump.
+        # Text is buffered by expat and collected in lists joined once per element, and only the title
+        # and text elements are kept.
+        self.title = ""
+        self.text = ""
+        self.parts = None
+        self.pages = []
+        self.parser = None
+        self.start_offset = 0
+
+        # Byte offset in the dump of the end of the last page yielded, where the dump can be read from again.
+        self.PageEndOffset = 0
+
+        # Initialize counters for statistics.
+        self.BytesRead = 0
+        self.PageCount = 0
+
+    def _start_element(self, tag, attributes):
+        # Start collecting the text of title and text elements.
+        if(tag == "title" or tag == "text"):
+            self.parts = []
+        elif(tag == "page"):
+            self.title = ""
+            self.text = ""
+
+    def _end_element(self, tag):
+        # Join the collected text of title and text elements, and queue the page once it ends.
+        if(tag == "title"):
+            self.title = "".join(self.parts).strip()
+            self.parts = None
+        elif(tag == "text"):
+            self.text = "".join(self.parts).strip()
+            self.parts = None
+        elif(tag == "page"):
+            self.pages.append((self.title, self.text, self.start_offset + self.parser.CurrentByteIndex + PAGE_END_TAG_LENGTH))
+
+    def _character_data(self, data):
+        # Collect text inside title and text elements.
+        if self.parts is not None:
+            self.parts.append(data)
+
+    def _yield_pages(self):
+        # Yield the queued pages, keeping track of where the last one ends.
+        pages = self.pages
+        self.pages = []
+        self.PageCount += len(pages)
+        for title, text, end_offset in pages:
+            self.PageEndOffset = end_offset
+            yield title, text
+
+    def iter_pages(self, chunks, start_offset = 0):
+        # Yield the (title, text) of every page of a dump given as an iterable of byte chunks, in order.
+        # A non zero start_offset is the page boundary of the dump the chunks start at.
+        parser = expat.ParserCreate()
+        parser.buffer_text = True
+        parser.buffer_size = TEXT_BUFFER_SIZE
+        parser.StartElementHandler = self._start_element
+        parser.EndElementHandler = self._end_element
+        parser.CharacterDataHandler = self._character_data
+        self.parser = parser
+
+        # Byte offsets reported by the parser count from the start of its input, so the root element fed to it is taken off.
+        self.start_offset = start_offset
+        self.PageEndOffset = start_offset
+        if(start_offset > 0):
+            parser.Parse(RESUME_ROOT_ELEMENT, False)
+            self.start_offset -= len(RESUME_ROOT_ELEMENT)
+
+        for chunk in chunks:
+            self.BytesRead += len(chunk)
+            parser.Parse(chunk, False)
+            if(len(self.pages) > 0):
+                yield from self._yield_pages()
+        parser.Parse(b"", True)
+        yield from self._yield_pages()
+        self.parser = None
+
+    def iter_file_pages(self, wiki_dump_path, start_offset = 0):
+        # Yield the (title, text) of every page of a wiki xml dump file, from a page boundary of it.
+        with open(wiki_dump_path, "rb") as wiki_dump_fp:
+            wiki_dump_fp.seek(start_offset)
+            yield from self.iter_pages(read_chunks(wiki_dump_fp), start_offset)
+
+
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser(description = "Measure the raw page extraction throughput on a wiki xml dump.")
+    argParser.add_argument("wiki_dump_path", help = "path to the wiki xml dump")
+    args = argParser.parse_args()
+
+    pageExtractor = PageExtractor()
+    start_time = time.perf_counter()
+    for title, text in pageExtractor.iter_file_pages(os.path.abspath(args.wiki_dump_path)):
+        pass
+    total_time = time.perf_counter() - start_time
+
+    print("Pages: \t\t\t" + str(pageExtractor.PageCount))
+    print("Throughput: \t\t%.2f MB/second, %.0f pages/second" % (pageExtractor.BytesRead / total_time / (1024 * 1024), pageExtractor.PageCount / total_time))
@@ -0,0 +1,95 @@
+import os
+import multiprocessing
+from collections import deque
+
+from fastPreprocessor import PREPROCESSORS
+from invertedIndexHandler import count_words
+
+# Preprocessor owned by each worker process, created once by the pool initializer.
+worker_preprocessor = None
+
+
+def init_worker(MAX_WORD_CAP, PREPROCESSOR = "nltk"):
+    # Create the preprocessor of a worker process.
+    global worker_preprocessor
+    worker_preprocessor = PREPROCESSORS[PREPROCESSOR](MAX_WORD_CAP)
+
+
+def process_batch(batch):
+    # Preprocess a batch of raw pages inside a worker process.
+    # Returns the per-page word counts and numbers of tokens encountered in batch order,
+    # and the worker's process id with its stem cache statistics and preprocessing stage times so far.
+    results = []
+    for docID, title, text in batch:
+        words_encountered = worker_preprocessor.TotalWordsEncountered
+        wiki_data = {}
+        wiki_data['title'] = worker_preprocessor.process_title(title)
+        wiki_data['infobox'], wiki_data['body'], wiki_data['category'], wiki_data['link'], wiki_data['reference'] = worker_preprocessor.process_text(text)
+        results.append((docID, count_words(wiki_data), worker_preprocessor.TotalWordsEncountered - words_encountered))
+    return results, (os.getpid(), worker_preprocessor.get_stem_cache_stats(), worker_preprocessor.get_stage_times())
+
+
+class ParallelPageProcessor:
+    def __init__(self, MAX_WORD_CAP, WORKER_COUNT, BATCH_SIZE, MAX_PENDING_BATCHES, on_page_processed, PREPROCESSOR = "nltk"):
+        # Initialize a pool of worker processes that preprocess pages in batches.
+        # on_page_processed(docID, word_counts) is called in the parent process, in docID order.
+        self.BATCH_SIZE = BATCH_SIZE
+        self.MAX_PENDING_BATCHES = MAX_PENDING_BATCHES
+        self.on_page_processed = on_page_processed
+
+        self.pool = multiprocessing.Pool(WORKER_COUNT, initializer = init_worker, initargs = (MAX_WORD_CAP, PREPROCESSOR))
+        self.batch = []
+        self.pending_batches = deque()
+
+        # Initialize a word count for statistics, summed over all workers, and the latest stem cache statistics
+        # and preprocessing stage times of each worker.
+        self.TotalWordsEncountered = 0
+        self.worker_stem_cache_stats = {}
+        self.worker_stage_times = {}
+
+    def _collect_oldest_batch(self):
+        # Wait for the oldest submitted batch and hand its pages over in order.
+        results, (worker_pid, stem_cache_stats, stage_times) = self.pending_batches.popleft().get()
+        self.worker_stem_cache_stats[worker_pid] = stem_cache_stats
+        self.worker_stage_times[worker_pid] = stage_times
+        for docID, word_counts, words_encountered in results:
+            # Count the tokens of a page before handing it over, so the count matches the pages handed over so far.
+            self.TotalWordsEncountered += words_encountered
+            self.on_page_processed(docID, word_counts)
+
+    def _submit_batch(self):
+        # Send the current batch to the pool, waiting first if too many batches are in flight.
+        while(len(self.pending_batches) >= self.MAX_PENDING_BATCHES):
+            self._collect_oldest_batch()
+        self.pending_batches.append(self.pool.apply_async(process_batch, (self.batch,)))
+        self.batch = []
+
+    def add_page(self, docID, title, text):
+        # Queue a raw page for preprocessing.
+        self.batch.append((docID, title, text))
+        if(len(self.batch) >= self.BATCH_SIZE):
+            self._submit_batch()
+
+    def finish(self):
+        # Process the remaining pages, wait for all batches and shut the pool down.
+        if(len(self.batch) > 0):
+            self._submit_batch()
+        while(len(self.pending_batches) > 0):
+            self._collect_oldest_batch()
+        self.pool.close()
+        self.pool.join()
+
+    def get_stem_cache_stats(self):
+        # Return the stem cache hits, misses and memory use in bytes, summed over all workers.
+        hits = sum(stats[0] for stats in self.worker_stem_cache_stats.values())
+        misses = sum(stats[1] for stats in self.worker_stem_cache_stats.values())
+        memory = sum(stats[2] for stats in self.worker_stem_cache_stats.values())
+        return hits, misses, memory
+
+    def get_stage_times(self):
+        # Return the seconds spent in each preprocessing stage, summed over all workers.
+        stage_times = {}
+        for worker_stage_times in self.worker_stage_times.values():
+            for stage, stage_time in worker_stage_times.items():
+                stage_times[stage] = stage_times.get(stage, 0.0) + stage_time
+        return stage_times
@@ -0,0 +1,410 @@
+import sys
+import struct
+from array import array
+from itertools import accumulate
+
+# Binary index file format.
+#
+# Every index file starts with INDEX_FILE_MAGIC followed by a one byte format version,
+# and then holds one term record per word, in sorted word order:
+#   varint word length, word (utf-8), idf (little-endian float64), varint doc count,
+#   varint word frequency, 6 varint maximum field counts, varint block count,
+#   varint byte length of the blocks, 6 varint byte lengths of the field term records, blocks, field term records
+#
+# A posting list is split into blocks of at most BLOCK_SIZE postings, each with a header:
+#   varint posting count n, varint first docID, varint last docID,
+#   one byte of widths (gap width << 4 | count width), varint count of field counts,
+#   6 varint maximum field counts within the block
+# followed by the payload:
+#   n - 1 docID gaps (d-gaps), packed little-endian with the gap width in bytes,
+#   n field bitmaps, one byte each (bit i set when field i occurs in the document),
+#   one field count per set bit, packed little-endian with the count width in bytes.
+# Packing each column at a fixed per-block byte width keeps decoding inside array.frombytes.
+# The maximum field counts give upper bounds on the score of any posting of a term or block,
+# which lets the query side skip postings that can't make it into the top k.
+#
+# Temporary index files (runs) hold one run record per word, in sorted word order, each preceded by its
+# byte length (little-endian uint32):
+#   varint word length, word (utf-8), varint doc count, varint word frequency,
+#   6 varint maximum field counts, varint block count, blocks
+# Blocks are self-contained, so the blocks of a word's run records are concatenated as they are into its term record.
+#
+# Since format version 4, the blocks of a term record are followed by a field term record for every field the word
+# occurs in, in field order, each a term record of the postings of that field alone, with only that field's counts,
+# the word's IDF, an empty word and no field term records of its own. Their lengths in the header locate them
+# (0 for the fields the word doesn't occur in), and the term dictionary only spans the header and the blocks,
+# so a field query term reads the header and then its field term record, and no other term reads them.
+#
+# In temporary index files, the postings of each field of a word are a run record of their own, keyed by the word,
+# FIELD_KEY_SEPARATOR and the field's letter (see get_field_key). Text can't contain characters below the separator,
+# which is whitespace, so field keys sort right after their word and are merged like any other word,
+# and the merge nests them into the word's term record.
+INDEX_FILE_MAGIC = b"WSIX"
+INDEX_FORMAT_VERSION = 4
+INDEX_FILE_HEADER = INDEX_FILE_MAGIC + bytes([INDEX_FORMAT_VERSION])
+INDEX_FILE_EXTENSION = ".bin"
+
+BLOCK_SIZE = 128
+FIELD_COUNT = 6
+
+# Array typecodes for each packed byte width.
+WIDTH_TYPECODES = {1: "B", 2: "H", 4: "I"}
+
+# Field indices present in each of the 64 possible field bitmaps.
+BITMAP_FIELDS = [[field for field in range(FIELD_COUNT) if bitmap & (1 << field)] for bitmap in range(1 << FIELD_COUNT)]
+
+# Field positions of the characters used in the text posting lists.
+TEXT_FIELD_INDEX = {"t": 0, "i": 1, "b": 2, "c": 3, "l": 4, "r": 5}
+
+# Field run records are keyed by their word, the separator and the field's letter, and follow the word in key order.
+FIELD_KEY_SEPARATOR = "\t"
+FIELD_LETTERS = "tibclr"
+FIELD_KEY_ORDER = sorted(range(FIELD_COUNT), key = FIELD_LETTERS.__getitem__)
+NO_FIELD_RECORD_LENGTHS = [0, 0, 0, 0, 0, 0]
+
+IDF_STRUCT = struct.Struct("<d")
+RUN_RECORD_LENGTH_STRUCT = struct.Struct("<I")
+
+
+def encode_varint(value, out):
+    # Append an unsigned integer to a bytearray as a LEB128 varint.
+    while(value >= 0x80):
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+def decode_varint(data, pos):
+    # Read a varint from data at pos, returning the value and the position after it.
+    value = 0
+    shift = 0
+    while(True):
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if(byte < 0x80):
+            return value, pos
+        shift += 7
+
+def _get_width(max_value):
+    # Smallest packed byte width that can hold max_value.
+    if(max_value < 0x100):
+        return 1
+    elif(max_value < 0x10000):
+        return 2
+    return 4
+
+def _pack(values, width):
+    # Pack integers little-endian at a fixed byte width.
+    packed = array(WIDTH_TYPECODES[width], values)
+    if(sys.byteorder == "big"):
+        packed.byteswap()
+    return packed.tobytes()
+
+def _unpack(data, width):
+    # Unpack little-endian integers of a fixed byte width.
+    unpacked = array(WIDTH_TYPECODES[width])
+    unpacked.frombytes(data)
+    if(sys.byteorder == "big"):
+        unpacked.byteswap()
+    return unpacked
+
+def encode_block(docIDs, field_counts):
+    # Encode up to BLOCK_SIZE postings, given as ascending docIDs and their lists of 6 field counts.
+    gaps = [docIDs[i] - docIDs[i - 1] for i in range(1, len(docIDs))]
+    bitmaps = bytearray()
+    counts = []
+    max_field_counts = [0, 0, 0, 0, 0, 0]
+    for fields in field_counts:
+        bitmap = 0
+        for field in range(FIELD_COUNT):
+            if(fields[field] > 0):
+                bitmap |= 1 << field
+                counts.append(fields[field])
+                if(fields[field] > max_field_counts[field]):
+                    max_field_counts[field] = fields[field]
+        bitmaps.append(bitmap)
+
+    gap_width = _get_width(max(gaps, default = 0))
+    count_width = _get_width(max(counts, default = 0))
+
+    block = bytearray()
+    encode_varint(len(docIDs), block)
+    encode_varint(docIDs[0], block)
+    encode_varint(docIDs[-1], block)
+    block.append((gap_width << 4) | count_width)
+    encode_varint(len(counts), block)
+    for max_field_count in max_field_counts:
+        encode_varint(max_field_count, block)
+    block += _pack(gaps, gap_width)
+    block += bitmaps
+    block += _pack(counts, count_width)
+    return block, max_field_counts
+
+def encode_posting_list(postings):
+    # Encode a posting list of (docID, field counts) pairs in ascending docID order.
+    # Returns the encoded blocks, the number of blocks and the maximum count of each field.
+    blocks = bytearray()
+    block_count = 0
+    max_field_counts = [0, 0, 0, 0, 0, 0]
+    for start in range(0, len(postings), BLOCK_SIZE):
+        block_postings = postings[start: start + BLOCK_SIZE]
+        block, block_max_field_counts = encode_block([posting[0] for posting in block_postings], [posting[1] for posting in block_postings])
+        blocks += block
+        block_count += 1
+        max_field_counts = [max(counts) for counts in zip(max_field_counts, block_max_field_counts)]
+    return blocks, block_count, max_field_counts
+
+def get_field_key(word, field):
+    # Key of the field run record of a word.
+    return word + FIELD_KEY_SEPARATOR + FIELD_LETTERS[field]
+
+def is_field_key(word):
+    # Check whether a run record key is the key of a field run record.
+    return FIELD_KEY_SEPARATOR in word
+
+def split_field_key(key):
+    # The word and field of a field run record key.
+    word, field_letter = key.rsplit(FIELD_KEY_SEPARATOR, 1)
+    return word, FIELD_LETTERS.index(field_letter)
+
+def split_field_postings(postings):
+    # Split (docID, field counts) postings into the postings of each field, keeping only that field's count.
+    # Returns (field, postings) pairs for the fields that occur, in field key order.
+    field_postings = [[] for field in range(FIELD_COUNT)]
+    for docID, fields in postings:
+        for field in range(FIELD_COUNT):
+            if(fields[field] > 0):
+                field_fields = [0, 0, 0, 0, 0, 0]
+                field_fields[field] = fields[field]
+                field_postings[field].append((docID, field_fields))
+    return [(field, field_postings[field]) for field in FIELD_KEY_ORDER if len(field_postings[field]) > 0]
+
+def encode_term_header(word, idf, doc_count, word_freq, max_field_counts, block_count, blocks_len, field_record_lengths = NO_FIELD_RECORD_LENGTHS):
+    # Encode the header of a term record, which is followed by blocks_len bytes of blocks, and its field term records.
+    encoded_word = word.encode('utf-8')
+    header = bytearray()
+    encode_varint(len(encoded_word), header)
+    header += encoded_word
+    header += IDF_STRUCT.pack(idf)
+    encode_varint(doc_count, header)
+    encode_varint(word_freq, header)
+    for max_field_count in max_field_counts:
+        encode_varint(max_field_count, header)
+    encode_varint(block_count, header)
+    encode_varint(blocks_len, header)
+    for field_record_length in field_record_lengths:
+        encode_varint(field_record_length, header)
+    return header
+
+def encode_term_record(word, idf, doc_count, word_freq, max_field_counts, blocks, block_count, field_records = None):
+    # Encode a complete term record from its statistics, encoded blocks, and the field term records of every field (empty for
+    # the fields the word doesn't occur in).
+    if field_records is None:
+        return bytes(encode_term_header(word, idf, doc_count, word_freq, max_field_counts, block_count, len(blocks)) + blocks)
+    header = encode_term_header(word, idf, doc_count, word_freq, max_field_counts, block_count, len(blocks), [len(field_record) for field_record in field_records])
+    return bytes(header + blocks + b"".join(field_records))
+
+def encode_field_records(postings, idf):
+    # Encode the field term records of a posting list of (docID, field counts) pairs, for every field in field order.
+    field_records = [b""] * FIELD_COUNT
+    for field, field_postings in split_field_postings(postings):
+        blocks, block_count, max_field_counts = encode_posting_list(field_postings)
+        field_records[field] = encode_term_record("", idf, len(field_postings), sum(posting[1][field] for posting in field_postings), max_field_counts, blocks, block_count)
+    return field_records
+
+def encode_run_record(word, doc_count, word_freq, max_field_counts, blocks, block_count):
+    # Encode a run record of a temporary index file, with its length prefix.
+    encoded_word = word.encode('utf-8')
+    record = bytearray(RUN_RECORD_LENGTH_STRUCT.size)
+    encode_varint(len(encoded_word), record)
+    record += encoded_word
+    encode_varint(doc_count, record)
+    encode_varint(word_freq, record)
+    for max_field_count in max_field_counts:
+        encode_varint(max_field_count, record)
+    encode_varint(block_count, record)
+    record += blocks
+    RUN_RECORD_LENGTH_STRUCT.pack_into(record, 0, len(record) - RUN_RECORD_LENGTH_STRUCT.size)
+    return record
+
+def read_run_record(fp):
+    # Read the next run record of a temporary index file, without its length prefix, or return None at the end of the file.
+    length_prefix = fp.read(RUN_RECORD_LENGTH_STRUCT.size)
+    if(len(length_prefix) == 0):
+        return None
+    return fp.read(RUN_RECORD_LENGTH_STRUCT.unpack(length_prefix)[0])
+
+def decode_run_word(record):
+    # Decode the word of a run record.
+    word_len, pos = decode_varint(record, 0)
+    return bytes(record[pos: pos + word_len]).decode('utf-8')
+
+def decode_run_record(record):
+    # Decode a run record.
+    # Returns the word, doc count, word frequency, maximum field counts, block count, and its blocks as a memoryview.
+    word_len, pos = decode_varint(record, 0)
+    word = bytes(record[pos: pos + word_len]).decode('utf-8')
+    pos += word_len
+    doc_count, pos = decode_varint(record, pos)
+    word_freq, pos = decode_varint(record, pos)
+    max_field_counts, pos = _decode_field_counts(record, pos)
+    block_count, pos = decode_varint(record, pos)
+    return word, doc_count, word_freq, max_field_counts, block_count, memoryview(record)[pos:]
+
+def decode_term_header(data, pos = 0):
+    # Decode the header of the term record at pos.
+    # Returns the word, idf, doc count, word frequency, maximum field counts, block count,
+    # the start and end of its blocks, and the byte lengths of its field term records, which follow the blocks.
+    word_len, pos = decode_varint(data, pos)
+    word = bytes(data[pos: pos + word_len]).decode('utf-8')
+    pos += word_len
+    idf = IDF_STRUCT.unpack_from(data, pos)[0]
+    pos += IDF_STRUCT.size
+    doc_count, pos = decode_varint(data, pos)
+    word_freq, pos = decode_varint(data, pos)
+    max_field_counts, pos = _decode_field_counts(data, pos)
+    block_count, pos = decode_varint(data, pos)
+    blocks_len, pos = decode_varint(data, pos)
+    field_record_lengths, pos = _decode_field_counts(data, pos)
+    return word, idf, doc_count, word_freq, max_field_counts, block_count, pos, pos + blocks_len, field_record_lengths
+
+def get_field_record_location(data, field, pos = 0):
+    # Byte offset (relative to pos) and length of the field term record of a field of the term record at pos,
+    # decoded from its header alone, or None if the word doesn't occur in the field.
+    blocks_end, field_record_lengths = decode_term_header(data, pos)[7:]
+    if(field_record_lengths[field] == 0):
+        return None
+    return blocks_end - pos + sum(field_record_lengths[:field]), field_record_lengths[field]
+
+def get_field_record(record, field):
+    # The field term record of a field of a whole term record, or None if the word doesn't occur in the field.
+    location = get_field_record_location(record, field)
+    if location is None:
+        return None
+    return record[location[0]: location[0] + location[1]]
+
+def get_word_record(record):
+    # The part of a whole term record the term dictionary locates: its header and blocks, without its field term records.
+    return record[:decode_term_header(record)[7]]
+
+def _decode_field_counts(data, pos):
+    # Read the 6 varint field counts at pos.
+    field_counts = []
+    for field in range(FIELD_COUNT):
+        field_count, pos = decode_varint(data, pos)
+        field_counts.append(field_count)
+    return field_counts, pos
+
+def decode_block_header(data, pos):
+    # Decode the header of the block at pos, without touching its payload.
+    # Returns the posting count, first and last docIDs, gap and count widths, number of field counts,
+    # maximum field counts, the start of the payload and the position after the block.
+    posting_count, pos = decode_varint(data, pos)
+    first_docID, pos = decode_varint(data, pos)
+    last_docID, pos = decode_varint(data, pos)
+    gap_width = data[pos] >> 4
+    count_width = data[pos] & 0x0f
+    pos += 1
+    count_total, pos = decode_varint(data, pos)
+    max_field_counts, pos = _decode_field_counts(data, pos)
+    block_end = pos + (posting_count - 1) * gap_width + posting_count + count_total * count_width
+    return posting_count, first_docID, last_docID, gap_width, count_width, count_total, max_field_counts, pos, block_end
+
+def rebase_blocks(blocks, docID_offset):
+    # Shift every docID of encoded blocks by docID_offset. Only the first and last docIDs of the block headers
+    # change, as the payload holds docID gaps, so the rest of each block is copied as it is.
+    if(docID_offset == 0):
+        return blocks
+    rebased_blocks = bytearray()
+    pos = 0
+    while(pos < len(blocks)):
+        block_start = pos
+        posting_count, pos = decode_varint(blocks, pos)
+        first_docID, pos = decode_varint(blocks, pos)
+        last_docID, pos = decode_varint(blocks, pos)
+        block_end = decode_block_header(blocks, block_start)[-1]
+        encode_varint(posting_count, rebased_blocks)
+        encode_varint(first_docID + docID_offset, rebased_blocks)
+        encode_varint(last_docID + docID_offset, rebased_blocks)
+        rebased_blocks += blocks[pos: block_end]
+        pos = block_end
+    return rebased_blocks
+
+def decode_block(data, pos):
+    # Decode the block at pos.
+    # Returns its docIDs, field bitmaps and field counts, and the position after the block.
+    posting_count, first_docID, last_docID, gap_width, count_width, count_total, max_field_counts, pos, block_end = decode_block_header(data, pos)
+    gaps_end = pos + (posting_count - 1) * gap_width
+    docIDs = list(accumulate(_unpack(data[pos: gaps_end], gap_width), initial = first_docID))
+    bitmaps = data[gaps_end: gaps_end + posting_count]
+    counts = _unpack(data[gaps_end + posting_count: block_end], count_width)
+    return docIDs, bitmaps, counts, block_end
+
+def iter_blocks(data, pos, end):
+    # Iterate over the decoded blocks stored between pos and end.
+    while(pos < end):
+        docIDs, bitmaps, counts, pos = decode_block(data, pos)
+        yield docIDs, bitmaps, counts
+
+def iter_postings(data, pos, end):
+    # Iterate over the (docID, field counts) postings stored between pos and end.
+    for docIDs, bitmaps, counts in iter_blocks(data, pos, end):
+        count_idx = 0
+        for docID, bitmap in zip(docIDs, bitmaps):
+            fields = [0, 0, 0, 0, 0, 0]
+            for field in BITMAP_FIELDS[bitmap]:
+                fields[field] = counts[count_idx]
+                count_idx += 1
+            yield docID, fields
+
+def write_index_file_header(fp):
+    # Write the magic and format version at the start of an index file.
+    fp.write(INDEX_FILE_HEADER)
+
+def check_index_file_header(header):
+    # Validate the header of an index file.
+    if(header[:len(INDEX_FILE_MAGIC)] != INDEX_FILE_MAGIC):
+        raise ValueError("Not a binary index file, convert text indexes with indexConverter.py")
+    if(header[len(INDEX_FILE_MAGIC)] != INDEX_FORMAT_VERSION):
+        raise ValueError("Unsupported index format version " + str(header[len(INDEX_FILE_MAGIC)]) + ", expected " + str(INDEX_FORMAT_VERSION))
+
+def read_index_file(fp):
+    # Read a whole open index file after validating its header.
+    data = fp.read()
+    check_index_file_header(data[:len(INDEX_FILE_HEADER)])
+    return memoryview(data)
+
+def iter_run_records(data, pos = len(INDEX_FILE_HEADER)):
+    # Iterate over the term records stored in data from pos, decoded like run records (see decode_run_record),
+    # so the records of index files can be merged like those of temporary index files.
+    # Every term record is followed by its field term records, as field run records in key order.
+    while(pos < len(data)):
+        word, idf, doc_count, word_freq, max_field_counts, block_count, blocks_start, blocks_end, field_record_lengths = decode_term_header(data, pos)
+        yield word, doc_count, word_freq, max_field_counts, block_count, data[blocks_start: blocks_end]
+        for field in FIELD_KEY_ORDER:
+            if(field_record_lengths[field] > 0):
+                field_word, field_idf, field_doc_count, field_word_freq, field_max_field_counts, field_block_count, field_blocks_start, field_blocks_end, field_lengths = decode_term_header(data, blocks_end + sum(field_record_lengths[:field]))
+                yield get_field_key(word, field), field_doc_count, field_word_freq, field_max_field_counts, field_block_count, data[field_blocks_start: field_blocks_end]
+        pos = blocks_end + sum(field_record_lengths)
+
+def iter_term_records(data, pos = len(INDEX_FILE_HEADER), end = None):
+    # Iterate over the term records stored in data between pos and end (the end of data by default).
+    # Yields the word, the record's byte offset (relative to data) and the record bytes, with its field term records.
+    if(end is None):
+        end = len(data)
+    while(pos < end):
+        word, idf, doc_count, word_freq, max_field_counts, block_count, blocks_start, blocks_end, field_record_lengths = decode_term_header(data, pos)
+        record_end = blocks_end + sum(field_record_lengths)
+        yield word, pos, data[pos: record_end]
+        pos = record_end
+
+def parse_text_posting_list(posting_list):
+    # Parse a text posting list ("12345 t1-b3-c1|12399 b2") into (docID, field counts) pairs.
+    postings = []
+    for doc in posting_list.split("|"):
+        docID, fields_string = doc.split(" ")
+        fields = [0, 0, 0, 0, 0, 0]
+        for field in fields_string.split("-"):
+            fields[TEXT_FIELD_INDEX[field[0]]] = int(field[1:])
+        postings.append((int(docID), fields))
+    return postings
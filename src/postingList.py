@@ -0,0 +1,56 @@
+import time
+
+import postingCodec
+
+# Estimated bytes held per decoded posting: a docID list slot and int object, its bitmap byte and counts.
+DECODED_POSTING_SIZE = 48
+# Estimated bytes held per block: its header values and decoded lists.
+BLOCK_SIZE_OVERHEAD = 256
+
+
+class PostingList:
+    def __init__(self, record):
+        # Initialize a PostingList over a term record, reading the term and block headers.
+        # Blocks are decoded on first use and kept, so a cached PostingList is only ever decoded once.
+        self.record = record
+        self.word, self.IDF, self.doc_count, self.word_freq, self.max_field_counts, self.block_count, blocks_start, blocks_end, field_record_lengths = postingCodec.decode_term_header(record)
+
+        self.block_starts = []
+        self.block_first_docIDs = []
+        self.block_last_docIDs = []
+        self.block_max_field_counts = []
+        pos = blocks_start
+        while(pos < blocks_end):
+            posting_count, first_docID, last_docID, gap_width, count_width, count_total, max_field_counts, payload_start, block_end = postingCodec.decode_block_header(record, pos)
+            self.block_starts.append(pos)
+            self.block_first_docIDs.append(first_docID)
+            self.block_last_docIDs.append(last_docID)
+            self.block_max_field_counts.append(max_field_counts)
+            pos = block_end
+
+        self.blocks = [None] * len(self.block_starts)
+
+        # Seconds spent decoding blocks and the number of blocks decoded, read by query traces.
+        self.decode_time = 0.0
+        self.decoded_block_count = 0
+
+    def get_block(self, block_idx):
+        # Return the docIDs, field bitmaps and field counts of a block, decoding it the first time.
+        block = self.blocks[block_idx]
+        if block is None:
+            start_time = time.perf_counter()
+            docIDs, bitmaps, counts, block_end = postingCodec.decode_block(self.record, self.block_starts[block_idx])
+            block = (docIDs, bitmaps, counts)
+            self.blocks[block_idx] = block
+            self.decode_time += time.perf_counter() - start_time
+            self.decoded_block_count += 1
+        return block
+
+    def iter_blocks(self):
+        # Iterate over the decoded blocks.
+        for block_idx in range(len(self.blocks)):
+            yield self.get_block(block_idx)
+
+    def get_size(self):
+        # Estimated memory held once every block is decoded.
+        return len(self.record) + len(self.blocks) * BLOCK_SIZE_OVERHEAD + self.doc_count * DECODED_POSTING_SIZE
@@ -1,10 +1,12 @@
 import re
+import sys
+import time
 from nltk.stem import PorterStemmer
 from nltk.corpus import stopwords as STOP_WORDS
 from nltk import word_tokenize
 
 class Preprocessor:
-    def __init__(self, MAX_WORD_CAP):
+    def __init__(self, MAX_WORD_CAP, STEM_CACHE_SIZE = 200000):
          # Constructor to initialize the Preprocessor class with a maximum word length.
         
         # Store the maximum word length
@@ -16,9 +18,22 @@ class Preprocessor:
         # Create a Porter stemmer instance
         self.stemmer = PorterStemmer()
 
+        # Memoize stems, as a few words make up most tokens. Once STEM_CACHE_SIZE words are cached,
+        # new words are stemmed without being cached, so the cache keeps the words seen first
+        self.STEM_CACHE_SIZE = STEM_CACHE_SIZE
+        self.stem_cache = {}
+        self.stem_cache_strings_size = 0
+        self.StemCacheHits = 0
+        self.StemCacheMisses = 0
+
         # Initialize a word count for statistics
         self.TotalWordsEncountered = 0
 
+        # Seconds spent extracting and cleaning up the fields of pages, tokenizing them, and filtering and stemming their tokens
+        self.CleanupTime = 0.0
+        self.TokenizeTime = 0.0
+        self.StemTime = 0.0
+
         # Define regular expression patterns for various elements in Wikipedia text
         self.externalLinksPattern = r"==External links==\n[\s\S]*?\n\n"
         self.referencesPattern = r"== ?references ?==(.*?)\n\n"
@@ -27,6 +42,9 @@ class Preprocessor:
         # Define a list of characters to be filtered out from the text
         self.filters = ['(', '{', '[', ']', '}', ')', '=', '|', '?', ',', '+', '\'', '\\', '*', '#', ';', '!', '\"', '%', '-', '.']
 
+        # Define the footer labels the body is cut at
+        self.footer_labels = ["references", "further reading", "see also", "notes"]
+
         # Define a dictionary of Wikipedia-related regular expression patterns
         self.wiki_pattern = {
             "infobox" : "{{infobox",
@@ -61,8 +79,7 @@ class Preprocessor:
 
     def _strip_footers(self, text):
         # Remove certain footer labels (e.g., references, further reading) from the text
-        labels = ["references", "further reading", "see also", "notes"]
-        for label in labels:
+        for label in self.footer_labels:
             regex = "== %s ==" % (label)
             found = re.search(regex, text, flags= re.IGNORECASE)
             if found is not None:
@@ -79,23 +96,29 @@ class Preprocessor:
             return text, ""
             
         pattern_len = len(self.wiki_pattern['infobox'])
+        idx = self._find_infobox_end(text, start_idx + pattern_len)
+
+        text = text[0: start_idx - 1] + text[idx: -1]
+        infobox_content = text[start_idx: idx - 2]
+        infobox_content = self._remove_all_urls(infobox_content)
+        infobox_content = self._filter_content(infobox_content)
+        infobox_content = self._remove_all_tags(infobox_content)
+        return text, infobox_content
+    
+    def _find_infobox_end(self, text, start_idx):
+        # Find the index of the first character after the infobox's braces close, scanning from start_idx
+        idx = start_idx
         end_idx = len(text)
         bracket_cnt = 2
 
-        for idx in range(start_idx + pattern_len, end_idx):
+        for idx in range(start_idx, end_idx):
             if(text[idx] == '{'):
                 bracket_cnt += 1
             elif(text[idx] == '}'):
                 bracket_cnt -= 1
             elif(bracket_cnt == 0):
                 break
-
-        text = text[0: start_idx - 1] + text[idx: -1]
-        infobox_content = text[start_idx: idx - 2]
-        infobox_content = self._remove_all_urls(infobox_content)
-        infobox_content = self._filter_content(infobox_content)
-        infobox_content = self._remove_all_tags(infobox_content)
-        return text, infobox_content
+        return idx
     
     def _extract_category_content(self, text):
         # Extract and clean category content from the text
@@ -144,10 +167,13 @@ class Preprocessor:
         # Preprocess and tokenize the input text
         
         # Remove filter characters, convert to lowercase, and tokenize
+        start_time = time.perf_counter()
         text = self._filter_content(text).lower()
 
         # Tokenization of text
         tokenized_text = word_tokenize(text)
+        tokenize_end_time = time.perf_counter()
+        self.TokenizeTime += tokenize_end_time - start_time
         
         # Update the word count statistic
         self.TotalWordsEncountered += len(tokenized_text)
@@ -156,9 +182,31 @@ class Preprocessor:
         processed_text = [word for word in tokenized_text if len(word) < self.MAX_WORD_CAP and word not in self.stopwords]
 
         # Stem words using Porter Stemmer
-        stemmed_text = [self.stemmer.stem(word) for word in processed_text]
+        stemmed_text = [self._stem(word) for word in processed_text]
+        self.StemTime += time.perf_counter() - tokenize_end_time
         return stemmed_text
 
+    def _stem(self, word):
+        # Stem a word with the Porter Stemmer, through the stem cache
+        stem = self.stem_cache.get(word)
+        if stem is not None:
+            self.StemCacheHits += 1
+            return stem
+        self.StemCacheMisses += 1
+        stem = self.stemmer.stem(word)
+        if(len(self.stem_cache) < self.STEM_CACHE_SIZE):
+            self.stem_cache[word] = stem
+            self.stem_cache_strings_size += sys.getsizeof(word) + sys.getsizeof(stem)
+        return stem
+
+    def get_stem_cache_stats(self):
+        # Return the stem cache hits, misses and memory use in bytes
+        return self.StemCacheHits, self.StemCacheMisses, sys.getsizeof(self.stem_cache) + self.stem_cache_strings_size
+
+    def get_stage_times(self):
+        # Return the seconds spent in each preprocessing stage
+        return {"cleanup": self.CleanupTime, "tokenize": self.TokenizeTime, "stem": self.StemTime}
+
     def process_title(self, raw_title):
         # Process the title text
         return self.process(raw_title)
@@ -167,12 +215,14 @@ class Preprocessor:
         # Process various parts of the input text and return processed versions
         
         # Convert to lowercase and extract infobox, category, external links, and references content
+        start_time = time.perf_counter()
         raw_text = raw_text.lower()
         raw_text, raw_infobox = self._extract_infobox_content(raw_text)
         raw_text, raw_category = self._extract_category_content(raw_text)
         raw_text, raw_external_links = self._extract_external_links_content(raw_text)
         raw_text, raw_references = self._extract_references_content(raw_text)
         raw_body = self._extract_body_content(raw_text)
+        self.CleanupTime += time.perf_counter() - start_time
 
         # Process and return the extracted parts
         return self.process(raw_infobox), self.process(raw_body), self.process(raw_category), self.process(raw_external_links), self.process(raw_references)
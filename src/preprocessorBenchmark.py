@@ -0,0 +1,81 @@
+# Libraries
+import os
+import sys
+import time
+import argparse
+import xml.etree.ElementTree as ElementTree
+
+from fastPreprocessor import PREPROCESSORS
+
+# Global Variables
+CORPUS_FILE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks", "preprocessor_corpus.xml")
+MAX_WORD_CAP = 30
+REPEAT = 1
+
+
+def read_pages(wiki_dump_path):
+    # Read the (title, text) of every page of a wiki xml dump.
+    pages = []
+    title = ""
+    text = ""
+    for event, element in ElementTree.iterparse(wiki_dump_path):
+        tag = element.tag.rsplit("}", 1)[-1]
+        if(tag == "title"):
+            title = element.text or ""
+        elif(tag == "text"):
+            text = element.text or ""
+        elif(tag == "page"):
+            pages.append((title, text))
+            element.clear()
+    return pages
+
+def preprocess_pages(preprocessor, pages):
+    # Preprocess every page, returning the processed fields of each page.
+    processed_pages = []
+    for title, text in pages:
+        processed_pages.append((preprocessor.process_title(title),) + preprocessor.process_text(text))
+    return processed_pages
+
+def run_benchmark(backend, pages, repeat):
+    # Preprocess the pages `repeat` times with a backend.
+    # Returns its processed pages, and its throughput in tokens and pages per second.
+    preprocessor = PREPROCESSORS[backend](MAX_WORD_CAP)
+    processed_pages = preprocess_pages(preprocessor, pages)
+
+    preprocessor.TotalWordsEncountered = 0
+    start_time = time.perf_counter()
+    for _ in range(repeat):
+        preprocess_pages(preprocessor, pages)
+    total_time = time.perf_counter() - start_time
+    return processed_pages, preprocessor.TotalWordsEncountered / total_time, len(pages) * repeat / total_time
+
+
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser(description = "Check that the preprocessing backends return the same tokens, and measure their throughput.")
+    argParser.add_argument("wiki_dump_path", nargs = "?", default = CORPUS_FILE_PATH, help = "wiki xml dump to preprocess (default: the equivalence test corpus)")
+    argParser.add_argument("--repeat", type = int, default = REPEAT, help = "number of timed passes over the pages (default: %(default)s)")
+    args = argParser.parse_args()
+
+    pages = read_pages(args.wiki_dump_path)
+    print("Pages: \t\t\t" + str(len(pages)))
+
+    results = {}
+    for backend in sorted(PREPROCESSORS):
+        processed_pages, tokens_per_second, pages_per_second = run_benchmark(backend, pages, args.repeat)
+        results[backend] = processed_pages
+        print("%s: \t\t\t%.0f tokens/second, %.1f pages/second" % (backend, tokens_per_second, pages_per_second))
+
+    # Every backend must return the tokens of the nltk one.
+    fields = ["title", "infobox", "body", "category", "link", "reference"]
+    mismatch_count = 0
+    for backend in sorted(PREPROCESSORS):
+        for page_idx, (expected, processed) in enumerate(zip(results["nltk"], results[backend])):
+            for field_idx, field in enumerate(fields):
+                if(expected[field_idx] != processed[field_idx]):
+                    mismatch_count += 1
+                    print("Mismatch: backend '" + backend + "', page '" + pages[page_idx][0] + "', field '" + field + "'")
+
+    if(mismatch_count > 0):
+        print(str(mismatch_count) + " mismatches")
+        sys.exit(1)
+    print("All backends returned the same tokens")
@@ -0,0 +1,135 @@
+import json
+
+# Phases of a query, in the order they run: preprocessing the query, looking terms up in the term dictionary
+# or secondary index, reading and scanning their term records in the index files, decoding posting blocks,
+# scoring, sorting the top k, and reading the titles of the results.
+PHASES = ["preprocess", "lookup", "scan", "decode", "score", "sort", "titles"]
+# Phases also recorded per query term.
+TERM_PHASES = ["lookup", "scan", "decode"]
+PERCENTILES = [50, 95, 99]
+
+
+def get_percentile(sorted_values, percentile):
+    # Nearest-rank percentile of a sorted list: the smallest value with at least percentile% of the values at or below it.
+    # The query traces, searchClient.py and benchmarkSuite.py all report percentiles with it, so their numbers compare.
+    if(len(sorted_values) == 0):
+        return 0.0
+    rank = max(int(round(percentile / 100.0 * len(sorted_values))) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+def get_percentiles(values):
+    # The p50, p95 and p99 of a list of values.
+    sorted_values = sorted(values)
+    return {"p" + str(percentile): get_percentile(sorted_values, percentile) for percentile in PERCENTILES}
+
+
+class QueryTrace:
+    def __init__(self, query):
+        # Initialize the trace of a query: the seconds spent in each phase and the bytes read, over the whole query and per term.
+        self.query = query
+        self.phase_times = {phase: 0.0 for phase in PHASES}
+        self.bytes_read = 0
+        self.query_cache_hit = False
+        self.total_time = 0.0
+        self.result_count = 0
+
+        # Statistics of every query term, the term being looked up, and the posting lists of every term,
+        # whose decoding counters are compared before and after scoring.
+        self.terms = []
+        self.cur_term = None
+        self.term_posting_lists = []
+        self.decode_snapshots = None
+
+    def start_term(self, word, field):
+        # Start recording the lookups and reads of a query term.
+        self.cur_term = {
+            "word": word,
+            "field": field,
+            "segments": 0,
+            "posting_cache_hits": 0,
+            "doc_count": 0,
+            "blocks": 0,
+            "blocks_decoded": 0,
+            "bytes_read": 0
+        }
+        for phase in TERM_PHASES:
+            self.cur_term[phase] = 0.0
+        self.terms.append(self.cur_term)
+        self.term_posting_lists.append([])
+
+    def end_term(self):
+        # Stop recording for the current query term.
+        self.cur_term = None
+
+    def add_time(self, phase, seconds):
+        # Add seconds to a phase of the query, and of the current term.
+        self.phase_times[phase] += seconds
+        if(self.cur_term is not None and phase in TERM_PHASES):
+            self.cur_term[phase] += seconds
+
+    def add_read(self, byte_count, seconds):
+        # Record a read of an index file.
+        self.add_time("scan", seconds)
+        self.bytes_read += byte_count
+        if(self.cur_term is not None):
+            self.cur_term["bytes_read"] += byte_count
+
+    def add_posting_list(self, postingList, cache_hit):
+        # Record a posting list of the current term in a segment.
+        self.cur_term["segments"] += 1
+        self.cur_term["doc_count"] += postingList.doc_count
+        self.cur_term["blocks"] += postingList.block_count
+        if(cache_hit):
+            self.cur_term["posting_cache_hits"] += 1
+        self.term_posting_lists[-1].append(postingList)
+
+    def _get_decode_counters(self):
+        # The seconds spent decoding blocks and the blocks decoded so far of the posting lists of every term.
+        return [(sum(postingList.decode_time for postingList in postingLists), sum(postingList.decoded_block_count for postingList in postingLists)) for postingLists in self.term_posting_lists]
+
+    def start_scoring(self):
+        # Snapshot the decoding counters of the terms' posting lists before scoring, which decodes their blocks lazily.
+        self.decode_snapshots = self._get_decode_counters()
+
+    def end_scoring(self, seconds):
+        # Split the seconds spent scoring into the decoding of posting blocks, attributed to their terms, and the scoring itself.
+        decode_time = 0.0
+        for term, (start_decode_time, start_block_count), (end_decode_time, end_block_count) in zip(self.terms, self.decode_snapshots, self._get_decode_counters()):
+            term["decode"] += end_decode_time - start_decode_time
+            term["blocks_decoded"] += end_block_count - start_block_count
+            decode_time += end_decode_time - start_decode_time
+        self.phase_times["decode"] += decode_time
+        self.phase_times["score"] += max(seconds - decode_time, 0.0)
+
+    def to_dict(self):
+        # The trace as a JSON-serializable dict, with times in milliseconds.
+        terms = []
+        for term in self.terms:
+            term_dict = dict(term)
+            for phase in TERM_PHASES:
+                term_dict[phase + "_ms"] = term_dict.pop(phase) * 1000
+            terms.append(term_dict)
+        return {
+            "query": self.query,
+            "total_ms": self.total_time * 1000,
+            "results": self.result_count,
+            "query_cache_hit": self.query_cache_hit,
+            "bytes_read": self.bytes_read,
+            "phases_ms": {phase: phase_time * 1000 for phase, phase_time in self.phase_times.items()},
+            "terms": terms
+        }
+
+    def to_json(self):
+        # The trace as a JSON line.
+        return json.dumps(self.to_dict())
+
+
+def summarize_traces(queryTraces):
+    # Aggregate the traces of a batch of queries: the percentiles of their total time, of each phase and of the bytes read.
+    return {
+        "queries": len(queryTraces),
+        "query_cache_hits": sum(1 for queryTrace in queryTraces if queryTrace.query_cache_hit),
+        "total_ms": get_percentiles([queryTrace.total_time * 1000 for queryTrace in queryTraces]),
+        "phases_ms": {phase: get_percentiles([queryTrace.phase_times[phase] * 1000 for queryTrace in queryTraces]) for phase in PHASES},
+        "bytes_read": get_percentiles([queryTrace.bytes_read for queryTrace in queryTraces])
+    }
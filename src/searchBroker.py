@@ -0,0 +1,239 @@
+# Libraries
+import os
+import json
+import time
+import heapq
+import socket
+import argparse
+import threading
+import http.client
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+
+import wikiSearch
+from segmentHandler import read_shard_manifest
+
+# Global Variables
+INDEX_FOLDER_PATH = "indexFolder"
+REQUEST_TIMEOUT = 10.0
+# Settings of wikiSearch handed down to the worker process of every local shard.
+SHARD_SETTINGS = ["PREPROCESSOR", "LOAD_TERM_DICTIONARY", "USE_DYNAMIC_PRUNING", "USE_NUMPY_SCORING", "QUERY_CACHE_SIZE", "POSTING_CACHE_SIZE"]
+
+
+def handle_shard_request(request):
+    # Answer a broker's request with the shard index loaded in wikiSearch.
+    # A "stats" request gets the query terms of a query and their document counts in the shard,
+    # and a "search" request the shard's top k for the query terms, scored with their document counts over all shards.
+    if(request["op"] == "stats"):
+        query_terms, term_doc_counts, term_found, doc_count = wikiSearch.get_query_term_stats(request["query"])
+        return {"query_terms": query_terms, "term_doc_counts": term_doc_counts, "term_found": term_found, "doc_count": doc_count}
+    if(request["op"] == "search"):
+        top_docs, query_processing_time = wikiSearch.process_shard_query(request["query_terms"], request["term_doc_counts"], request["doc_count"])
+        return {"results": top_docs, "processing_time": query_processing_time}
+    raise ValueError("Unknown shard request '" + str(request["op"]) + "'")
+
+def serve_local_shard(shard_path, settings, connection):
+    # Worker process of a local shard: load the shard's index, then answer the broker's requests on the pipe until told to stop.
+    # The pipe isn't merely closed, as the workers of the broker's other shards hold copies of its end.
+    for name, value in settings.items():
+        setattr(wikiSearch, name, value)
+    wikiSearch.load_index(shard_path)
+    while(True):
+        try:
+            request = connection.recv()
+        except EOFError:
+            break
+        if request is None:
+            break
+        try:
+            connection.send(handle_shard_request(request))
+        except Exception as error:
+            connection.send({"error": str(error)})
+
+
+class LocalShard:
+    def __init__(self, shard_path):
+        # Initialize a shard searched by a worker process of its own on this machine, which is asked over a pipe.
+        self.name = shard_path
+        self.lock = threading.Lock()
+        settings = {name: getattr(wikiSearch, name) for name in SHARD_SETTINGS}
+        self.connection, worker_connection = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target = serve_local_shard, args = (shard_path, settings, worker_connection), daemon = True)
+        self.process.start()
+        worker_connection.close()
+
+    def request(self, request):
+        # Send a request to the shard and wait for its response.
+        with self.lock:
+            try:
+                self.connection.send(request)
+                response = self.connection.recv()
+            except (EOFError, ConnectionError):
+                raise RuntimeError("Shard '" + self.name + "' stopped")
+        if "error" in response:
+            raise RuntimeError("Shard '" + self.name + "' failed: " + response["error"])
+        return response
+
+    def close(self):
+        # Stop the worker process of the shard.
+        with self.lock:
+            try:
+                self.connection.send(None)
+            except (BrokenPipeError, ConnectionError):
+                pass
+            self.connection.close()
+        self.process.join()
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, unix_socket_path, timeout):
+        # Initialize an HTTP connection over a Unix socket.
+        super().__init__("localhost", timeout = timeout)
+        self.unix_socket_path = unix_socket_path
+
+    def connect(self):
+        # Open the Unix socket.
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.unix_socket_path)
+
+
+class RemoteShard:
+    def __init__(self, endpoint, timeout):
+        # Initialize a shard served by a search server (see searchServer.py), at a host:port endpoint or a unix:<path> socket,
+        # which is asked over one HTTP connection kept alive between requests.
+        self.name = endpoint
+        self.lock = threading.Lock()
+        if(endpoint.startswith("unix:")):
+            self.connection = UnixHTTPConnection(endpoint[len("unix:"):], timeout)
+        else:
+            host, port = endpoint.rsplit(":", 1)
+            self.connection = http.client.HTTPConnection(host, int(port), timeout = timeout)
+
+    def request(self, request):
+        # Send a request to the shard and wait for its response, reconnecting once if the server closed the connection.
+        body = json.dumps(request)
+        with self.lock:
+            for attempt in range(2):
+                try:
+                    self.connection.request("POST", "/shard", body, {"Content-Type": "application/json"})
+                    response = self.connection.getresponse()
+                    status, payload = response.status, json.loads(response.read().decode('utf-8'))
+                    break
+                except (ConnectionError, http.client.RemoteDisconnected):
+                    self.connection.close()
+                    if(attempt == 1):
+                        raise RuntimeError("Shard '" + self.name + "' is unreachable")
+        if(status != 200):
+            raise RuntimeError("Shard '" + self.name + "' failed: " + payload.get("error", str(status)))
+        return payload
+
+    def close(self):
+        # Close the connection to the shard.
+        self.connection.close()
+
+
+class SearchBroker:
+    def __init__(self, shards):
+        # Initialize a SearchBroker over the shards of an index, in shard order.
+        # A query is scattered to every shard, which retrieves its own top k, and their top k are gathered into the global top k.
+        self.shards = shards
+        self.executor = ThreadPoolExecutor(len(shards))
+
+    def _scatter(self, request):
+        # Send a request to every shard at once, returning their responses in shard order.
+        return list(self.executor.map(lambda shard: shard.request(request), self.shards))
+
+    def process_query(self, query):
+        # Process a query over all shards, the same as wikiSearch.process_query over an unsharded index.
+        # The shards first count the documents of the query terms, and the IDF of every term is taken over their total,
+        # so the shards' scores compare and their top k merge into the global top k.
+        # A document's global docID is its docID in its shard times the shard count, plus the shard's index,
+        # which is its docID in an unsharded index of the dump.
+        # Returns the (docID, title, score) of the top-k documents and the processing time.
+        start_time = time.perf_counter()
+        shard_stats = self._scatter({"op": "stats", "query": query})
+        query_terms = shard_stats[0]["query_terms"]
+        term_doc_counts = []
+        for term_idx in range(len(query_terms)):
+            doc_count = 0
+            if any(stats["term_found"][term_idx] for stats in shard_stats):
+                doc_count = sum(stats["term_doc_counts"][term_idx] for stats in shard_stats)
+            term_doc_counts.append(doc_count)
+        doc_count = sum(stats["doc_count"] for stats in shard_stats)
+
+        shard_results = self._scatter({"op": "search", "query_terms": query_terms, "term_doc_counts": term_doc_counts, "doc_count": doc_count})
+        shard_top_k_docs = []
+        for shard_idx, response in enumerate(shard_results):
+            shard_top_k_docs.append([(docID * len(self.shards) + shard_idx, title, score) for docID, title, score in response["results"]])
+        # Every shard's top k comes sorted by score then docID, and global docIDs keep the order of a shard's docIDs,
+        # so documents with the same score come in ascending global docID order, as from an unsharded index.
+        topK_docs_details = list(heapq.merge(*shard_top_k_docs, key = lambda doc: (-doc[2], doc[0])))[:wikiSearch.k]
+        return topK_docs_details, time.perf_counter() - start_time
+
+    def close(self):
+        # Close the shards.
+        for shard in self.shards:
+            shard.close()
+        self.executor.shutdown()
+
+
+def get_local_shards(index_folder_path):
+    # Start a local shard for every shard of a sharded index folder.
+    manifest = read_shard_manifest(index_folder_path)
+    if manifest is None:
+        return None
+    return [LocalShard(os.path.join(index_folder_path, shard["name"])) for shard in manifest["shards"]]
+
+
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser(description = "Search a sharded index, scattering every query to its shards and gathering their top k.")
+    argParser.add_argument("index_folder_path", nargs = "?", default = None, help = "path to a sharded index folder, whose shards are searched by local worker processes")
+    argParser.add_argument("--endpoints", nargs = "+", default = None, help = "search servers of the shards, in shard order, as host:port or unix:<socket_path>, instead of local shards")
+    target = argParser.add_mutually_exclusive_group(required = True)
+    target.add_argument("--query", help = "run a single query and print its results")
+    target.add_argument("--query-file", help = "run the queries of this file, one per line, writing their results to query_out.txt")
+    argParser.add_argument("--timeout", type = float, default = REQUEST_TIMEOUT, help = "timeout of the requests to search servers, in seconds (default: %(default)s)")
+    args = argParser.parse_args()
+
+    if(args.endpoints is not None):
+        shards = [RemoteShard(endpoint, args.timeout) for endpoint in args.endpoints]
+    elif(args.index_folder_path is not None):
+        INDEX_FOLDER_PATH = os.path.abspath(args.index_folder_path)
+        shards = get_local_shards(INDEX_FOLDER_PATH)
+        if shards is None:
+            print("No shards in the index folder, build it with wikiIndexer.py --shards")
+            exit(1)
+    else:
+        argParser.error("Expected a sharded index folder or --endpoints")
+
+    searchBroker = SearchBroker(shards)
+    try:
+        if(args.query is not None):
+            queries = [args.query]
+        else:
+            with open(args.query_file, "r", encoding='utf-8') as query_in_fp:
+                queries = [query.strip("\n").strip(" ") for query in query_in_fp if query.strip("\n").strip(" ") != ""]
+
+        start_time = time.perf_counter()
+        lines = ["----------------------------------------------------------"]
+        for query in queries:
+            top_docs, query_processing_time = searchBroker.process_query(query)
+            lines.append("Query: '" + query + "'")
+            for docID, doc_title, score in top_docs:
+                lines.append(str(docID) + ", " + doc_title)
+            lines.append("Processing Time: %.2f seconds" % query_processing_time)
+            lines.append("----------------------------------------------------------")
+        total_processing_time = time.perf_counter() - start_time
+
+        if(args.query is not None):
+            print("\n".join(lines))
+        else:
+            lines.append("Total Processing Time: %.2f seconds" % total_processing_time)
+            lines.append("----------------------------------------------------------")
+            with open("query_out.txt", "w", encoding='utf-8') as query_out_fp:
+                query_out_fp.write("\n".join(lines) + "\n")
+            print("Queries Executed Successfully in %.2f seconds" % total_processing_time)
+            print("Queries output written to the file 'query_out.txt'")
+    finally:
+        searchBroker.close()
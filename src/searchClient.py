@@ -0,0 +1,126 @@
+# Libraries
+import json
+import time
+import asyncio
+import argparse
+
+from queryTrace import get_percentile
+
+# Global Variables
+HOST = "127.0.0.1"
+PORT = 8080
+CONCURRENCY = 8
+REPEAT = 1
+
+
+class SearchClient:
+    def __init__(self, host, port, unix_socket_path = None):
+        # Initialize a SearchClient keeping one connection to a search server.
+        self.host = host
+        self.port = port
+        self.unix_socket_path = unix_socket_path
+        self.reader = None
+        self.writer = None
+
+    async def _connect(self):
+        # Open the connection to the search server.
+        if(self.unix_socket_path is not None):
+            self.reader, self.writer = await asyncio.open_unix_connection(self.unix_socket_path)
+        else:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    async def search(self, query):
+        # Send a query, returning the status and the decoded JSON response.
+        if(self.writer is None):
+            await self._connect()
+        body = json.dumps({"query": query}).encode('utf-8')
+        head = "POST /search HTTP/1.1\r\n"
+        head += "Host: " + self.host + "\r\n"
+        head += "Content-Type: application/json\r\n"
+        head += "Content-Length: " + str(len(body)) + "\r\n\r\n"
+        self.writer.write(head.encode('latin-1') + body)
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        status = int(status_line.decode('latin-1').split(" ")[1])
+        headers = {}
+        while(True):
+            line = (await self.reader.readline()).decode('latin-1').rstrip("\r\n")
+            if(line == ""):
+                break
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+        response = await self.reader.readexactly(int(headers["content-length"]))
+        if(headers.get("connection", "").lower() == "close"):
+            await self.close()
+        return status, json.loads(response.decode('utf-8'))
+
+    async def close(self):
+        # Close the connection to the search server.
+        if(self.writer is not None):
+            self.writer.close()
+            await self.writer.wait_closed()
+            self.writer = None
+
+
+async def run_load_test(queries, host, port, unix_socket_path, concurrency):
+    # Send all queries through `concurrency` concurrent clients, returning their latencies and the error count.
+    pending = list(reversed(queries))
+    latencies = []
+    errors = [0]
+
+    async def run_client():
+        searchClient = SearchClient(host, port, unix_socket_path)
+        while(len(pending) > 0):
+            query = pending.pop()
+            start_time = time.perf_counter()
+            try:
+                status, response = await searchClient.search(query)
+                if(status != 200):
+                    errors[0] += 1
+            except (ConnectionError, asyncio.IncompleteReadError):
+                errors[0] += 1
+                await searchClient.close()
+            latencies.append(time.perf_counter() - start_time)
+        await searchClient.close()
+
+    await asyncio.gather(*[run_client() for _ in range(concurrency)])
+    return latencies, errors[0]
+
+
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser(description = "Query a search server, or load test it with a query file.")
+    target = argParser.add_mutually_exclusive_group(required = True)
+    target.add_argument("--query", help = "run a single query and print its results")
+    target.add_argument("--query-file", help = "load test the server with the queries of this file, one per line")
+    argParser.add_argument("--host", default = HOST, help = "server host (default: %(default)s)")
+    argParser.add_argument("--port", type = int, default = PORT, help = "server port (default: %(default)s)")
+    argParser.add_argument("--unix-socket", default = None, help = "connect to this Unix socket path instead")
+    argParser.add_argument("--concurrency", type = int, default = CONCURRENCY, help = "number of concurrent clients (default: %(default)s)")
+    argParser.add_argument("--repeat", type = int, default = REPEAT, help = "number of times to send the query file (default: %(default)s)")
+    args = argParser.parse_args()
+
+    if(args.query is not None):
+        async def run_query():
+            searchClient = SearchClient(args.host, args.port, args.unix_socket)
+            status, response = await searchClient.search(args.query)
+            await searchClient.close()
+            return status, response
+        status, response = asyncio.run(run_query())
+        print(json.dumps(response, indent = 2))
+    else:
+        with open(args.query_file, "r", encoding='utf-8') as query_in_fp:
+            queries = [query.strip("\n").strip(" ") for query in query_in_fp if query.strip("\n").strip(" ") != ""]
+        queries = queries * args.repeat
+
+        start_time = time.perf_counter()
+        latencies, error_count = asyncio.run(run_load_test(queries, args.host, args.port, args.unix_socket, args.concurrency))
+        total_time = time.perf_counter() - start_time
+
+        latencies.sort()
+        print("Requests: \t\t" + str(len(latencies)))
+        print("Errors: \t\t" + str(error_count))
+        print("Throughput: \t\t%.2f queries/second" % (len(latencies) / total_time))
+        print("Latency p50: \t\t%.2f ms" % (get_percentile(latencies, 50) * 1000))
+        print("Latency p95: \t\t%.2f ms" % (get_percentile(latencies, 95) * 1000))
+        print("Latency p99: \t\t%.2f ms" % (get_percentile(latencies, 99) * 1000))
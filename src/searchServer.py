@@ -0,0 +1,212 @@
+# Libraries
+import os
+import json
+import time
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+
+import wikiSearch
+from searchBroker import handle_shard_request
+
+# Global Variables
+INDEX_FOLDER_PATH = "indexFolder"
+HOST = "127.0.0.1"
+PORT = 8080
+SEARCH_WORKER_COUNT = 4
+REQUEST_TIMEOUT = 10.0
+MAX_REQUEST_BODY_SIZE = 65536
+
+HTTP_STATUS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    408: "Request Timeout",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+    504: "Gateway Timeout"
+}
+
+
+class SearchServer:
+    def __init__(self, SEARCH_WORKER_COUNT, REQUEST_TIMEOUT):
+        # Initialize the SearchServer, which answers queries over HTTP against the index loaded in wikiSearch.
+        # Queries run in a pool of threads, so the event loop keeps serving other clients meanwhile.
+        self.REQUEST_TIMEOUT = REQUEST_TIMEOUT
+        self.executor = ThreadPoolExecutor(SEARCH_WORKER_COUNT)
+
+        # Initialize counters for statistics.
+        self.request_count = 0
+        self.timeout_count = 0
+        self.error_count = 0
+
+    async def _read_request(self, reader):
+        # Read an HTTP request, returning its method, target, headers and body, or None once the client is gone.
+        # A connection idle for longer than the request timeout is closed, and the rest of the request has to arrive
+        # within the request timeout too, so slow clients can't hold connections open.
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), self.REQUEST_TIMEOUT)
+        except asyncio.TimeoutError:
+            return None
+        if(request_line == b""):
+            return None
+        method, target, version = request_line.decode('latin-1').rstrip("\r\n").split(" ")
+        headers, body = await asyncio.wait_for(self._read_headers_and_body(reader), self.REQUEST_TIMEOUT)
+        return method, target, headers, body
+
+    async def _read_headers_and_body(self, reader):
+        # Read the headers and body of an HTTP request after its request line.
+        headers = {}
+        while(True):
+            line = await reader.readline()
+            line = line.decode('latin-1').rstrip("\r\n")
+            if(line == ""):
+                break
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+
+        body = b""
+        content_length = int(headers.get("content-length", 0))
+        if(content_length > MAX_REQUEST_BODY_SIZE):
+            raise ValueError("Request body too large")
+        if(content_length > 0):
+            body = await reader.readexactly(content_length)
+        return headers, body
+
+    async def _write_response(self, writer, status, payload, keep_alive):
+        # Write a JSON response.
+        body = json.dumps(payload).encode('utf-8')
+        head = "HTTP/1.1 " + str(status) + " " + HTTP_STATUS[status] + "\r\n"
+        head += "Content-Type: application/json\r\n"
+        head += "Content-Length: " + str(len(body)) + "\r\n"
+        head += "Connection: " + ("keep-alive" if keep_alive else "close") + "\r\n\r\n"
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+
+    async def _run_query(self, function, *args):
+        # Run a query function in the thread pool, within the request timeout. The query gets the same deadline,
+        # so once the request timed out it stops, or doesn't start if it's still waiting for a thread.
+        loop = asyncio.get_running_loop()
+        deadline = time.perf_counter() + self.REQUEST_TIMEOUT
+        return await asyncio.wait_for(loop.run_in_executor(self.executor, wikiSearch.run_with_deadline, deadline, function, *args), self.REQUEST_TIMEOUT)
+
+    async def search(self, query):
+        # Process a query in the thread pool, within the request timeout.
+        top_docs, query_processing_time = await self._run_query(wikiSearch.process_query, query)
+        return {
+            "query": query,
+            "results": [{"docID": docID, "title": doc_title, "score": score} for docID, doc_title, score in top_docs],
+            "processing_time": query_processing_time
+        }
+
+    async def shard_request(self, request):
+        # Answer the request of a broker searching the index as one shard of a sharded index, within the request timeout.
+        return await self._run_query(handle_shard_request, request)
+
+    async def _route(self, method, target, body):
+        # Dispatch a request, returning the status and the JSON payload of the response.
+        url = urlsplit(target)
+        if(url.path == "/health"):
+            return 200, {"status": "ok", "requests": self.request_count, "timeouts": self.timeout_count, "errors": self.error_count, "caches": wikiSearch.get_cache_stats()}
+        if(url.path == "/shard"):
+            if(method != "POST"):
+                return 405, {"error": "Expected POST"}
+            self.request_count += 1
+            try:
+                return 200, await self.shard_request(json.loads(body.decode('utf-8')))
+            except asyncio.TimeoutError:
+                self.timeout_count += 1
+                return 504, {"error": "Query timed out after %.2f seconds" % self.REQUEST_TIMEOUT}
+        if(url.path != "/search"):
+            return 404, {"error": "Unknown path '" + url.path + "'"}
+
+        if(method == "GET"):
+            query = parse_qs(url.query).get("q", [""])[0]
+        elif(method == "POST"):
+            query = json.loads(body.decode('utf-8')).get("query", "")
+        else:
+            return 405, {"error": "Expected GET or POST"}
+
+        query = query.strip(" ")
+        if(query == ""):
+            return 400, {"error": "Empty query"}
+
+        self.request_count += 1
+        try:
+            return 200, await self.search(query)
+        except asyncio.TimeoutError:
+            self.timeout_count += 1
+            return 504, {"error": "Query timed out after %.2f seconds" % self.REQUEST_TIMEOUT}
+
+    async def handle_connection(self, reader, writer):
+        # Serve the requests of one client connection, keeping it alive between requests.
+        try:
+            while(True):
+                try:
+                    request = await self._read_request(reader)
+                except (ValueError, UnicodeDecodeError):
+                    await self._write_response(writer, 400, {"error": "Malformed request"}, False)
+                    break
+                except asyncio.TimeoutError:
+                    await self._write_response(writer, 408, {"error": "Request not received within %.2f seconds" % self.REQUEST_TIMEOUT}, False)
+                    break
+                if(request is None):
+                    break
+                method, target, headers, body = request
+                keep_alive = headers.get("connection", "keep-alive").lower() != "close"
+
+                try:
+                    status, payload = await self._route(method, target, body)
+                except (ValueError, AttributeError):
+                    status, payload = 400, {"error": "Malformed request"}
+                except Exception as error:
+                    self.error_count += 1
+                    status, payload = 500, {"error": str(error)}
+                await self._write_response(writer, status, payload, keep_alive)
+                if(not keep_alive):
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host, port, unix_socket_path = None):
+        # Listen on a TCP port, or on a Unix socket when a path is given, until cancelled.
+        if(unix_socket_path is not None):
+            if(os.path.exists(unix_socket_path)):
+                os.remove(unix_socket_path)
+            server = await asyncio.start_unix_server(self.handle_connection, path = unix_socket_path)
+            print("Serving on unix socket '" + unix_socket_path + "'")
+        else:
+            server = await asyncio.start_server(self.handle_connection, host, port)
+            print("Serving on http://" + host + ":" + str(port))
+        async with server:
+            await server.serve_forever()
+
+
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser(description = "Serve queries over HTTP with the index kept in memory.")
+    argParser.add_argument("index_folder_path", help = "path to the index folder")
+    argParser.add_argument("--host", default = HOST, help = "host to listen on (default: %(default)s)")
+    argParser.add_argument("--port", type = int, default = PORT, help = "port to listen on (default: %(default)s)")
+    argParser.add_argument("--unix-socket", default = None, help = "listen on this Unix socket path instead of a TCP port")
+    argParser.add_argument("--workers", type = int, default = SEARCH_WORKER_COUNT, help = "number of threads processing queries (default: %(default)s)")
+    argParser.add_argument("--timeout", type = float, default = REQUEST_TIMEOUT, help = "request timeout in seconds (default: %(default)s)")
+    argParser.add_argument("--query-cache-mb", type = float, default = wikiSearch.QUERY_CACHE_SIZE / (1024 * 1024), help = "memory budget of the query-result cache in MB (default: %(default)s)")
+    argParser.add_argument("--posting-cache-mb", type = float, default = wikiSearch.POSTING_CACHE_SIZE / (1024 * 1024), help = "memory budget of the posting-list cache in MB (default: %(default)s)")
+    args = argParser.parse_args()
+
+    INDEX_FOLDER_PATH = os.path.abspath(args.index_folder_path)
+    wikiSearch.QUERY_CACHE_SIZE = int(args.query_cache_mb * 1024 * 1024)
+    wikiSearch.POSTING_CACHE_SIZE = int(args.posting_cache_mb * 1024 * 1024)
+
+    # Load the index once; it stays resident for every request.
+    wikiSearch.load_index(INDEX_FOLDER_PATH)
+
+    searchServer = SearchServer(args.workers, args.timeout)
+    try:
+        asyncio.run(searchServer.serve(args.host, args.port, args.unix_socket))
+    except KeyboardInterrupt:
+        print("Search server stopped")
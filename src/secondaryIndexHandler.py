@@ -1,33 +1,60 @@
 import os
+from array import array
+from bisect import bisect_right
+
+import postingCodec
+
+class PackedWords:
+    def __init__(self, words_blob, word_offsets):
+        # Sorted words packed into one utf-8 blob, word i spanning word_offsets[i] to word_offsets[i + 1].
+        # Words compare as utf-8 bytes, which sort in the same order as the strings.
+        self.words_blob = words_blob
+        self.word_offsets = word_offsets
+
+    def __len__(self):
+        return len(self.word_offsets) - 1
+
+    def __getitem__(self, idx):
+        return self.words_blob[self.word_offsets[idx]: self.word_offsets[idx + 1]]
+
 
 class SecondaryIndexHandler:
-    def __init__(self, INDEX_FOLDER_PATH):
+    def __init__(self, INDEX_FOLDER_PATH, SECONDARY_INDEX_SAMPLE_RATE = 64):
         # Initialize the SecondaryIndexHandler with the folder path.
+        # Every SECONDARY_INDEX_SAMPLE_RATE-th term of each primary index file (and always its first term)
+        # is kept with its byte offset, so a term lies in the block between two consecutive entries.
         self.INDEX_FOLDER_PATH = INDEX_FOLDER_PATH
+        self.SECONDARY_INDEX_SAMPLE_RATE = SECONDARY_INDEX_SAMPLE_RATE
         self.SecondaryIndexFileCount = 1
         self.secondary_index_file_name = "secondary_index.txt"
-        self.secondary_index_word = []
+
+        # Sorted entries, stored as packed words and parallel arrays of index file indices and offsets.
+        self.secondary_index_word = None
+        self.secondary_index_file_idx = array("I")
+        self.secondary_index_offset = array("Q")
+
+    def _get_index_files(self):
+        # List the primary index files in index order.
+        index_files = []
+        for file in os.listdir(self.INDEX_FOLDER_PATH):
+            if(file.startswith("index_") and file.endswith(postingCodec.INDEX_FILE_EXTENSION)):
+                index_files.append((int(file[len("index_"): -len(postingCodec.INDEX_FILE_EXTENSION)]), file))
+        index_files.sort()
+        return index_files
 
     def build_secondary_index(self):
         # Build the secondary index from the primary index files.
 
         print("Secondary Index Creation Started")
 
-        # Iterate through files in the index folder.
-        for file in os.listdir(self.INDEX_FOLDER_PATH):
-            if(file.startswith("index_")):
-                with open(os.path.join(self.INDEX_FOLDER_PATH, file), "r", encoding='utf-8') as fp:
-                    # Read the first line of each primary index file and extract the word.
-                    line = fp.readline().strip("\n").split("=")
-                    self.secondary_index_word.append(line[0])
-        
-        # Sort the list of words since files are picked up in a random order.
-        self.secondary_index_word.sort()
-
-        # Write the sorted words to the secondary index file.
+        # Sample the terms of the primary index files, which hold consecutive ranges of the sorted words.
         with open(os.path.join(self.INDEX_FOLDER_PATH, self.secondary_index_file_name), "w", encoding='utf-8') as secondary_fp:
-            for word in self.secondary_index_word:
-                secondary_fp.write(word + "\n")
+            for index_file_idx, file in self._get_index_files():
+                with open(os.path.join(self.INDEX_FOLDER_PATH, file), "rb") as fp:
+                    data = postingCodec.read_index_file(fp)
+                for record_idx, (word, offset, record) in enumerate(postingCodec.iter_term_records(data)):
+                    if(record_idx % self.SECONDARY_INDEX_SAMPLE_RATE == 0):
+                        secondary_fp.write(word + "=" + str(index_file_idx) + "=" + str(offset) + "\n")
 
         print("Secondary Index Creation Completed")
 
@@ -35,23 +62,39 @@ class SecondaryIndexHandler:
     def load_secondary_index(self):
         # Load the secondary index from the secondary index file.
 
+        words_blob = bytearray()
+        word_offsets = array("Q", [0])
         with open(os.path.join(self.INDEX_FOLDER_PATH, self.secondary_index_file_name), "r", encoding='utf-8') as secondary_fp:
-            lines = secondary_fp.readlines()
-            for line in lines:
-                word = line.strip("\n")
-                self.secondary_index_word.append(word)
+            for line in secondary_fp:
+                word, index_file_idx, offset = line.rstrip("\n").split("=")
+                words_blob += word.encode('utf-8')
+                word_offsets.append(len(words_blob))
+                self.secondary_index_file_idx.append(int(index_file_idx))
+                self.secondary_index_offset.append(int(offset))
+        self.secondary_index_word = PackedWords(bytes(words_blob), word_offsets)
 
         print("Secondary Index Got Loaded")
 
 
+    def _get_entry_idx(self, word):
+        # Binary search for the last entry not greater than the word.
+        # Words before the first entry aren't indexed, and are looked up in the first block.
+        return max(bisect_right(self.secondary_index_word, word.encode('utf-8')) - 1, 0)
+
     def get_index_file_idx(self, word):
         # Get the index of the primary index file for a given word.
+        if(len(self.secondary_index_word) == 0):
+            return 0
+        return self.secondary_index_file_idx[self._get_entry_idx(word)]
 
-        for idx, entry in enumerate(self.secondary_index_word):
-            if(word < entry):
-                # Return the previous index since the list is sorted.
-                return idx - 1
-        # Return the last index if the word is greater than all entries.
-        return len(self.secondary_index_word) - 1 
-
-
+    def get_term_block(self, word):
+        # Get the primary index file of a word, and the byte range of the block of terms holding it.
+        # The end offset is None when the block runs up to the end of the file.
+        if(len(self.secondary_index_word) == 0):
+            return 0, len(postingCodec.INDEX_FILE_HEADER), None
+        entry_idx = self._get_entry_idx(word)
+        index_file_idx = self.secondary_index_file_idx[entry_idx]
+        end_offset = None
+        if(entry_idx + 1 < len(self.secondary_index_word) and self.secondary_index_file_idx[entry_idx + 1] == index_file_idx):
+            end_offset = self.secondary_index_offset[entry_idx + 1]
+        return index_file_idx, self.secondary_index_offset[entry_idx], end_offset
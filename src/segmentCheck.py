@@ -0,0 +1,145 @@
+# Libraries
+import os
+import sys
+import shutil
+import argparse
+import tempfile
+import subprocess
+import contextlib
+
+from dumpGenerator import DumpGenerator, VOCABULARY_SIZE, ZIPF_EXPONENT, BODY_WORDS, INFOBOX_FIELDS, CATEGORY_COUNT, REFERENCE_COUNT, EXTERNAL_LINK_COUNT, SEED
+from segmentHandler import SEGMENT_FOLDER_PREFIX, DELETED_DOCS_FILE_NAME, read_segment_manifest, get_segment_path, get_pending_deleted_count
+from benchmarkSuite import SCORERS, make_queries, set_scorer
+import numpyScorer
+import wikiSearch
+
+# Global Variables
+PAGE_COUNT = 1000
+DELTA_PAGE_COUNT = 250
+REBUILD_PAGE_COUNT = 100
+QUERY_COUNT = 200
+FIELD_QUERY_FRACTION = 0.25
+# Every DELETE_STEP-th document of the index is deleted before the compaction.
+DELETE_STEP = 7
+SCORE_DIGITS = 9
+SRC_FOLDER_PATH = os.path.dirname(os.path.abspath(__file__))
+
+
+def run_script(script_name, script_args):
+    # Run one of the command line scripts of the index, failing on its errors.
+    subprocess.run([sys.executable, os.path.join(SRC_FOLDER_PATH, script_name)] + script_args, check = True, stdout = subprocess.DEVNULL)
+
+def write_dump(wiki_dump_path, seed, page_count):
+    # Write a synthetic dump of page_count pages, returning its DumpGenerator to draw queries from the same vocabulary.
+    dumpGenerator = DumpGenerator(seed, VOCABULARY_SIZE, ZIPF_EXPONENT, BODY_WORDS, INFOBOX_FIELDS, CATEGORY_COUNT, REFERENCE_COUNT, EXTERNAL_LINK_COUNT)
+    with open(wiki_dump_path, "w", encoding = "utf-8") as dump_fp:
+        dumpGenerator.write_dump(dump_fp, page_count)
+    return dumpGenerator
+
+def search_all(index_folder_path, queries, scorers):
+    # The (docID, title, score) results of every query with every scorer, from a freshly loaded index.
+    wikiSearch.QUERY_CACHE_SIZE = 0
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        wikiSearch.load_index(index_folder_path)
+    results = {}
+    for scorer in scorers:
+        set_scorer(scorer)
+        results[scorer] = [[(docID, title, round(score, SCORE_DIGITS)) for docID, title, score in wikiSearch.process_query(query)[0]] for query in queries]
+    return results
+
+def check_compaction(work_dir, queries, scorers, deleted_docIDs):
+    # Search the index before and after segmentMerger.py --compact drops the postings of its deleted documents.
+    # Returns the number of mismatches: deleted documents in the results, or results changed by the compaction.
+    index_folder_path = os.path.join(work_dir, "indexFolder")
+    before = search_all(index_folder_path, queries, scorers)
+    run_script("segmentMerger.py", [index_folder_path, "--compact"])
+    manifest_segments = read_segment_manifest(index_folder_path)["segments"]
+    if any(get_pending_deleted_count(segment) > 0 for segment in manifest_segments):
+        print("Mismatch: segments still hold the postings of deleted documents after the compaction")
+        return 1
+    after = search_all(index_folder_path, queries, scorers)
+
+    mismatch_count = 0
+    for scorer in scorers:
+        for query, expected, result in zip(queries, before[scorer], after[scorer]):
+            if any(docID in deleted_docIDs for docID, title, score in expected):
+                mismatch_count += 1
+                print("Mismatch: scorer '" + scorer + "', query '" + query + "' returned a deleted document")
+            if(expected != result):
+                mismatch_count += 1
+                print("Mismatch: scorer '" + scorer + "', query '" + query + "' changed by the compaction")
+    return mismatch_count
+
+def check_rebuild(work_dir, old_dump_path, old_page_count, seed, stat_file_path):
+    # Index a dump and delete every DELETE_STEP-th document, then rebuild the index over its folder from a smaller dump,
+    # and delete two of its documents.
+    # Returns the number of mismatches: tombstones or segments left over from the old index, or wrong deleted counts.
+    index_folder_path = os.path.join(work_dir, "rebuildIndexFolder")
+    shutil.rmtree(index_folder_path, ignore_errors = True)
+    run_script("wikiIndexer.py", [old_dump_path, index_folder_path, stat_file_path])
+    run_script("documentDeleter.py", [index_folder_path, "--doc-id"] + [str(docID) for docID in range(0, old_page_count, DELETE_STEP)])
+    wiki_dump_path = os.path.join(work_dir, "rebuild_dump.xml")
+    write_dump(wiki_dump_path, seed + 2, REBUILD_PAGE_COUNT)
+    run_script("wikiIndexer.py", [wiki_dump_path, index_folder_path, stat_file_path])
+
+    mismatch_count = 0
+    manifest_segments = read_segment_manifest(index_folder_path)["segments"]
+    if(len(manifest_segments) != 1 or manifest_segments[0].get("deleted_count", 0) != 0):
+        mismatch_count += 1
+        print("Mismatch: the rebuilt index kept the segments or deletes of the old one")
+    if any(entry.name.startswith(SEGMENT_FOLDER_PREFIX) for entry in os.scandir(index_folder_path)):
+        mismatch_count += 1
+        print("Mismatch: the rebuilt index folder kept the old segment folders")
+    if os.path.exists(os.path.join(get_segment_path(index_folder_path, ""), DELETED_DOCS_FILE_NAME)):
+        mismatch_count += 1
+        print("Mismatch: the rebuilt index kept the old tombstone bitmap")
+
+    run_script("documentDeleter.py", [index_folder_path, "--doc-id", "0", str(REBUILD_PAGE_COUNT // 2)])
+    for segment in read_segment_manifest(index_folder_path)["segments"]:
+        if(segment.get("deleted_count", 0) != 2 or segment.get("deleted_count", 0) > segment["doc_count"]):
+            mismatch_count += 1
+            print("Mismatch: segment '" + segment["name"] + "' has " + str(segment.get("deleted_count", 0)) + " deleted of " + str(segment["doc_count"]) + " documents")
+    return mismatch_count
+
+
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser(description = "Check that deleting documents, compacting segments and rebuilding an index keep search results and counts consistent.")
+    argParser.add_argument("--pages", type = int, default = PAGE_COUNT, help = "number of pages of the synthetic dump (default: %(default)s)")
+    argParser.add_argument("--delta-pages", type = int, default = DELTA_PAGE_COUNT, help = "number of pages of the delta dump added as a second segment (default: %(default)s)")
+    argParser.add_argument("--queries", type = int, default = QUERY_COUNT, help = "number of queries (default: %(default)s)")
+    argParser.add_argument("--seed", type = int, default = SEED, help = "random seed of the dumps and the queries (default: %(default)s)")
+    argParser.add_argument("--work-dir", default = None, help = "folder to write the dumps and the index to, kept afterwards (default: a temporary folder)")
+    args = argParser.parse_args()
+
+    scorers = [scorer for scorer in SCORERS if scorer != "numpy" or numpyScorer.is_available()]
+    work_dir = args.work_dir if args.work_dir is not None else tempfile.mkdtemp(prefix = "wikiSearchSegmentCheck_")
+    os.makedirs(work_dir, exist_ok = True)
+    index_folder_path = os.path.join(work_dir, "indexFolder")
+    stat_file_path = os.path.join(work_dir, "stats.txt")
+    shutil.rmtree(index_folder_path, ignore_errors = True)
+
+    try:
+        # An index of two segments, with every DELETE_STEP-th document of both deleted.
+        wiki_dump_path = os.path.join(work_dir, "synthetic_dump.xml")
+        delta_dump_path = os.path.join(work_dir, "delta_dump.xml")
+        dumpGenerator = write_dump(wiki_dump_path, args.seed, args.pages)
+        write_dump(delta_dump_path, args.seed + 1, args.delta_pages)
+        run_script("wikiIndexer.py", [wiki_dump_path, index_folder_path, stat_file_path])
+        run_script("wikiIndexer.py", [delta_dump_path, index_folder_path, stat_file_path, "--add", "--no-merge"])
+        deleted_docIDs = set(range(0, args.pages + args.delta_pages, DELETE_STEP))
+        run_script("documentDeleter.py", [index_folder_path, "--doc-id"] + [str(docID) for docID in sorted(deleted_docIDs)])
+        print("Pages: \t\t\t" + str(args.pages) + " + " + str(args.delta_pages) + ", " + str(len(deleted_docIDs)) + " deleted")
+
+        queries = make_queries(dumpGenerator, args.queries, FIELD_QUERY_FRACTION)
+        mismatch_count = check_compaction(work_dir, queries, scorers, deleted_docIDs)
+        print("Compaction: \t\t" + str(len(queries)) + " queries, scorers " + ", ".join(scorers))
+        mismatch_count += check_rebuild(work_dir, delta_dump_path, args.delta_pages, args.seed, stat_file_path)
+        print("Rebuild: \t\t" + str(args.delta_pages) + " pages, then " + str(REBUILD_PAGE_COUNT) + " pages, 2 deleted")
+    finally:
+        if(args.work_dir is None):
+            shutil.rmtree(work_dir, ignore_errors = True)
+
+    if(mismatch_count > 0):
+        print(str(mismatch_count) + " mismatches")
+        sys.exit(1)
+    print("Deletes, compaction and rebuilds kept the search results and counts consistent")
@@ -0,0 +1,388 @@
+import os
+import json
+import time
+import fcntl
+import shutil
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
+
+import postingCodec
+from titleHandler import TitleHandler, TITLE_OFFSETS_FILE_NAME, TITLE_OFFSET_STRUCT
+from dictionaryHandler import DictionaryHandler
+from secondaryIndexHandler import SecondaryIndexHandler
+
+# An index folder holds one or more segments, each a self-contained index (index files, term dictionary,
+# secondary index and titles) over a contiguous range of docIDs starting at its docID base.
+# The index built from a full dump is the segment stored in the index folder itself (named ""),
+# and each delta dump added to it is a segment_N sub-folder.
+# segments.json lists the segments in docID order, and is only ever replaced in one step, under segments.lock.
+SEGMENT_MANIFEST_FILE_NAME = "segments.json"
+SEGMENT_LOCK_FILE_NAME = "segments.lock"
+SEGMENT_FOLDER_PREFIX = "segment_"
+
+# An index folder can instead be split into document-partitioned shards, each a shard_N sub-folder holding an index folder
+# of its own over every N-th document of the dump. shards.json lists them in shard order.
+SHARD_MANIFEST_FILE_NAME = "shards.json"
+SHARD_FOLDER_PREFIX = "shard_"
+
+# Bytes read to decode a term header without its blocks, enough for the longest word and the largest counts.
+TERM_HEADER_READ_SIZE = 256
+
+# Term records read together, in file order, are read with a single read when the gap between them is at most this many bytes.
+TERM_READ_GAP = 64 * 1024
+
+# Deleted documents of a segment are marked in its tombstone bitmap, where bit docID % 8 of byte docID // 8 is set
+# for a deleted local docID. The manifest counts the tombstones of each segment, and how many of them already had
+# their postings dropped by a merge.
+DELETED_DOCS_FILE_NAME = "deleted_docs.bin"
+
+# Prefixes of the files of a segment.
+SEGMENT_FILE_PREFIXES = ["index_", "term_dictionary", "secondary_index", "title_", "deleted_docs"]
+
+
+def get_segment_path(INDEX_FOLDER_PATH, segment_name):
+    # Folder of a segment of an index folder.
+    return os.path.join(INDEX_FOLDER_PATH, segment_name)
+
+def get_title_count(segment_path):
+    # Number of titles, and so of documents, in the title store of a segment.
+    offsets_path = os.path.join(segment_path, TITLE_OFFSETS_FILE_NAME)
+    if(not os.path.isfile(offsets_path)):
+        return 0
+    return max(os.path.getsize(offsets_path) // TITLE_OFFSET_STRUCT.size - 1, 0)
+
+def get_index_file_indices(segment_path):
+    # Indices of the primary index files of a segment, in index order.
+    index_file_indices = []
+    for file in os.listdir(segment_path):
+        if(file.startswith("index_") and file.endswith(postingCodec.INDEX_FILE_EXTENSION)):
+            index_file_indices.append(int(file[len("index_"): -len(postingCodec.INDEX_FILE_EXTENSION)]))
+    return sorted(index_file_indices)
+
+def get_index_file_name(index_file_idx):
+    # Name of the primary index file with the given index.
+    return "index_" + str(index_file_idx) + postingCodec.INDEX_FILE_EXTENSION
+
+def read_segment_manifest(INDEX_FOLDER_PATH):
+    # Read the segment manifest of an index folder.
+    # An index folder without one was built before segments, and is a single segment in the folder itself.
+    manifest_path = os.path.join(INDEX_FOLDER_PATH, SEGMENT_MANIFEST_FILE_NAME)
+    if(not os.path.isfile(manifest_path)):
+        return {"next_segment_id": 1, "segments": [{"name": "", "doc_base": 0, "doc_count": get_title_count(INDEX_FOLDER_PATH)}]}
+    with open(manifest_path, "r", encoding='utf-8') as manifest_fp:
+        return json.load(manifest_fp)
+
+def write_segment_manifest(INDEX_FOLDER_PATH, manifest):
+    # Replace the segment manifest of an index folder in one step, so readers see either the old or the new one.
+    manifest_path = os.path.join(INDEX_FOLDER_PATH, SEGMENT_MANIFEST_FILE_NAME)
+    with open(manifest_path + ".tmp", "w", encoding='utf-8') as manifest_fp:
+        json.dump(manifest, manifest_fp, indent = 2)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+def read_shard_manifest(INDEX_FOLDER_PATH):
+    # Read the shard manifest of an index folder, or None if the index isn't sharded.
+    manifest_path = os.path.join(INDEX_FOLDER_PATH, SHARD_MANIFEST_FILE_NAME)
+    if(not os.path.isfile(manifest_path)):
+        return None
+    with open(manifest_path, "r", encoding='utf-8') as manifest_fp:
+        return json.load(manifest_fp)
+
+def write_shard_manifest(INDEX_FOLDER_PATH, manifest):
+    # Replace the shard manifest of an index folder in one step.
+    manifest_path = os.path.join(INDEX_FOLDER_PATH, SHARD_MANIFEST_FILE_NAME)
+    with open(manifest_path + ".tmp", "w", encoding='utf-8') as manifest_fp:
+        json.dump(manifest, manifest_fp, indent = 2)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+@contextmanager
+def lock_segment_manifest(INDEX_FOLDER_PATH):
+    # Hold the lock of an index folder's segment manifest, between reading it and writing its update.
+    with open(os.path.join(INDEX_FOLDER_PATH, SEGMENT_LOCK_FILE_NAME), "a") as lock_fp:
+        fcntl.flock(lock_fp, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_fp, fcntl.LOCK_UN)
+
+def read_deleted_docs(segment_path, doc_count):
+    # Read the tombstone bitmap of a segment, or an empty one if none of its documents were deleted.
+    # A bitmap of another size was left by another index in the same folder, and is rejected rather than applied to this one.
+    deleted_docs_path = os.path.join(segment_path, DELETED_DOCS_FILE_NAME)
+    if(not os.path.isfile(deleted_docs_path)):
+        return bytearray((doc_count + 7) // 8)
+    with open(deleted_docs_path, "rb") as deleted_docs_fp:
+        deleted_docs = bytearray(deleted_docs_fp.read())
+    if(len(deleted_docs) != (doc_count + 7) // 8):
+        raise ValueError("The tombstone bitmap '" + deleted_docs_path + "' has " + str(len(deleted_docs)) + " bytes instead of " + str((doc_count + 7) // 8) + " for " + str(doc_count) + " documents, it belongs to another index")
+    return deleted_docs
+
+def write_deleted_docs(segment_path, deleted_docs):
+    # Replace the tombstone bitmap of a segment in one step.
+    deleted_docs_path = os.path.join(segment_path, DELETED_DOCS_FILE_NAME)
+    with open(deleted_docs_path + ".tmp", "wb") as deleted_docs_fp:
+        deleted_docs_fp.write(deleted_docs)
+    os.replace(deleted_docs_path + ".tmp", deleted_docs_path)
+
+def is_deleted(deleted_docs, docID):
+    # Check the bit of a local docID in a tombstone bitmap.
+    return (deleted_docs[docID >> 3] >> (docID & 7)) & 1 == 1
+
+def count_deleted(deleted_docs):
+    # Number of documents marked in a tombstone bitmap.
+    return int.from_bytes(deleted_docs, "little").bit_count()
+
+def get_pending_deleted_count(segment):
+    # Number of deleted documents of a manifest segment whose postings are still in its index files.
+    return segment.get("deleted_count", 0) - segment.get("purged_count", 0)
+
+def find_title_docIDs(INDEX_FOLDER_PATH, manifest, titles):
+    # Global docIDs of the documents of the manifest's segments with one of the given titles, that aren't deleted yet.
+    # Every title of every segment is compared, so the caller holds the manifest lock for merges not to remove segments meanwhile.
+    titles = set(titles)
+    docIDs = []
+    for segment in manifest["segments"]:
+        segment_path = get_segment_path(INDEX_FOLDER_PATH, segment["name"])
+        deleted_docs = read_deleted_docs(segment_path, segment["doc_count"])
+        titleHandler = TitleHandler(segment_path, 0)
+        titleHandler.load_title_store()
+        for docID in range(segment["doc_count"]):
+            if(not is_deleted(deleted_docs, docID) and titleHandler.get_title(docID) in titles):
+                docIDs.append(segment["doc_base"] + docID)
+    return docIDs
+
+def delete_documents(INDEX_FOLDER_PATH, manifest, docIDs):
+    # Mark documents, given by global docID, in the tombstone bitmaps of their segments, and count them in the manifest.
+    # The caller holds the manifest lock and writes the manifest afterwards. Returns the number of newly deleted documents.
+    deleted_count = 0
+    for segment in manifest["segments"]:
+        segment_docIDs = [docID - segment["doc_base"] for docID in docIDs if segment["doc_base"] <= docID < segment["doc_base"] + segment["doc_count"]]
+        if(len(segment_docIDs) == 0):
+            continue
+        segment_path = get_segment_path(INDEX_FOLDER_PATH, segment["name"])
+        deleted_docs = read_deleted_docs(segment_path, segment["doc_count"])
+        for docID in segment_docIDs:
+            if(not is_deleted(deleted_docs, docID)):
+                deleted_docs[docID >> 3] |= 1 << (docID & 7)
+                deleted_count += 1
+        write_deleted_docs(segment_path, deleted_docs)
+        segment["deleted_count"] = count_deleted(deleted_docs)
+    return deleted_count
+
+def remove_segment_files(INDEX_FOLDER_PATH, segment_name):
+    # Delete the files of a segment that is no longer listed in the manifest.
+    if(segment_name != ""):
+        shutil.rmtree(get_segment_path(INDEX_FOLDER_PATH, segment_name), ignore_errors = True)
+        return
+    for file in os.listdir(INDEX_FOLDER_PATH):
+        if(any(file.startswith(prefix) for prefix in SEGMENT_FILE_PREFIXES)):
+            os.remove(os.path.join(INDEX_FOLDER_PATH, file))
+
+
+class SegmentHandler:
+    def __init__(self, INDEX_FOLDER_PATH, segment, TITLE_FILE_CAP, LOAD_TERM_DICTIONARY = True):
+        # Initialize a SegmentHandler over a segment listed in the manifest of an index folder.
+        self.name = segment["name"]
+        self.doc_base = segment["doc_base"]
+        self.doc_count = segment["doc_count"]
+        self.live_doc_count = segment["doc_count"] - segment.get("deleted_count", 0)
+        self.has_pending_deletes = get_pending_deleted_count(segment) > 0
+        self.SEGMENT_PATH = get_segment_path(INDEX_FOLDER_PATH, self.name)
+        self.TITLE_FILE_CAP = TITLE_FILE_CAP
+        self.LOAD_TERM_DICTIONARY = LOAD_TERM_DICTIONARY
+
+        self.titleHandler = None
+        self.dictionaryHandler = None
+        self.secondaryIndexHandler = None
+
+        # Tombstone bitmap checked by the scorers, only loaded while deleted documents still have postings,
+        # and the sorted local docIDs of the deleted documents.
+        self.deleted_docs = None
+        self.deleted_docIDs = []
+
+        # Index files are opened once and read with pread, so a segment stays readable
+        # while a merge replaces it, until the searcher reloads the manifest.
+        self.index_fps = {}
+
+    def load(self):
+        # Load the title store and the term lookup structures of the segment, and open its index files.
+        self.titleHandler = TitleHandler(self.SEGMENT_PATH, self.TITLE_FILE_CAP)
+        self.titleHandler.load_title_store()
+
+        # Loading the Term Dictionary, or the Secondary Index for indexes built without one
+        dictionaryHandler = DictionaryHandler(self.SEGMENT_PATH)
+        if(self.LOAD_TERM_DICTIONARY and dictionaryHandler.has_term_dictionary()):
+            dictionaryHandler.load_term_dictionary()
+            self.dictionaryHandler = dictionaryHandler
+        else:
+            self.secondaryIndexHandler = SecondaryIndexHandler(self.SEGMENT_PATH)
+            self.secondaryIndexHandler.load_secondary_index()
+
+        if(self.has_pending_deletes):
+            self.deleted_docs = bytes(read_deleted_docs(self.SEGMENT_PATH, self.doc_count))
+            self.deleted_docIDs = [docID for docID in range(self.doc_count) if is_deleted(self.deleted_docs, docID)]
+
+        for index_file_idx in get_index_file_indices(self.SEGMENT_PATH):
+            index_fp = open(os.path.join(self.SEGMENT_PATH, get_index_file_name(index_file_idx)), "rb")
+            postingCodec.check_index_file_header(index_fp.read(len(postingCodec.INDEX_FILE_HEADER)))
+            self.index_fps[index_file_idx] = index_fp
+
+    def _read_index_file(self, index_file_idx, offset, length = None, queryTrace = None):
+        # Read length bytes (up to the end of the file if None) of an index file at offset.
+        start_time = time.perf_counter()
+        index_fp = self.index_fps[index_file_idx]
+        if(length is None):
+            length = os.fstat(index_fp.fileno()).st_size - offset
+        data = os.pread(index_fp.fileno(), length, offset)
+        if(queryTrace is not None):
+            queryTrace.add_read(len(data), time.perf_counter() - start_time)
+        return data
+
+    def _get_term_location(self, word, queryTrace = None):
+        # Look a word up in the term dictionary.
+        start_time = time.perf_counter()
+        location = self.dictionaryHandler.get_term_location(word)
+        if(queryTrace is not None):
+            queryTrace.add_time("lookup", time.perf_counter() - start_time)
+        return location
+
+    def get_term_record(self, word, queryTrace = None, field = None):
+        # Read the term record of a word, or its field term record of a field, or return None if the word isn't indexed
+        # in the segment or doesn't occur in the field.
+        # A QueryTrace records the time spent looking the word up and reading its record, and the bytes read.
+        if self.dictionaryHandler is None:
+            record = self._scan_term_record(word, queryTrace)
+            if record is None:
+                return None
+            if field is None:
+                return postingCodec.get_word_record(record)
+            return postingCodec.get_field_record(record, field)
+
+        location = self._get_term_location(word, queryTrace)
+        if location is None:
+            return None
+
+        # Seek straight to the word's term record in its index file.
+        index_file_idx, offset, length = location
+        if field is None:
+            return self._read_index_file(index_file_idx, offset, length, queryTrace)
+
+        # The header of the word's term record locates its field term record.
+        header = self._read_index_file(index_file_idx, offset, min(length, TERM_HEADER_READ_SIZE), queryTrace)
+        field_location = postingCodec.get_field_record_location(header, field)
+        if field_location is None:
+            return None
+        return self._read_index_file(index_file_idx, offset + field_location[0], field_location[1], queryTrace)
+
+    def get_term_doc_count(self, word, queryTrace = None):
+        # Number of documents of a word in the segment, reading only the header of its term record, or 0 if the word isn't indexed in it.
+        if self.dictionaryHandler is None:
+            record = self._scan_term_record(word, queryTrace)
+        else:
+            location = self._get_term_location(word, queryTrace)
+            if location is None:
+                return 0
+            index_file_idx, offset, length = location
+            record = self._read_index_file(index_file_idx, offset, min(length, TERM_HEADER_READ_SIZE), queryTrace)
+        if record is None:
+            return 0
+        return postingCodec.decode_term_header(record)[2]
+
+    def get_term_records(self, term_keys):
+        # Read the term records of several (word, field) term keys, the word's term record for a None field
+        # and its field term record otherwise, in index file order. Returns a dict of term key -> record
+        # for the term keys indexed in the segment. Records close together in a file are read with a single read.
+        term_records = {}
+        if self.dictionaryHandler is None:
+            # Words in the same block of terms of the secondary index are found in a single read of the block.
+            term_blocks = {}
+            for word, field in term_keys:
+                term_blocks.setdefault(self.secondaryIndexHandler.get_term_block(word), {}).setdefault(word, []).append(field)
+            for (index_file_idx, start_offset, end_offset), block_words in sorted(term_blocks.items(), key = lambda term_block: term_block[0][:2]):
+                if(index_file_idx not in self.index_fps):
+                    continue
+                data = self._read_index_file(index_file_idx, start_offset, None if end_offset is None else end_offset - start_offset)
+                for cur_word, offset, record in postingCodec.iter_term_records(data, 0):
+                    for field in block_words.get(cur_word, []):
+                        term_record = postingCodec.get_word_record(record) if field is None else postingCodec.get_field_record(record, field)
+                        if term_record is not None:
+                            term_records[(cur_word, field)] = bytes(term_record)
+            return term_records
+
+        # The words' term records are read first, only their headers for the words only read for their fields,
+        # then the field term records they locate.
+        word_fields = {}
+        for word, field in term_keys:
+            word_fields.setdefault(word, set()).add(field)
+        locations = []
+        for word, fields in word_fields.items():
+            location = self.dictionaryHandler.get_term_location(word)
+            if location is not None:
+                index_file_idx, offset, length = location
+                locations.append(((index_file_idx, offset, length if None in fields else min(length, TERM_HEADER_READ_SIZE)), word))
+        word_records = self._read_term_locations(locations)
+
+        field_locations = []
+        for (index_file_idx, offset, length), word in locations:
+            for field in word_fields[word]:
+                if field is None:
+                    term_records[(word, None)] = word_records[word]
+                    continue
+                field_location = postingCodec.get_field_record_location(word_records[word], field)
+                if field_location is not None:
+                    field_locations.append(((index_file_idx, offset + field_location[0], field_location[1]), (word, field)))
+        term_records.update(self._read_term_locations(field_locations))
+        return term_records
+
+    def _read_term_locations(self, locations):
+        # Read the (index file, offset, length) locations of several keys, returning a dict of key -> bytes read.
+        # Runs of nearby locations in a file are read at once, then split into their records.
+        records = {}
+        run = []
+        for location, key in sorted(locations, key = lambda location: location[0]) + [((None, 0, 0), None)]:
+            index_file_idx, offset, length = location
+            if(len(run) > 0 and (index_file_idx != run[0][0][0] or offset - run_end > TERM_READ_GAP)):
+                run_start = run[0][0][1]
+                data = self._read_index_file(run[0][0][0], run_start, run_end - run_start)
+                for (run_index_file_idx, run_offset, run_length), run_key in run:
+                    records[run_key] = data[run_offset - run_start: run_offset - run_start + run_length]
+                run = []
+            if(len(run) == 0):
+                run_end = 0
+            run.append((location, key))
+            run_end = max(run_end, offset + length)
+        return records
+
+    def _scan_term_record(self, word, queryTrace = None):
+        # Find the term record of a word by scanning its block of terms, located through the secondary index.
+        start_time = time.perf_counter()
+        index_file_idx, start_offset, end_offset = self.secondaryIndexHandler.get_term_block(word)
+        if(queryTrace is not None):
+            queryTrace.add_time("lookup", time.perf_counter() - start_time)
+        if(index_file_idx not in self.index_fps):
+            return None
+        data = self._read_index_file(index_file_idx, start_offset, None if end_offset is None else end_offset - start_offset, queryTrace)
+        start_time = time.perf_counter()
+        term_record = None
+        for cur_word, offset, record in postingCodec.iter_term_records(data, 0):
+            if(cur_word == word):
+                term_record = bytes(record)
+                break
+        if(queryTrace is not None):
+            queryTrace.add_time("scan", time.perf_counter() - start_time)
+        return term_record
+
+    def count_live_docs(self, postingList):
+        # Number of documents of a PostingList of the segment that aren't deleted.
+        # Only the blocks whose docID range holds a deleted docID are decoded, the others count all their postings.
+        if self.deleted_docs is None:
+            return postingList.doc_count
+        deleted_count = 0
+        for block_idx in range(len(postingList.blocks)):
+            if(bisect_right(self.deleted_docIDs, postingList.block_last_docIDs[block_idx]) > bisect_left(self.deleted_docIDs, postingList.block_first_docIDs[block_idx])):
+                docIDs = postingList.get_block(block_idx)[0]
+                deleted_count += sum(1 for docID in docIDs if is_deleted(self.deleted_docs, docID))
+        return postingList.doc_count - deleted_count
+
+    def get_title(self, docID):
+        # Retrieve the title of a document of the segment, given its docID within the segment.
+        return self.titleHandler.get_title(docID)
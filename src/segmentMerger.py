@@ -0,0 +1,246 @@
+# Libraries
+import os
+import sys
+import math
+import fcntl
+import argparse
+from datetime import datetime
+
+import postingCodec
+from invertedIndexHandler import InvertedIndexHandler
+from secondaryIndexHandler import SecondaryIndexHandler
+from titleHandler import TITLE_STORE_FILE_NAME, TITLE_OFFSETS_FILE_NAME, TITLE_OFFSET_STRUCT
+from segmentHandler import SEGMENT_FOLDER_PREFIX, get_segment_path, get_index_file_indices, get_index_file_name, read_segment_manifest, write_segment_manifest, lock_segment_manifest, remove_segment_files
+from segmentHandler import read_deleted_docs, write_deleted_docs, is_deleted, count_deleted, get_pending_deleted_count
+
+# Global Variables
+INDEX_FOLDER_PATH = "indexFolder"
+
+# Segments are merged MERGE_FACTOR at a time, once MERGE_FACTOR adjacent segments fall in the same size tier.
+MERGE_FACTOR = 4
+# A segment is compacted on its own, dropping the postings of its deleted documents, once this share of its documents is deleted.
+COMPACT_DELETED_RATIO = 0.2
+FINAL_INDEX_FILE_CAP = 100000000
+SECONDARY_INDEX_SAMPLE_RATE = 64
+
+# Held by the merger for as long as it runs, so only one merger works on an index folder at a time.
+MERGE_LOCK_FILE_NAME = "merge.lock"
+
+
+def get_segment_tier(doc_count, merge_factor):
+    # Size tier of a segment: segments of up to merge_factor documents are tier 0, then each tier is merge_factor times larger.
+    if(doc_count <= merge_factor):
+        return 0
+    return int(math.log(doc_count, merge_factor))
+
+def find_segments_to_merge(manifest_segments, merge_factor):
+    # Pick the first run of merge_factor adjacent segments of the same tier, in the lowest tier that has one.
+    # Only adjacent segments are merged, so the merged segment still spans a contiguous range of docIDs.
+    # Returns the index of the run's first segment, or None if no segments qualify.
+    tiers = [get_segment_tier(segment["doc_count"], merge_factor) for segment in manifest_segments]
+    best_idx = None
+    for idx in range(len(tiers) - merge_factor + 1):
+        if(len(set(tiers[idx: idx + merge_factor])) == 1):
+            if(best_idx is None or tiers[idx] < tiers[best_idx]):
+                best_idx = idx
+    return best_idx
+
+def find_segment_to_compact(manifest_segments, min_deleted_ratio):
+    # Pick the first segment with deleted documents still in its postings, making up at least min_deleted_ratio of it.
+    # Returns its index, or None if no segment qualifies.
+    for idx, segment in enumerate(manifest_segments):
+        pending_deleted_count = get_pending_deleted_count(segment)
+        if(pending_deleted_count > 0 and pending_deleted_count >= segment["doc_count"] * min_deleted_ratio):
+            return idx
+    return None
+
+
+class SegmentMerger:
+    def __init__(self, INDEX_FOLDER_PATH, MERGE_FACTOR, COMPACT_DELETED_RATIO, FINAL_INDEX_FILE_CAP, SECONDARY_INDEX_SAMPLE_RATE):
+        # Initialize the SegmentMerger of an index folder.
+        self.INDEX_FOLDER_PATH = INDEX_FOLDER_PATH
+        self.MERGE_FACTOR = MERGE_FACTOR
+        self.COMPACT_DELETED_RATIO = COMPACT_DELETED_RATIO
+        self.FINAL_INDEX_FILE_CAP = FINAL_INDEX_FILE_CAP
+        self.SECONDARY_INDEX_SAMPLE_RATE = SECONDARY_INDEX_SAMPLE_RATE
+        self.lock_fp = None
+
+        # Counters for merge statistics.
+        self.MergeCount = 0
+        self.MergedDocCount = 0
+        self.PurgedDocCount = 0
+
+    def acquire(self):
+        # Take the merge lock of the index folder, without waiting. Returns False if another merger holds it.
+        self.lock_fp = open(os.path.join(self.INDEX_FOLDER_PATH, MERGE_LOCK_FILE_NAME), "a")
+        try:
+            fcntl.flock(self.lock_fp, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self.lock_fp.close()
+            self.lock_fp = None
+            return False
+        return True
+
+    def release(self):
+        # Release the merge lock.
+        fcntl.flock(self.lock_fp, fcntl.LOCK_UN)
+        self.lock_fp.close()
+        self.lock_fp = None
+
+    def _reserve_segment_name(self):
+        # Take the next segment id of the manifest, so indexers adding segments meanwhile don't reuse it.
+        with lock_segment_manifest(self.INDEX_FOLDER_PATH):
+            manifest = read_segment_manifest(self.INDEX_FOLDER_PATH)
+            segment_name = SEGMENT_FOLDER_PREFIX + str(manifest["next_segment_id"])
+            manifest["next_segment_id"] += 1
+            write_segment_manifest(self.INDEX_FOLDER_PATH, manifest)
+        return segment_name
+
+    def _merge_titles(self, merge_segments, segment_path):
+        # Concatenate the title stores of the segments, shifting their offsets by the size of the titles before them.
+        store_size = 0
+        with open(os.path.join(segment_path, TITLE_STORE_FILE_NAME), "wb") as title_fp, open(os.path.join(segment_path, TITLE_OFFSETS_FILE_NAME), "wb") as offsets_fp:
+            offsets_fp.write(TITLE_OFFSET_STRUCT.pack(0))
+            for segment in merge_segments:
+                cur_segment_path = get_segment_path(self.INDEX_FOLDER_PATH, segment["name"])
+                with open(os.path.join(cur_segment_path, TITLE_STORE_FILE_NAME), "rb") as cur_title_fp:
+                    title_fp.write(cur_title_fp.read())
+                with open(os.path.join(cur_segment_path, TITLE_OFFSETS_FILE_NAME), "rb") as cur_offsets_fp:
+                    offsets_data = cur_offsets_fp.read()
+                offsets = [offset for offset, in TITLE_OFFSET_STRUCT.iter_unpack(offsets_data)]
+                for offset in offsets[1:]:
+                    offsets_fp.write(TITLE_OFFSET_STRUCT.pack(store_size + offset))
+                store_size += offsets[-1]
+
+    def _iter_segment_run_records(self, segment, docID_offset, deleted_docs):
+        # Iterate over the term records of a segment's index files, in word order, decoded like run records
+        # with their blocks rebased by docID_offset. Each index file is read whole when its turn comes.
+        # With a tombstone bitmap, the postings of deleted documents are dropped and the remaining ones encoded again,
+        # leaving out words without any.
+        segment_path = get_segment_path(self.INDEX_FOLDER_PATH, segment["name"])
+        for index_file_idx in get_index_file_indices(segment_path):
+            with open(os.path.join(segment_path, get_index_file_name(index_file_idx)), "rb") as index_fp:
+                data = postingCodec.read_index_file(index_fp)
+            for word, doc_count, word_freq, max_field_counts, block_count, blocks in postingCodec.iter_run_records(data):
+                if(deleted_docs is None):
+                    yield word, doc_count, word_freq, max_field_counts, block_count, postingCodec.rebase_blocks(blocks, docID_offset)
+                    continue
+                postings = [(docID + docID_offset, fields) for docID, fields in postingCodec.iter_postings(blocks, 0, len(blocks)) if not is_deleted(deleted_docs, docID)]
+                if(len(postings) > 0):
+                    blocks, block_count, max_field_counts = postingCodec.encode_posting_list(postings)
+                    yield word, len(postings), sum(sum(fields) for docID, fields in postings), max_field_counts, block_count, blocks
+
+    def _merge_postings(self, merge_segments, segment_deleted_docs, segment_path, doc_count):
+        # Merge the term records of the segments into the index files and term dictionary of the merged segment.
+        # The blocks of a word are copied segment after segment, only their docIDs rebased, unless the segment
+        # has deleted documents, and the IDFs are computed over the merged segment's live documents.
+        invertedIndexHandler = InvertedIndexHandler(segment_path, 0, self.FINAL_INDEX_FILE_CAP)
+        invertedIndexHandler.total_doc_count = max(doc_count, 1)
+        doc_base = merge_segments[0]["doc_base"]
+        invertedIndexHandler.merge_run_records([self._iter_segment_run_records(segment, segment["doc_base"] - doc_base, deleted_docs) for segment, deleted_docs in zip(merge_segments, segment_deleted_docs)])
+
+    def _merge_deleted_docs(self, merge_segments, segment_path):
+        # Concatenate the current tombstone bitmaps of the segments, including documents deleted during the merge,
+        # into the bitmap of the merged segment. Returns the number of deleted documents.
+        doc_count = sum(segment["doc_count"] for segment in merge_segments)
+        deleted_docs = bytearray((doc_count + 7) // 8)
+        doc_base = merge_segments[0]["doc_base"]
+        for segment in merge_segments:
+            if(segment.get("deleted_count", 0) == 0):
+                continue
+            cur_deleted_docs = read_deleted_docs(get_segment_path(self.INDEX_FOLDER_PATH, segment["name"]), segment["doc_count"])
+            for docID in range(segment["doc_count"]):
+                if(is_deleted(cur_deleted_docs, docID)):
+                    merged_docID = segment["doc_base"] - doc_base + docID
+                    deleted_docs[merged_docID >> 3] |= 1 << (merged_docID & 7)
+        deleted_count = count_deleted(deleted_docs)
+        if(deleted_count > 0):
+            write_deleted_docs(segment_path, deleted_docs)
+        return deleted_count
+
+    def merge_segments(self, first_idx, segment_count):
+        # Merge segment_count segments of the manifest starting at first_idx into a new segment, dropping the
+        # postings of their deleted documents, then swap them for it in the manifest and delete their files.
+        # The docIDs of deleted documents stay taken, so the merged segment spans the same docIDs.
+        with lock_segment_manifest(self.INDEX_FOLDER_PATH):
+            merge_segments = read_segment_manifest(self.INDEX_FOLDER_PATH)["segments"][first_idx: first_idx + segment_count]
+            segment_deleted_docs = []
+            for segment in merge_segments:
+                deleted_docs = None
+                if(get_pending_deleted_count(segment) > 0):
+                    deleted_docs = read_deleted_docs(get_segment_path(self.INDEX_FOLDER_PATH, segment["name"]), segment["doc_count"])
+                segment_deleted_docs.append(deleted_docs)
+        purged_count = sum(segment.get("deleted_count", 0) for segment in merge_segments)
+        segment_name = self._reserve_segment_name()
+        segment_path = get_segment_path(self.INDEX_FOLDER_PATH, segment_name)
+        os.mkdir(segment_path)
+        doc_count = sum(segment["doc_count"] for segment in merge_segments)
+        print("Merging segments", ", ".join(segment["name"] or "." for segment in merge_segments), "into", segment_name)
+
+        self._merge_titles(merge_segments, segment_path)
+        self._merge_postings(merge_segments, segment_deleted_docs, segment_path, doc_count - purged_count)
+        SecondaryIndexHandler(segment_path, self.SECONDARY_INDEX_SAMPLE_RATE).build_secondary_index()
+
+        # Indexers only ever append segments to the manifest, so the merged ones are still where they were,
+        # though documents may have been deleted from them meanwhile.
+        with lock_segment_manifest(self.INDEX_FOLDER_PATH):
+            manifest = read_segment_manifest(self.INDEX_FOLDER_PATH)
+            deleted_count = self._merge_deleted_docs(manifest["segments"][first_idx: first_idx + segment_count], segment_path)
+            merged_segment = {"name": segment_name, "doc_base": merge_segments[0]["doc_base"], "doc_count": doc_count}
+            if(deleted_count > 0):
+                merged_segment["deleted_count"] = deleted_count
+                merged_segment["purged_count"] = purged_count
+            manifest["segments"][first_idx: first_idx + segment_count] = [merged_segment]
+            write_segment_manifest(self.INDEX_FOLDER_PATH, manifest)
+        for segment in merge_segments:
+            remove_segment_files(self.INDEX_FOLDER_PATH, segment["name"])
+
+        self.MergeCount += 1
+        self.MergedDocCount += doc_count
+        self.PurgedDocCount += purged_count - sum(segment.get("purged_count", 0) for segment in merge_segments)
+
+    def merge(self):
+        # Keep merging segments until no MERGE_FACTOR adjacent segments share a tier,
+        # then compact the segments with enough deleted documents.
+        while(True):
+            manifest_segments = read_segment_manifest(self.INDEX_FOLDER_PATH)["segments"]
+            first_idx = find_segments_to_merge(manifest_segments, self.MERGE_FACTOR)
+            if(first_idx is not None):
+                self.merge_segments(first_idx, self.MERGE_FACTOR)
+                continue
+            compact_idx = find_segment_to_compact(manifest_segments, self.COMPACT_DELETED_RATIO)
+            if(compact_idx is None):
+                return
+            self.merge_segments(compact_idx, 1)
+
+
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser(description = "Merge the small segments of an index folder into larger ones.")
+    argParser.add_argument("index_folder_path", help = "path to the index folder")
+    argParser.add_argument("--merge-factor", type = int, default = MERGE_FACTOR, help = "number of adjacent segments of the same size tier merged together (default: %(default)s)")
+    argParser.add_argument("--compact", action = "store_true", help = "also compact every segment with deleted documents, whatever their share")
+    args = argParser.parse_args()
+
+    INDEX_FOLDER_PATH = os.path.abspath(args.index_folder_path)
+    MERGE_FACTOR = args.merge_factor
+    if(args.compact):
+        COMPACT_DELETED_RATIO = 0
+    if(MERGE_FACTOR < 2):
+        print("The merge factor must be at least 2")
+        exit(1)
+
+    if(not os.path.isdir(INDEX_FOLDER_PATH)):
+        print("Invalid index folder path")
+        exit(1)
+
+    segmentMerger = SegmentMerger(INDEX_FOLDER_PATH, MERGE_FACTOR, COMPACT_DELETED_RATIO, FINAL_INDEX_FILE_CAP, SECONDARY_INDEX_SAMPLE_RATE)
+    if(not segmentMerger.acquire()):
+        print("Another merge is running on the index folder")
+        sys.exit(0)
+
+    start_time = datetime.utcnow()
+    try:
+        segmentMerger.merge()
+    finally:
+        segmentMerger.release()
+    print("Merged", segmentMerger.MergeCount, "times,", segmentMerger.MergedDocCount, "documents,", segmentMerger.PurgedDocCount, "deleted documents dropped in", (datetime.utcnow() - start_time).total_seconds(), "seconds")
@@ -0,0 +1,101 @@
+# Libraries
+import os
+import sys
+import shutil
+import argparse
+import tempfile
+import contextlib
+
+from dumpGenerator import SEED
+from benchmarkSuite import SCORERS, make_queries, set_scorer
+from segmentCheck import run_script, write_dump
+import numpyScorer
+import wikiSearch
+import searchBroker
+
+# Global Variables
+PAGE_COUNT = 1000
+SHARD_COUNT = 3
+QUERY_COUNT = 300
+FIELD_QUERY_FRACTION = 0.25
+SCORE_DIGITS = 9
+
+
+def get_results(top_docs):
+    # The (docID, title, score) results of a query, with scores rounded to compare them.
+    return [(docID, title, round(score, SCORE_DIGITS)) for docID, title, score in top_docs]
+
+def has_tied_scores(results):
+    # Check whether some results of a query have the same score.
+    scores = [score for docID, title, score in results]
+    return len(set(scores)) < len(scores)
+
+def check_scorer(scorer, index_folder_path, sharded_index_folder_path, queries):
+    # Search the unsharded index and the shards, through a broker, with a scorer.
+    # Returns the number of queries whose results differ, order included, and the number of queries with tied scores.
+    set_scorer(scorer)
+    wikiSearch.QUERY_CACHE_SIZE = 0
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        wikiSearch.load_index(index_folder_path)
+    expected = [get_results(wikiSearch.process_query(query)[0]) for query in queries]
+
+    broker = searchBroker.SearchBroker(searchBroker.get_local_shards(sharded_index_folder_path))
+    try:
+        results = [get_results(broker.process_query(query)[0]) for query in queries]
+    finally:
+        broker.close()
+
+    mismatch_count = 0
+    tied_count = 0
+    for query, expected_results, query_results in zip(queries, expected, results):
+        if has_tied_scores(expected_results):
+            tied_count += 1
+        if(expected_results != query_results):
+            mismatch_count += 1
+            print("Mismatch: scorer '" + scorer + "', query '" + query + "': " + str([docID for docID, title, score in expected_results]) + " unsharded, " + str([docID for docID, title, score in query_results]) + " sharded")
+    return mismatch_count, tied_count
+
+
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser(description = "Check that a broker over the shards of an index returns the same results as the unsharded index, ties included.")
+    argParser.add_argument("--pages", type = int, default = PAGE_COUNT, help = "number of pages of the synthetic dump (default: %(default)s)")
+    argParser.add_argument("--shards", type = int, default = SHARD_COUNT, help = "number of shards (default: %(default)s)")
+    argParser.add_argument("--queries", type = int, default = QUERY_COUNT, help = "number of queries (default: %(default)s)")
+    argParser.add_argument("--seed", type = int, default = SEED, help = "random seed of the dump and the queries (default: %(default)s)")
+    argParser.add_argument("--work-dir", default = None, help = "folder to write the dump and the indexes to, kept afterwards (default: a temporary folder)")
+    args = argParser.parse_args()
+
+    scorers = [scorer for scorer in SCORERS if scorer != "numpy" or numpyScorer.is_available()]
+    work_dir = args.work_dir if args.work_dir is not None else tempfile.mkdtemp(prefix = "wikiSearchShardCheck_")
+    os.makedirs(work_dir, exist_ok = True)
+    index_folder_path = os.path.join(work_dir, "indexFolder")
+    sharded_index_folder_path = os.path.join(work_dir, "shardedIndexFolder")
+    stat_file_path = os.path.join(work_dir, "stats.txt")
+    shutil.rmtree(index_folder_path, ignore_errors = True)
+    shutil.rmtree(sharded_index_folder_path, ignore_errors = True)
+
+    mismatch_count = 0
+    try:
+        wiki_dump_path = os.path.join(work_dir, "synthetic_dump.xml")
+        dumpGenerator = write_dump(wiki_dump_path, args.seed, args.pages)
+        run_script("wikiIndexer.py", [wiki_dump_path, index_folder_path, stat_file_path])
+        run_script("wikiIndexer.py", [wiki_dump_path, sharded_index_folder_path, stat_file_path, "--shards", str(args.shards)])
+        print("Pages: \t\t\t" + str(args.pages) + ", " + str(args.shards) + " shards")
+
+        queries = make_queries(dumpGenerator, args.queries, FIELD_QUERY_FRACTION)
+        for scorer in scorers:
+            scorer_mismatch_count, tied_count = check_scorer(scorer, index_folder_path, sharded_index_folder_path, queries)
+            mismatch_count += scorer_mismatch_count
+            print("Scorer %s: \t\t%d queries, %d with tied scores, %d mismatches" % (scorer, len(queries), tied_count, scorer_mismatch_count))
+            # Without ties, the check wouldn't tell whether the shards break them like the unsharded index.
+            if(tied_count == 0):
+                mismatch_count += 1
+                print("Mismatch: no query has tied scores, use more queries")
+    finally:
+        if(args.work_dir is None):
+            shutil.rmtree(work_dir, ignore_errors = True)
+
+    if(mismatch_count > 0):
+        print(str(mismatch_count) + " mismatches")
+        sys.exit(1)
+    print("The broker returned the same results as the unsharded index")
@@ -1,5 +1,13 @@
-
 import os
+import mmap
+import time
+import struct
+
+# Titles are stored as one packed utf-8 blob, plus an array of little-endian uint64 offsets
+# where title docID spans bytes offsets[docID] to offsets[docID + 1] of the blob.
+TITLE_STORE_FILE_NAME = "title_store.dat"
+TITLE_OFFSETS_FILE_NAME = "title_offsets.idx"
+TITLE_OFFSET_STRUCT = struct.Struct("<Q")
 
 class TitleHandler:
     def __init__(self, INDEX_FOLDER_PATH, TITLE_FILE_CAP):
@@ -8,19 +16,40 @@ class TitleHandler:
         self.TITLE_FILE_CAP = TITLE_FILE_CAP
         self.title_file_count = 0
         self.titles = []
+        self.title_store_size = 0
+
+        # Bytes written to the title store and offsets files, and the seconds spent writing them, for statistics.
+        self.title_bytes_written = 0
+        self.title_write_time = 0.0
+
+        # Memory maps of the title store, opened by load_title_store.
+        self.title_store = None
+        self.title_offsets = None
 
     def _dump_titles_to_file(self):
-        # Write the accumulated titles to a title file.
+        # Append the accumulated titles to the title store and their end offsets to the offsets file.
+
+        start_time = time.perf_counter()
+        store_data = bytearray()
+        offsets_data = bytearray()
+        if(self.title_file_count == 0):
+            offsets_data += TITLE_OFFSET_STRUCT.pack(0)
+        for title in self.titles:
+            store_data += title.encode('utf-8')
+            offsets_data += TITLE_OFFSET_STRUCT.pack(self.title_store_size + len(store_data))
+
+        with open(os.path.join(self.INDEX_FOLDER_PATH, TITLE_STORE_FILE_NAME), "ab") as title_fp:
+            title_fp.write(store_data)
+        with open(os.path.join(self.INDEX_FOLDER_PATH, TITLE_OFFSETS_FILE_NAME), "ab") as offsets_fp:
+            offsets_fp.write(offsets_data)
 
-        title_file_name = "title_" + str(self.title_file_count) + ".txt"
-        with open(os.path.join(self.INDEX_FOLDER_PATH, title_file_name), "w", encoding='utf-8') as title_fp:
-            for title in self.titles:
-                title_fp.write(title + "\n")
-        
         # Increment the title file count and reset the titles list.
+        self.title_bytes_written += len(store_data) + len(offsets_data)
+        self.title_write_time += time.perf_counter() - start_time
+        self.title_store_size += len(store_data)
         self.title_file_count += 1
         self.titles = []
-        
+
     def add_title(self, title, isLast = False):
         # Add a title to the list of titles.
 
@@ -31,18 +60,37 @@ class TitleHandler:
         if(isLast == True or len(self.titles) == self.TITLE_FILE_CAP) :
             self._dump_titles_to_file()
 
+    def restore_title_store(self, title_count):
+        # Cut the title store back to its first title_count titles, to carry on adding titles from there.
+        self.titles = []
+        offsets_path = os.path.join(self.INDEX_FOLDER_PATH, TITLE_OFFSETS_FILE_NAME)
+        with open(offsets_path, "r+b") as offsets_fp:
+            offsets_fp.seek(title_count * TITLE_OFFSET_STRUCT.size)
+            self.title_store_size, = TITLE_OFFSET_STRUCT.unpack(offsets_fp.read(TITLE_OFFSET_STRUCT.size))
+            offsets_fp.truncate((title_count + 1) * TITLE_OFFSET_STRUCT.size)
+        with open(os.path.join(self.INDEX_FOLDER_PATH, TITLE_STORE_FILE_NAME), "r+b") as title_fp:
+            title_fp.truncate(self.title_store_size)
+        self.title_file_count = 1
+
+    def _map_file(self, file_name):
+        # Memory map a file read-only, or return empty bytes for an empty file.
+        with open(os.path.join(self.INDEX_FOLDER_PATH, file_name), "rb") as fp:
+            if(os.fstat(fp.fileno()).st_size == 0):
+                return b""
+            return mmap.mmap(fp.fileno(), 0, access = mmap.ACCESS_READ)
+
+    def load_title_store(self):
+        # Memory map the title store and its offsets for random access.
+        self.title_store = self._map_file(TITLE_STORE_FILE_NAME)
+        self.title_offsets = self._map_file(TITLE_OFFSETS_FILE_NAME)
+
     def get_title(self, docID):
         # Retrieve the title for a given document ID.
 
+        if(self.title_store is None):
+            self.load_title_store()
+
         docID = int(docID)
-        title_idx = docID // self.TITLE_FILE_CAP
-        title_offset = docID % self.TITLE_FILE_CAP
-        title_file_name = "title_" + str(title_idx) + ".txt"
-        
-        # Open the appropriate title file and read the title.
-        with open(os.path.join(self.INDEX_FOLDER_PATH, title_file_name), "r", encoding='utf-8') as title_fp:
-            lines = title_fp.readlines()
-        
-        title = lines[title_offset].strip("\n")
-        return title
-        
\ No newline at end of file
+        start, = TITLE_OFFSET_STRUCT.unpack_from(self.title_offsets, docID * TITLE_OFFSET_STRUCT.size)
+        end, = TITLE_OFFSET_STRUCT.unpack_from(self.title_offsets, (docID + 1) * TITLE_OFFSET_STRUCT.size)
+        return self.title_store[start: end].decode('utf-8')
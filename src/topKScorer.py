@@ -0,0 +1,202 @@
+import time
+import heapq
+from bisect import bisect_left
+
+import postingCodec
+
+# Upper bounds are compared with a little slack, so float rounding never prunes a document that could score as high.
+UPPER_BOUND_SLACK = 1e-9
+
+# Candidate documents between two checks of a query's deadline.
+DEADLINE_CHECK_INTERVAL = 1024
+
+
+class TermCursor:
+    def __init__(self, postingList, field_weights, IDF):
+        # Iterate over the postings of a PostingList in docID order, scoring each document
+        # as the IDF-weighted sum of its field counts times field_weights.
+        # Blocks are only decoded once a posting inside them is needed, so skipped blocks are never decoded.
+        self.postingList = postingList
+        self.field_weights = field_weights
+        self.IDF = IDF
+
+        # The maximum field counts stored with the term and with each block bound the score of their documents.
+        self.upper_bound = self._get_upper_bound(postingList.max_field_counts)
+        self.block_first_docIDs = postingList.block_first_docIDs
+        self.block_last_docIDs = postingList.block_last_docIDs
+        self.block_upper_bounds = [self._get_upper_bound(max_field_counts) for max_field_counts in postingList.block_max_field_counts]
+
+        self.docIDs = None
+        self.scores = None
+        self.posting_idx = 0
+        self._move_to_block(0)
+
+    def _get_upper_bound(self, max_field_counts):
+        # Highest score a posting with the given maximum field counts can have.
+        upper_bound = 0
+        for i in range(postingCodec.FIELD_COUNT):
+            upper_bound += max_field_counts[i] * self.field_weights[i] * self.IDF
+        return upper_bound
+
+    def _move_to_block(self, block_idx):
+        # Move to the first posting of a block, without decoding it yet.
+        self.block_idx = block_idx
+        self.docIDs = None
+        self.posting_idx = 0
+        if(block_idx < len(self.block_first_docIDs)):
+            self.docID = self.block_first_docIDs[block_idx]
+        else:
+            self.docID = None
+
+    def _decode_block(self):
+        # Decode and score the postings of the current block.
+        docIDs, bitmaps, counts = self.postingList.get_block(self.block_idx)
+        scores = []
+        count_idx = 0
+        for bitmap in bitmaps:
+            score = 0
+            for i in postingCodec.BITMAP_FIELDS[bitmap]:
+                if(self.field_weights[i] != 0):
+                    score += counts[count_idx] * self.field_weights[i] * self.IDF
+                count_idx += 1
+            scores.append(score)
+        self.docIDs = docIDs
+        self.scores = scores
+
+    def score(self):
+        # Score of the current document.
+        if(self.docIDs is None):
+            self._decode_block()
+        return self.scores[self.posting_idx]
+
+    def next(self):
+        # Move to the next posting.
+        if(self.docIDs is None):
+            self._decode_block()
+        self.posting_idx += 1
+        if(self.posting_idx < len(self.docIDs)):
+            self.docID = self.docIDs[self.posting_idx]
+        else:
+            self._move_to_block(self.block_idx + 1)
+
+    def advance(self, target):
+        # Move to the first posting with a docID not less than target, skipping whole blocks without decoding them.
+        if(self.docID is None or self.docID >= target):
+            return
+        if(self.block_last_docIDs[self.block_idx] < target):
+            self._move_to_block(bisect_left(self.block_last_docIDs, target, self.block_idx + 1))
+            if(self.docID is None or self.docID >= target):
+                return
+        if(self.docIDs is None):
+            self._decode_block()
+        self.posting_idx = bisect_left(self.docIDs, target, self.posting_idx)
+        self.docID = self.docIDs[self.posting_idx]
+
+
+def _get_prune_threshold(threshold):
+    # Scores bounded below this value can't reach the threshold.
+    return threshold - abs(threshold) * UPPER_BOUND_SLACK
+
+def get_top_k(cursors, k, deleted_docs = None, deadline = None):
+    # Retrieve the top-k (docID, score) pairs over the query terms' cursors, given in query order,
+    # using MaxScore dynamic pruning. Documents marked in the deleted_docs tombstone bitmap are skipped.
+    # Past a time.perf_counter() deadline, checked every DEADLINE_CHECK_INTERVAL candidates, it stops with a TimeoutError.
+    #
+    # A document's score is the sum of its positive term scores in query order, and documents with equal scores
+    # rank by docID, like every other scorer, so the top k of segments and shards merge by (score, docID).
+    #
+    # Terms are ordered by upper bound, and the terms whose bounds add up to less than the current k-th score
+    # are non-essential: documents found only in them can't enter the top k, so only the essential terms are
+    # traversed, and non-essential ones are probed for the candidate documents while their bounds still matter.
+    # Block bounds additionally let whole blocks of the essential terms be skipped without decoding them.
+    heap = []
+    prune_threshold = 0
+    term_order = sorted(range(len(cursors)), key = lambda idx: cursors[idx].upper_bound)
+    prefix_upper_bounds = []
+    upper_bound_sum = 0
+    for idx in term_order:
+        upper_bound_sum += cursors[idx].upper_bound
+        prefix_upper_bounds.append(upper_bound_sum)
+
+    first_essential = 0
+    essential = [(idx, cursors[idx]) for idx in term_order]
+    candidate_count = 0
+    while(True):
+        # Terms whose cumulated bounds can't reach the threshold become non-essential.
+        if(first_essential < len(term_order) and prefix_upper_bounds[first_essential] < prune_threshold):
+            while(first_essential < len(term_order) and prefix_upper_bounds[first_essential] < prune_threshold):
+                first_essential += 1
+            essential = [(idx, cursors[idx]) for idx in term_order[first_essential:]]
+
+        # Skip ahead when even the block bounds of the essential terms' current blocks can't reach the threshold:
+        # up to the end of the first of those blocks, no document can.
+        if(len(heap) == k):
+            block_upper_bound = prefix_upper_bounds[first_essential - 1] if first_essential > 0 else 0
+            skip_to = None
+            for idx, cursor in essential:
+                if(cursor.docID is not None):
+                    block_upper_bound += cursor.block_upper_bounds[cursor.block_idx]
+                    if(skip_to is None or cursor.block_last_docIDs[cursor.block_idx] < skip_to):
+                        skip_to = cursor.block_last_docIDs[cursor.block_idx]
+            if(skip_to is not None and block_upper_bound < prune_threshold):
+                for idx, cursor in essential:
+                    cursor.advance(skip_to + 1)
+                continue
+
+        # The next candidate is the smallest docID among the essential terms.
+        docID = None
+        for idx, cursor in essential:
+            if(cursor.docID is not None and (docID is None or cursor.docID < docID)):
+                docID = cursor.docID
+        if(docID is None):
+            break
+        candidate_count += 1
+        if(deadline is not None and candidate_count % DEADLINE_CHECK_INTERVAL == 0 and time.perf_counter() > deadline):
+            raise TimeoutError("Query ran past its deadline")
+
+        # Deleted documents are passed over before any term is scored or probed.
+        if(deleted_docs is not None and (deleted_docs[docID >> 3] >> (docID & 7)) & 1):
+            for idx, cursor in essential:
+                if(cursor.docID == docID):
+                    cursor.next()
+            continue
+
+        term_scores = {}
+        partial_score = 0
+        for idx, cursor in essential:
+            if(cursor.docID == docID):
+                term_score = cursor.score()
+                if(term_score > 0):
+                    term_scores[idx] = term_score
+                    partial_score += term_score
+                cursor.next()
+
+        # Probe the non-essential terms, highest bound first, while the document can still reach the threshold.
+        is_pruned = False
+        for pos in range(first_essential - 1, -1, -1):
+            if(partial_score + prefix_upper_bounds[pos] < prune_threshold):
+                is_pruned = True
+                break
+            cursor = cursors[term_order[pos]]
+            cursor.advance(docID)
+            if(cursor.docID == docID):
+                term_score = cursor.score()
+                if(term_score > 0):
+                    term_scores[term_order[pos]] = term_score
+                    partial_score += term_score
+
+        if(is_pruned or len(term_scores) == 0 or partial_score < prune_threshold):
+            continue
+
+        score = 0
+        for idx in sorted(term_scores):
+            score += term_scores[idx]
+        entry = (score, -docID)
+        if(len(heap) < k):
+            heapq.heappush(heap, entry)
+        elif(entry > heap[0]):
+            heapq.heapreplace(heap, entry)
+        if(len(heap) == k):
+            prune_threshold = _get_prune_threshold(heap[0][0])
+
+    return [(-entry[1], entry[0]) for entry in sorted(heap, reverse = True)]
@@ -1,19 +1,41 @@
-import xml.sax
 import os
+import json
+import time
+from datetime import datetime
+from collections import deque
 
-from preprocessor import Preprocessor
+from fastPreprocessor import PREPROCESSORS
 from titleHandler import TitleHandler
 from invertedIndexHandler import InvertedIndexHandler
+from parallelPageProcessor import ParallelPageProcessor
 
-class WikiHandler(xml.sax.ContentHandler):
-    def __init__(self, INDEX_FOLDER_PATH, MAX_WORD_CAP, TITLE_FILE_CAP, INVERTED_INDEX_TEMP_FILE_CAP, FINAL_INDEX_FILE_CAP):
-        # Initialize the WikiHandler with various parameters and objects.
+# Manifest of the last checkpoint of a build, rewritten after each temporary index file.
+CHECKPOINT_FILE_NAME = "checkpoint.json"
+
+# Seconds between the progress lines written while a build runs, and pages between checks of that interval.
+PROGRESS_INTERVAL = 10.0
+PROGRESS_CHECK_PAGES = 100
+
+
+def read_checkpoint(INDEX_FOLDER_PATH):
+    # Read the checkpoint manifest of an index folder, or return None if there isn't one.
+    checkpoint_path = os.path.join(INDEX_FOLDER_PATH, CHECKPOINT_FILE_NAME)
+    if(not os.path.isfile(checkpoint_path)):
+        return None
+    with open(checkpoint_path, "r", encoding='utf-8') as checkpoint_fp:
+        return json.load(checkpoint_fp)
+
+class WikiHandler:
+    def __init__(self, INDEX_FOLDER_PATH, MAX_WORD_CAP, TITLE_FILE_CAP, INVERTED_INDEX_MEMORY_BUDGET, FINAL_INDEX_FILE_CAP, WORKER_COUNT = 1, WORKER_BATCH_SIZE = 100, MAX_PENDING_BATCHES = 8, MERGE_WORKER_COUNT = 1, PREPROCESSOR = "nltk"):
+        # Initialize the WikiHandler, which indexes the pages of a wiki dump as they are extracted.
 
         self.INDEX_FOLDER_PATH = INDEX_FOLDER_PATH
         self.MAX_WORD_CAP = MAX_WORD_CAP
         self.TITLE_FILE_CAP = TITLE_FILE_CAP
-        self.INVERTED_INDEX_TEMP_FILE_CAP = INVERTED_INDEX_TEMP_FILE_CAP
+        self.INVERTED_INDEX_MEMORY_BUDGET = INVERTED_INDEX_MEMORY_BUDGET
         self.FINAL_INDEX_FILE_CAP = FINAL_INDEX_FILE_CAP
+        self.WORKER_COUNT = WORKER_COUNT
+        self.MERGE_WORKER_COUNT = MERGE_WORKER_COUNT
 
         # Initialize counters for statistics
         self.TotalDocCount = 0
@@ -22,70 +44,216 @@ class WikiHandler(xml.sax.ContentHandler):
         self.TotalWords = 0
         self.TitleFileCount = 0
         self.PrimaryIndexFileCount = 0
+        self.StemCacheHits = 0
+        self.StemCacheMisses = 0
+        self.StemCacheMemory = 0
+        self.MaxTermCount = 0
+        self.MaxTermTableMemory = 0
+        self.MaxTempIndexMemory = 0
+        self.MergeBytesRead = 0
+        self.MergeTime = 0.0
 
-        # Define allowed XML tags and fields.
-        self.allowed_tags = ["title", "text"]
-        self.fields = ["title", "body", "infobox", "category", "link", "reference"]
         self.docID = 0
-        self.current_tag = ""
-        self.page_data = {}
-        self.wiki_data = {}
+
+        # Timers of the build: when it started, the seconds spent in add_page, and when the last page was added.
+        # The time between pages is spent reading them from the input, whose byte offset so far is kept too.
+        self.start_time = time.perf_counter()
+        self.add_page_time = 0.0
+        self.index_end_time = None
+        self.input_offset = 0
+
+        # File the build statistics are appended to as JSON lines, every PROGRESS_INTERVAL seconds, if set.
+        self.progress_fp = None
+        self.PROGRESS_INTERVAL = PROGRESS_INTERVAL
+        self.last_progress_time = self.start_time
+
+        # Input byte offsets of the ends of the pages not yet in a temporary index file, as (docID, offset),
+        # and the description of the input stored in the checkpoints, to check a resumed build reads the same input.
+        self.page_end_offsets = deque()
+        self.checkpoint_input = {}
 
         # Create instances of preprocessor, title handler, and inverted index handler.
-        self.preprocessor = Preprocessor(self.MAX_WORD_CAP)
+        self.preprocessor = PREPROCESSORS[PREPROCESSOR](self.MAX_WORD_CAP)
         self.titleHandler = TitleHandler(self.INDEX_FOLDER_PATH, self.TITLE_FILE_CAP)
-        self.invertedIndexHandler = InvertedIndexHandler(self.INDEX_FOLDER_PATH, self.INVERTED_INDEX_TEMP_FILE_CAP, self.FINAL_INDEX_FILE_CAP)
+        self.invertedIndexHandler = InvertedIndexHandler(self.INDEX_FOLDER_PATH, self.INVERTED_INDEX_MEMORY_BUDGET, self.FINAL_INDEX_FILE_CAP)
+
+        # With more than one worker, pages are preprocessed by a pool of worker processes
+        # and their word counts are handed back to the inverted index handler in docID order.
+        self.pageProcessor = None
+        if(self.WORKER_COUNT > 1):
+            self.pageProcessor = ParallelPageProcessor(self.MAX_WORD_CAP, self.WORKER_COUNT, WORKER_BATCH_SIZE, MAX_PENDING_BATCHES, self.invertedIndexHandler.add_word_counts, PREPROCESSOR)
+
+        # Checkpoint the build every time a temporary index file is written, and report the progress of the merge.
+        self.invertedIndexHandler.on_temp_index_dumped = self._write_checkpoint
+        self.invertedIndexHandler.on_merge_progress = lambda: self.write_progress("merge")
+
+    def _write_checkpoint(self):
+        # Write the checkpoint manifest: the documents in the temporary index files so far,
+        # and the input byte offset to read the following pages from.
+        doc_count = self.invertedIndexHandler.total_doc_count
+        input_offset = None
+        while(len(self.page_end_offsets) > 0 and self.page_end_offsets[0][0] < doc_count):
+            input_offset = self.page_end_offsets.popleft()[1]
+
+        # Flush the titles, so the title store holds the titles of those documents.
+        if(len(self.titleHandler.titles) > 0):
+            self.titleHandler._dump_titles_to_file()
+
+        words_encountered = self.preprocessor.TotalWordsEncountered
+        if(self.pageProcessor is not None):
+            words_encountered += self.pageProcessor.TotalWordsEncountered
+        checkpoint = {
+            "input": self.checkpoint_input,
+            "input_offset": input_offset,
+            "doc_count": doc_count,
+            "temp_index_file_count": self.invertedIndexHandler.temp_index_file_count,
+            "words_encountered": words_encountered,
+            "max_term_count": self.invertedIndexHandler.max_term_count,
+            "max_term_table_size": self.invertedIndexHandler.max_term_table_size,
+            "max_inverted_index_memory": self.invertedIndexHandler.max_inverted_index_memory,
+        }
 
-    def startElement(self, tag, attributes):
-        # Handle the start of an XML element.
+        # Replace the previous manifest in one step, so a crash leaves either the old or the new one.
+        checkpoint_path = os.path.join(self.INDEX_FOLDER_PATH, CHECKPOINT_FILE_NAME)
+        with open(checkpoint_path + ".tmp", "w", encoding='utf-8') as checkpoint_fp:
+            json.dump(checkpoint, checkpoint_fp, indent = 2)
+        os.replace(checkpoint_path + ".tmp", checkpoint_path)
 
-        self.current_tag = tag
-        if(tag == 'page'):
-            self.page_data = {}
-            for tag in self.allowed_tags:
-                self.page_data[tag] = ""
+    def resume(self, checkpoint):
+        # Restore the state of a build from its checkpoint manifest.
+        # The pages must then be added again from the checkpoint's input offset.
+        self.docID = checkpoint["doc_count"]
+        self.titleHandler.restore_title_store(checkpoint["doc_count"])
+        self.invertedIndexHandler.restore_temp_indexes(checkpoint["temp_index_file_count"], checkpoint["doc_count"], checkpoint["max_term_count"], checkpoint["max_term_table_size"], checkpoint["max_inverted_index_memory"])
+        self.preprocessor.TotalWordsEncountered = checkpoint["words_encountered"]
 
-            self.wiki_data = {}
-            for field in self.fields:
-                self.wiki_data[field] = ""
+    def add_page(self, title, text, input_offset = None):
+        # Index a page, skipping pages without a title or text.
+        # input_offset is the byte offset of the end of the page in the input, recorded by checkpoints.
 
-    def endElement(self, tag):
-        # Handle the end of an XML element.
+        if len(title) > 0 and len(text) > 0:
+            start_time = time.perf_counter()
+            if(input_offset is not None):
+                self.page_end_offsets.append((self.docID, input_offset))
+                self.input_offset = input_offset
+            self.titleHandler.add_title(title.replace("\n", " "))
 
-        if(tag == 'page'):
-            if len(self.page_data["title"]) > 0 and len(self.page_data["text"]) > 0:
+            if(self.pageProcessor is not None):
+                # Hand the raw page over to the worker pool.
+                self.pageProcessor.add_page(self.docID, title, text)
+            else:
                 # Process title and text data.
-                self.wiki_data['title'] = self.preprocessor.process_title(self.page_data['title'])
-                self.wiki_data['infobox'], self.wiki_data['body'], self.wiki_data['category'], self.wiki_data['link'], self.wiki_data['reference'] = self.preprocessor.process_text(self.page_data['text'])
-                
-                # Add title and inverted index data.
-                self.titleHandler.add_title(self.page_data["title"].replace("\n", " "))
-                self.invertedIndexHandler.add_inverted_index(self.docID, self.wiki_data)
-
-                if(self.docID % 1000 == 0):
-                    print("Document Processed :", self.docID, end = "\r")
-                self.docID += 1
-
-
-        # Handle the end of the "mediawiki" element to finalize processing.
-        if tag == "mediawiki":
-            print("Document Processed :", self.docID)
-
-            # Add the last chunk of title and inverted index data.
-            self.titleHandler.add_title(title = None, isLast = True)
-            self.invertedIndexHandler.add_inverted_index(docID = None, wiki_data = None, isLast = True)
-            self.invertedIndexHandler.merge_temp_indexes()
-
-            # Update counters and statistics.
-            self.TotalDocCount = self.docID
-            self.TotalWordsEncountered = self.preprocessor.TotalWordsEncountered
-            self.TotalUniqueWords = self.invertedIndexHandler.total_unique_words
-            self.TotalWords = self.invertedIndexHandler.total_words
-            self.TitleFileCount = self.invertedIndexHandler.temp_index_file_count
-            self.PrimaryIndexFileCount = self.invertedIndexHandler.final_index_file_count
-
-    def characters(self, content):
-        # Handle character content within XML elements.
-
-        if self.current_tag in self.allowed_tags:
-            self.page_data[self.current_tag] += content.strip()
+                wiki_data = {}
+                wiki_data['title'] = self.preprocessor.process_title(title)
+                wiki_data['infobox'], wiki_data['body'], wiki_data['category'], wiki_data['link'], wiki_data['reference'] = self.preprocessor.process_text(text)
+
+                # Add inverted index data.
+                self.invertedIndexHandler.add_inverted_index(self.docID, wiki_data)
+
+            if(self.docID % 1000 == 0):
+                print("Document Processed :", self.docID, end = "\r")
+            self.docID += 1
+            self.add_page_time += time.perf_counter() - start_time
+
+            if(self.progress_fp is not None and self.docID % PROGRESS_CHECK_PAGES == 0):
+                self.write_progress("index")
+
+    def finish(self):
+        # Finalize the index once every page was added.
+        print("Document Processed :", self.docID)
+
+        self.index_end_time = time.perf_counter()
+
+        # Wait for the pages still being processed by the worker pool.
+        if(self.pageProcessor is not None):
+            self.pageProcessor.finish()
+
+        # Add the last chunk of title and inverted index data.
+        self.titleHandler.add_title(title = None, isLast = True)
+        self.invertedIndexHandler.add_inverted_index(docID = None, wiki_data = None, isLast = True)
+        self.write_progress("index", force = True)
+        self.invertedIndexHandler.merge_temp_indexes(self.MERGE_WORKER_COUNT)
+        self.write_progress("merge", force = True)
+
+        # Update counters and statistics.
+        self.TotalDocCount = self.docID
+        self.TotalWordsEncountered = self.preprocessor.TotalWordsEncountered
+        if(self.pageProcessor is not None):
+            self.TotalWordsEncountered += self.pageProcessor.TotalWordsEncountered
+        self.TotalUniqueWords = self.invertedIndexHandler.total_unique_words
+        self.TotalWords = self.invertedIndexHandler.total_words
+        self.TitleFileCount = self.invertedIndexHandler.temp_index_file_count
+        self.PrimaryIndexFileCount = self.invertedIndexHandler.final_index_file_count
+        self.StemCacheHits, self.StemCacheMisses, self.StemCacheMemory = self.preprocessor.get_stem_cache_stats()
+        if(self.pageProcessor is not None):
+            hits, misses, memory = self.pageProcessor.get_stem_cache_stats()
+            self.StemCacheHits += hits
+            self.StemCacheMisses += misses
+            self.StemCacheMemory += memory
+        self.MaxTermCount = self.invertedIndexHandler.max_term_count
+        self.MaxTermTableMemory = self.invertedIndexHandler.max_term_table_size
+        self.MaxTempIndexMemory = self.invertedIndexHandler.max_inverted_index_memory
+        self.MergeBytesRead = self.invertedIndexHandler.merge_bytes_read
+        self.MergeTime = self.invertedIndexHandler.merge_time
+
+    def get_build_stats(self):
+        # Return the statistics of the build so far: the seconds spent in each stage, the bytes read and written,
+        # the temporary index spills and the memory of the temporary index.
+        # With more than one worker, the preprocessing stages run in the worker processes, and their seconds are summed over them.
+        now = time.perf_counter()
+        index_end_time = self.index_end_time if self.index_end_time is not None else now
+        stage_times = self.preprocessor.get_stage_times()
+        if(self.pageProcessor is not None):
+            for stage, stage_time in self.pageProcessor.get_stage_times().items():
+                stage_times[stage] += stage_time
+        invertedIndexHandler = self.invertedIndexHandler
+
+        return {
+            "elapsed_seconds": now - self.start_time,
+            "documents": self.docID,
+            "pages_per_second": self.docID / (index_end_time - self.start_time) if index_end_time > self.start_time else 0.0,
+            "stages": {
+                "parse": max(index_end_time - self.start_time - self.add_page_time, 0.0),
+                "cleanup": stage_times["cleanup"],
+                "tokenize": stage_times["tokenize"],
+                "stem": stage_times["stem"],
+                "invert": invertedIndexHandler.invert_time,
+                "titles": self.titleHandler.title_write_time,
+                "spill": invertedIndexHandler.spill_time,
+                "merge": invertedIndexHandler.merge_time
+            },
+            "bytes_read": {
+                "dump": self.input_offset,
+                "temp_index": invertedIndexHandler.merge_bytes_read
+            },
+            "bytes_written": {
+                "titles": self.titleHandler.title_bytes_written,
+                "temp_index": invertedIndexHandler.spill_bytes_written,
+                "index": invertedIndexHandler.merge_bytes_written
+            },
+            "spills": {
+                "count": invertedIndexHandler.temp_index_file_count,
+                "bytes": invertedIndexHandler.spill_bytes_written
+            },
+            "memory": {
+                "temp_index_bytes": invertedIndexHandler.inverted_index_size,
+                "temp_index_budget_bytes": invertedIndexHandler.INVERTED_INDEX_MEMORY_BUDGET,
+                "peak_temp_index_bytes": invertedIndexHandler.max_inverted_index_memory,
+                "peak_term_count": invertedIndexHandler.max_term_count
+            }
+        }
+
+    def write_progress(self, stage, force = False):
+        # Append the build statistics so far to the progress file as a JSON line,
+        # at most every PROGRESS_INTERVAL seconds unless forced.
+        if(self.progress_fp is None):
+            return
+        now = time.perf_counter()
+        if(not force and now - self.last_progress_time < self.PROGRESS_INTERVAL):
+            return
+        self.last_progress_time = now
+
+        progress = {"time": datetime.utcnow().isoformat() + "Z", "stage": stage}
+        progress.update(self.get_build_stats())
+        self.progress_fp.write(json.dumps(progress) + "\n")
+        self.progress_fp.flush()
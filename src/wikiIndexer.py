@@ -1,22 +1,51 @@
 # Libraries
-import xml.sax
 import os
 import sys
+import json
+import shutil
+import argparse
+import subprocess
 from datetime import datetime
+from xml.sax.saxutils import escape
 
-from wikiHandler import WikiHandler
+from wikiHandler import WikiHandler, read_checkpoint, PROGRESS_INTERVAL
+from pageExtractor import PageExtractor, read_chunks, skip_chunk_bytes
+from multistreamReader import MultistreamReader, get_stream_index_path
 from secondaryIndexHandler import SecondaryIndexHandler
+from fastPreprocessor import PREPROCESSORS
+from segmentHandler import SEGMENT_FOLDER_PREFIX, SEGMENT_MANIFEST_FILE_NAME, SHARD_FOLDER_PREFIX, SHARD_MANIFEST_FILE_NAME, SEGMENT_FILE_PREFIXES, get_title_count, write_shard_manifest, read_segment_manifest, write_segment_manifest, lock_segment_manifest, find_title_docIDs, delete_documents
+from titleHandler import TitleHandler
 
 # Global Variables
 WIKI_DUMP_XML_FILE_PATH = "wikiDump.xml"
 INDEX_FOLDER_PATH = "indexFolder"
 STAT_FILE_NAME = "fileStat.txt"
+# JSON statistics report, and JSON lines progress file, written next to the stat file by default.
+STAT_JSON_FILE_NAME = "fileStat.json"
+PROGRESS_FILE_NAME = "fileStat.progress.jsonl"
 
 MAX_WORD_CAP = 30
 TITLE_FILE_CAP = 20000
-INVERTED_INDEX_TEMP_FILE_CAP = 100000000
+INVERTED_INDEX_MEMORY_BUDGET = 1 << 30
 FINAL_INDEX_FILE_CAP = 100000000
+SECONDARY_INDEX_SAMPLE_RATE = 64
+WORKER_COUNT = 1
+WORKER_BATCH_SIZE = 100
+MAX_PENDING_BATCHES = 8
+MERGE_WORKER_COUNT = 1
+PREPROCESSOR = "nltk"
+MAX_PENDING_STREAMS = 16
 STATS = {}
+# Dump path that reads an uncompressed xml dump from standard input, as the shard builds of a sharded index do.
+STDIN_DUMP_PATH = "-"
+
+# Number of document-partitioned shards of the index, and the shard built by this process, None for all of them.
+SHARD_COUNT = 1
+SHARD_INDEX = None
+
+# Folder the index is built into: the index folder itself, or a new segment folder of it when adding a delta dump.
+BUILD_FOLDER_PATH = INDEX_FOLDER_PATH
+SEGMENT_NAME = ""
 
 
 def convertSize(fileSize):
@@ -36,14 +65,14 @@ def convertSize(fileSize):
     return convertedSize
 
 def get_index_size():
-    # Calculate the total size of index files.
+    # Calculate the total size of index files in bytes.
     index_size = 0
-    for file in os.listdir(INDEX_FOLDER_PATH):
-        if(file.startswith("index_") or file.startswith("secondary_index") or file.startswith("title")):
-            fp = os.path.join(INDEX_FOLDER_PATH, file)
+    for file in os.listdir(BUILD_FOLDER_PATH):
+        if(file.startswith("index_") or file.startswith("secondary_index") or file.startswith("term_dictionary") or file.startswith("title")):
+            fp = os.path.join(BUILD_FOLDER_PATH, file)
             size = os.path.getsize(fp)
             index_size += size
-    return convertSize(index_size)
+    return index_size
 
 
 def generate_statistics():
@@ -58,9 +87,35 @@ def generate_statistics():
         stat_fp.write("Primary Index File count: \t\t" + str(STATS["PrimaryIndexFileCount"]) + "\n")
         stat_fp.write("Secondary Index File count: \t" + str(STATS["SecondaryIndexFileCount"]) + "\n")
         stat_fp.write("Index Size: \t\t\t\t\t" + str(STATS["IndexSize"]) + "\n")
+        stat_fp.write("Stem Cache Hit Rate: \t\t\t%.2f%%\n" % (STATS["StemCacheHitRate"] * 100))
+        stat_fp.write("Stem Cache Memory: \t\t\t\t" + str(STATS["StemCacheMemory"]) + "\n")
+        stat_fp.write("Max Terms per Temp Index: \t\t" + str(STATS["MaxTermCount"]) + "\n")
+        stat_fp.write("Max Term Table Memory: \t\t\t" + str(STATS["MaxTermTableMemory"]) + "\n")
+        stat_fp.write("Max Temp Index Memory: \t\t\t" + str(STATS["MaxTempIndexMemory"]) + "\n")
+        stat_fp.write("Temp Index Size: \t\t\t\t" + str(STATS["TempIndexSize"]) + "\n")
+        stat_fp.write("Merge Throughput: \t\t\t\t%.2f MB/second\n" % (STATS["MergeThroughput"]))
         stat_fp.write("Primary Index Creation Time: \t" + str(STATS["PrimaryIndexTime"]) + "\n")
         stat_fp.write("Secondary Index Creation Time: \t" + str(STATS["SecondaryIndexTime"]) + "\n")
 
+def generate_json_statistics(build_stats):
+    # Write the totals and the per-stage statistics of the build to the JSON statistics report.
+    report = {
+        "total_doc_count": STATS["TotalDocCount"],
+        "total_words_encountered": STATS["TotalWordsEncountered"],
+        "total_words": STATS["TotalWords"],
+        "total_unique_words": STATS["TotalUniqueWords"],
+        "primary_index_file_count": STATS["PrimaryIndexFileCount"],
+        "secondary_index_file_count": STATS["SecondaryIndexFileCount"],
+        "index_bytes": STATS["IndexBytes"],
+        "stem_cache_hit_rate": STATS["StemCacheHitRate"],
+        "merge_mb_per_second": STATS["MergeThroughput"],
+        "primary_index_seconds": STATS["PrimaryIndexTime"],
+        "secondary_index_seconds": STATS["SecondaryIndexTime"]
+    }
+    report.update(build_stats)
+    with open(STAT_JSON_FILE_NAME, "w", encoding='utf-8') as stat_json_fp:
+        json.dump(report, stat_json_fp, indent = 2)
+
 
 def purgeFiles(folderName, fileNamePrefix) :
     # Delete files in a folder that have a specified prefix.
@@ -68,46 +123,282 @@ def purgeFiles(folderName, fileNamePrefix) :
         if file.startswith(fileNamePrefix):
             os.remove(os.path.join(folderName, file))
 
+def purgeSegments(folderName):
+    # Delete the segments added to an index folder, and its segment manifest.
+    for file in os.listdir(folderName):
+        if file.startswith(SEGMENT_FOLDER_PREFIX):
+            shutil.rmtree(os.path.join(folderName, file))
+    purgeFiles(folderName, SEGMENT_MANIFEST_FILE_NAME)
+
+def purgeShards(folderName):
+    # Delete the shards of an index folder, and its shard manifest.
+    for file in os.listdir(folderName):
+        if file.startswith(SHARD_FOLDER_PREFIX):
+            shutil.rmtree(os.path.join(folderName, file))
+    purgeFiles(folderName, SHARD_MANIFEST_FILE_NAME)
+
+def iter_shard_pages(pages):
+    # The pages of the dump indexed by the shard being built: of the pages getting a docID, every SHARD_COUNT-th one from the SHARD_INDEX-th.
+    # A page's docID in the shard times SHARD_COUNT, plus SHARD_INDEX, is then its docID in an unsharded index of the dump.
+    page_idx = 0
+    for title, text in pages:
+        if(len(title) == 0 or len(text) == 0):
+            continue
+        if(page_idx % SHARD_COUNT == SHARD_INDEX):
+            yield title, text
+        page_idx += 1
+
+def iter_dump_pages(pageExtractor, input_offset, stream_index_path):
+    # Stream the (title, text) pages of the dump from a page boundary.
+    # bz2 dumps are decompressed on the fly, their independent streams in parallel when a stream index is available.
+    # A resumed bz2 dump is decompressed from its start again, up to the offset in the decompressed xml.
+    if(WIKI_DUMP_XML_FILE_PATH == STDIN_DUMP_PATH):
+        return pageExtractor.iter_pages(read_chunks(sys.stdin.buffer))
+    if(WIKI_DUMP_XML_FILE_PATH.endswith(".bz2")):
+        if stream_index_path is None:
+            stream_index_path = get_stream_index_path(WIKI_DUMP_XML_FILE_PATH)
+        multistreamReader = MultistreamReader(WIKI_DUMP_XML_FILE_PATH, stream_index_path, DECOMPRESS_WORKER_COUNT, MAX_PENDING_STREAMS)
+        return pageExtractor.iter_pages(skip_chunk_bytes(multistreamReader.iter_chunks(), input_offset), input_offset)
+    return pageExtractor.iter_file_pages(WIKI_DUMP_XML_FILE_PATH, input_offset)
+
+def build_shards(shard_args, stream_index_path):
+    # Build every shard of the index at once, each by an indexer process of its own into its shard folder,
+    # with its own statistics files next to the stat file, then list them in the shard manifest.
+    # The dump is only read and parsed here, once: the pages are dealt out to the shards in turn, every shard process
+    # reading its own pages as an xml dump from its standard input.
+    # shard_args are the options passed on to the shard builds. Returns whether every shard was built.
+    stat_file_root, stat_file_ext = os.path.splitext(STAT_FILE_NAME)
+    indexer_path = os.path.abspath(__file__)
+    processes = []
+    for shard_idx in range(SHARD_COUNT):
+        shard_name = SHARD_FOLDER_PREFIX + str(shard_idx)
+        shard_stat_file_name = stat_file_root + "_" + shard_name + stat_file_ext
+        command = [sys.executable, indexer_path, STDIN_DUMP_PATH, os.path.join(INDEX_FOLDER_PATH, shard_name), shard_stat_file_name] + shard_args
+        processes.append((shard_name, subprocess.Popen(command, stdin = subprocess.PIPE, stdout = subprocess.DEVNULL)))
+
+    # A page's docID in its shard times SHARD_COUNT, plus the shard's index, is its docID in an unsharded index of the dump.
+    built = True
+    try:
+        for shard_name, process in processes:
+            process.stdin.write(b"<mediawiki>\n")
+        page_idx = 0
+        for title, text in iter_dump_pages(PageExtractor(), 0, stream_index_path):
+            if(len(title) == 0 or len(text) == 0):
+                continue
+            processes[page_idx % SHARD_COUNT][1].stdin.write(("<page><title>" + escape(title) + "</title><text>" + escape(text) + "</text></page>\n").encode('utf-8'))
+            page_idx += 1
+        for shard_name, process in processes:
+            process.stdin.write(b"</mediawiki>\n")
+    except BrokenPipeError:
+        built = False
+    for shard_name, process in processes:
+        try:
+            process.stdin.close()
+        except BrokenPipeError:
+            pass
+
+    shards = []
+    for shard_name, process in processes:
+        if(process.wait() != 0):
+            print("Building shard '" + shard_name + "' failed")
+            built = False
+        shards.append({"name": shard_name, "doc_count": get_title_count(os.path.join(INDEX_FOLDER_PATH, shard_name))})
+    if built:
+        write_shard_manifest(INDEX_FOLDER_PATH, {"shard_count": SHARD_COUNT, "doc_count": sum(shard["doc_count"] for shard in shards), "shards": shards})
+    return built
+
+def find_resumable_segment(checkpoint_input):
+    # Find the segment folder of an interrupted add of the same dump: not yet in the manifest, but with its checkpoint.
+    listed_segments = set(segment["name"] for segment in read_segment_manifest(INDEX_FOLDER_PATH)["segments"])
+    for file in sorted(os.listdir(INDEX_FOLDER_PATH)):
+        if(file.startswith(SEGMENT_FOLDER_PREFIX) and file not in listed_segments):
+            checkpoint = read_checkpoint(os.path.join(INDEX_FOLDER_PATH, file))
+            if(checkpoint is not None and checkpoint["input"] == checkpoint_input):
+                return file
+    return None
+
+def reserve_segment():
+    # Take the next segment id of the manifest for a new segment folder.
+    with lock_segment_manifest(INDEX_FOLDER_PATH):
+        manifest = read_segment_manifest(INDEX_FOLDER_PATH)
+        segment_name = SEGMENT_FOLDER_PREFIX + str(manifest["next_segment_id"])
+        manifest["next_segment_id"] += 1
+        write_segment_manifest(INDEX_FOLDER_PATH, manifest)
+    os.mkdir(os.path.join(INDEX_FOLDER_PATH, segment_name))
+    return segment_name
+
+def publish_segment(doc_count, replace = False):
+    # List the built segment in the manifest, after the last segment, so searchers start querying it.
+    # A full build replaces the manifest with its single segment.
+    # With replace, the documents of the other segments titled like one of the segment's are deleted in the same step,
+    # so searchers switch from the old versions of the pages to the new ones at once.
+    # Returns the number of replaced documents.
+    replaced_count = 0
+    with lock_segment_manifest(INDEX_FOLDER_PATH):
+        if(SEGMENT_NAME == ""):
+            manifest = {"next_segment_id": 1, "segments": []}
+        else:
+            manifest = read_segment_manifest(INDEX_FOLDER_PATH)
+        if(replace):
+            titleHandler = TitleHandler(BUILD_FOLDER_PATH, TITLE_FILE_CAP)
+            titles = [titleHandler.get_title(docID) for docID in range(doc_count)]
+            replaced_count = delete_documents(INDEX_FOLDER_PATH, manifest, find_title_docIDs(INDEX_FOLDER_PATH, manifest, titles))
+        doc_base = 0
+        if(len(manifest["segments"]) > 0):
+            doc_base = manifest["segments"][-1]["doc_base"] + manifest["segments"][-1]["doc_count"]
+        manifest["segments"].append({"name": SEGMENT_NAME, "doc_base": doc_base, "doc_count": doc_count})
+        write_segment_manifest(INDEX_FOLDER_PATH, manifest)
+    return replaced_count
+
+def start_segment_merger():
+    # Merge small segments in a background process, which outlives the indexer.
+    merger_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "segmentMerger.py")
+    subprocess.Popen([sys.executable, merger_path, INDEX_FOLDER_PATH], stdout = subprocess.DEVNULL, start_new_session = True)
+
 
 if __name__ == "__main__":
-    if(len(sys.argv) != 4):
-        print("Invalid number of arguments")
-        print("Expected 3 arguments: <path_to_wiki_xml_dump> <path_to_index_folder> <stat_file_name>")
-        exit(1)
+    argParser = argparse.ArgumentParser(description = "Build the inverted index of a wiki xml dump.")
+    argParser.add_argument("wiki_dump_path", help = "path to the wiki xml dump, or to a .xml.bz2 multistream dump, or - to read an xml dump from standard input")
+    argParser.add_argument("index_folder_path", help = "path to the index folder")
+    argParser.add_argument("stat_file_name", help = "file to write the indexing statistics to")
+    argParser.add_argument("--workers", type = int, default = WORKER_COUNT, help = "number of worker processes preprocessing pages (default: %(default)s, i.e. serial)")
+    argParser.add_argument("--merge-workers", type = int, default = None, help = "number of worker processes merging term ranges of the temporary indexes (default: same as --workers)")
+    argParser.add_argument("--preprocessor", choices = sorted(PREPROCESSORS), default = PREPROCESSOR, help = "preprocessing backend, both produce the same tokens (default: %(default)s)")
+    argParser.add_argument("--stream-index", default = None, help = "stream index of a multistream .xml.bz2 dump (default: the multistream-index.txt.bz2 next to the dump)")
+    argParser.add_argument("--decompress-workers", type = int, default = None, help = "number of worker processes decompressing bz2 streams (default: same as --workers)")
+    argParser.add_argument("--memory-budget-mb", type = int, default = None, help = "memory of the in-memory inverted index, in MB, before it's written to a temporary index file (default: %d)" % (INVERTED_INDEX_MEMORY_BUDGET >> 20))
+    argParser.add_argument("--resume", action = "store_true", help = "carry on an interrupted build of the same dump from its last checkpoint, instead of starting over")
+    argParser.add_argument("--add", action = "store_true", help = "index a delta dump into a new segment of an existing index folder, instead of rebuilding it")
+    argParser.add_argument("--replace", action = "store_true", help = "with --add, delete the documents of the index with the same titles as pages of the delta dump, to update them")
+    argParser.add_argument("--no-merge", action = "store_true", help = "with --add, don't merge small segments in the background afterwards")
+    argParser.add_argument("--stats-json", default = None, help = "file to write the JSON statistics report to (default: the stat file with a .json extension)")
+    argParser.add_argument("--progress-file", default = None, help = "file to write JSON lines of progress to while the build runs (default: the stat file with a .progress.jsonl extension)")
+    argParser.add_argument("--progress-interval", type = float, default = PROGRESS_INTERVAL, help = "seconds between progress lines (default: %(default)s)")
+    argParser.add_argument("--shards", type = int, default = SHARD_COUNT, help = "split the index into this many document-partitioned shards, built at once by as many processes (default: %(default)s)")
+    argParser.add_argument("--shard-index", type = int, default = None, help = "with --shards, only build this shard of the index, into the index folder (default: build all of them)")
+    args = argParser.parse_args()
+    if(args.shards > 1 and (args.add or args.resume)):
+        argParser.error("--add and --resume can't be used with --shards")
+    if(args.wiki_dump_path == STDIN_DUMP_PATH and (args.resume or args.shards > 1)):
+        argParser.error("a dump read from standard input can't be resumed or sharded")
+    if(args.shard_index is not None and not 0 <= args.shard_index < args.shards):
+        argParser.error("--shard-index must be between 0 and --shards - 1")
 
     # Set the paths and filenames based on command-line arguments.
-    WIKI_DUMP_XML_FILE_PATH = os.path.abspath(sys.argv[1])
-    INDEX_FOLDER_PATH = os.path.abspath(sys.argv[2])
-    STAT_FILE_NAME = sys.argv[3]
+    WIKI_DUMP_XML_FILE_PATH = os.path.abspath(args.wiki_dump_path) if args.wiki_dump_path != STDIN_DUMP_PATH else STDIN_DUMP_PATH
+    INDEX_FOLDER_PATH = os.path.abspath(args.index_folder_path)
+    STAT_FILE_NAME = args.stat_file_name
+    STAT_JSON_FILE_NAME = args.stats_json if args.stats_json is not None else os.path.splitext(STAT_FILE_NAME)[0] + ".json"
+    PROGRESS_FILE_NAME = args.progress_file if args.progress_file is not None else os.path.splitext(STAT_FILE_NAME)[0] + ".progress.jsonl"
+    WORKER_COUNT = args.workers
+    PREPROCESSOR = args.preprocessor
+    MERGE_WORKER_COUNT = args.merge_workers if args.merge_workers is not None else WORKER_COUNT
+    DECOMPRESS_WORKER_COUNT = args.decompress_workers if args.decompress_workers is not None else WORKER_COUNT
+    if(args.memory_budget_mb is not None):
+        INVERTED_INDEX_MEMORY_BUDGET = args.memory_budget_mb << 20
+    SHARD_COUNT = args.shards
+    SHARD_INDEX = args.shard_index
 
-    if(not os.path.isfile(WIKI_DUMP_XML_FILE_PATH)):
+    if(WIKI_DUMP_XML_FILE_PATH != STDIN_DUMP_PATH and not os.path.isfile(WIKI_DUMP_XML_FILE_PATH)):
         print("Invalid wiki xml file path")
         exit(1)
 
+    if(args.add and get_title_count(INDEX_FOLDER_PATH) == 0 and not os.path.isfile(os.path.join(INDEX_FOLDER_PATH, SEGMENT_MANIFEST_FILE_NAME))):
+        print("No index to add to in the index folder, build it without --add first")
+        exit(1)
+
     if(not os.path.isdir(INDEX_FOLDER_PATH)):
-        print("Index folder doesn't exist, creating index folder : '", sys.argv[2], "'", sep = '')
+        print("Index folder doesn't exist, creating index folder : '", args.index_folder_path, "'", sep = '')
         os.mkdir(INDEX_FOLDER_PATH)
 
+    # A sharded index is built by one indexer process per shard, sharing the memory budget.
+    # The IDF of the shards' terms is taken over all shards at query time, by the broker (see searchBroker.py).
+    STREAM_INDEX_PATH = os.path.abspath(args.stream_index) if args.stream_index is not None else None
+    if(SHARD_COUNT > 1 and SHARD_INDEX is None):
+        purgeSegments(INDEX_FOLDER_PATH)
+        purgeShards(INDEX_FOLDER_PATH)
+        for fileNamePrefix in SEGMENT_FILE_PREFIXES + ["temp_index_", "checkpoint"]:
+            purgeFiles(INDEX_FOLDER_PATH, fileNamePrefix)
+        shard_args = ["--workers", str(WORKER_COUNT), "--merge-workers", str(MERGE_WORKER_COUNT), "--preprocessor", PREPROCESSOR]
+        shard_args += ["--memory-budget-mb", str(max(INVERTED_INDEX_MEMORY_BUDGET // SHARD_COUNT >> 20, 1)), "--progress-interval", str(args.progress_interval)]
+
+        start_time = datetime.utcnow()
+        if(not build_shards(shard_args, STREAM_INDEX_PATH)):
+            exit(1)
+        STATS["IndexTime"] = (datetime.utcnow() - start_time).total_seconds()
+        STATS["TotalDocCount"] = sum(get_title_count(os.path.join(INDEX_FOLDER_PATH, SHARD_FOLDER_PREFIX + str(shard_idx))) for shard_idx in range(SHARD_COUNT))
+        STATS["IndexBytes"] = 0
+        for shard_idx in range(SHARD_COUNT):
+            BUILD_FOLDER_PATH = os.path.join(INDEX_FOLDER_PATH, SHARD_FOLDER_PREFIX + str(shard_idx))
+            STATS["IndexBytes"] += get_index_size()
+        print("Index creation time:", STATS["IndexTime"], "seconds")
+        with open(STAT_FILE_NAME, "w", encoding='utf-8') as stat_fp:
+            stat_fp.write("Total Documents: \t\t\t\t" + str(STATS["TotalDocCount"]) + "\n")
+            stat_fp.write("Shard Count: \t\t\t\t\t" + str(SHARD_COUNT) + "\n")
+            stat_fp.write("Index Size: \t\t\t\t\t" + convertSize(STATS["IndexBytes"]) + "\n")
+            stat_fp.write("Index Creation Time: \t\t\t" + str(STATS["IndexTime"]) + "\n")
+        exit(0)
+
+    # The checkpoints identify the dump by its path and size.
+    checkpoint_input = {"wiki_dump_path": WIKI_DUMP_XML_FILE_PATH, "wiki_dump_size": os.path.getsize(WIKI_DUMP_XML_FILE_PATH) if WIKI_DUMP_XML_FILE_PATH != STDIN_DUMP_PATH else 0}
+
+    # A delta dump is indexed into a new segment folder, or the one of its interrupted add when resuming.
+    if(args.add):
+        if(args.resume):
+            SEGMENT_NAME = find_resumable_segment(checkpoint_input)
+        if(SEGMENT_NAME is None or SEGMENT_NAME == ""):
+            SEGMENT_NAME = reserve_segment()
+    BUILD_FOLDER_PATH = os.path.join(INDEX_FOLDER_PATH, SEGMENT_NAME)
+
+    checkpoint = None
+    if(args.resume):
+        checkpoint = read_checkpoint(BUILD_FOLDER_PATH)
+        if(checkpoint is None):
+            print("No checkpoint found, starting a new build")
+        elif(checkpoint["input"] != checkpoint_input):
+            print("The checkpoint is for another dump :", checkpoint["input"]["wiki_dump_path"])
+            exit(1)
+
     # Delete files with specific prefixes to prepare for indexing.
-    purgeFiles(INDEX_FOLDER_PATH, "title_")
-    purgeFiles(INDEX_FOLDER_PATH, "temp_index_")
-    purgeFiles(INDEX_FOLDER_PATH, "index_")
-    purgeFiles(INDEX_FOLDER_PATH, "secondary_index")
+    # These are the files of the segment, including the tombstone bitmap of the previous index.
+    # A resumed build keeps the titles and temporary index files of its checkpoint.
+    # A full build also drops the segments added to the previous index.
+    if(checkpoint is None):
+        purgeFiles(BUILD_FOLDER_PATH, "temp_index_")
+        purgeFiles(BUILD_FOLDER_PATH, "checkpoint")
+    for fileNamePrefix in SEGMENT_FILE_PREFIXES:
+        if(fileNamePrefix != "title_" or checkpoint is None):
+            purgeFiles(BUILD_FOLDER_PATH, fileNamePrefix)
+    if(not args.add):
+        purgeSegments(INDEX_FOLDER_PATH)
+        purgeShards(INDEX_FOLDER_PATH)
     purgeFiles("./", STAT_FILE_NAME)
 
     start_time = datetime.utcnow()
 
-    # Create a WikiHandler object to process the XML dump and build the primary index.
-    wikiHandler = WikiHandler(INDEX_FOLDER_PATH, MAX_WORD_CAP, TITLE_FILE_CAP, INVERTED_INDEX_TEMP_FILE_CAP, FINAL_INDEX_FILE_CAP)
+    # Create a WikiHandler object to index the pages of the XML dump and build the primary index.
+    wikiHandler = WikiHandler(BUILD_FOLDER_PATH, MAX_WORD_CAP, TITLE_FILE_CAP, INVERTED_INDEX_MEMORY_BUDGET, FINAL_INDEX_FILE_CAP, WORKER_COUNT, WORKER_BATCH_SIZE, MAX_PENDING_BATCHES, MERGE_WORKER_COUNT, PREPROCESSOR)
+    wikiHandler.checkpoint_input = checkpoint_input
+    wikiHandler.progress_fp = open(PROGRESS_FILE_NAME, "w", encoding='utf-8')
+    wikiHandler.PROGRESS_INTERVAL = args.progress_interval
+    input_offset = 0
+    if(checkpoint is not None):
+        wikiHandler.resume(checkpoint)
+        input_offset = checkpoint["input_offset"]
+        print("Resuming from document", checkpoint["doc_count"], "at byte", input_offset, "of the dump")
 
-    # Parse the XML wiki dump file and build the primary index.
-    wikiParser = xml.sax.make_parser()
-    wikiParser.setFeature(xml.sax.handler.feature_namespaces, 0)
-    wikiParser.setContentHandler(wikiHandler)
-    wikiParser.parse(WIKI_DUMP_XML_FILE_PATH)
+    # Stream the pages of the XML wiki dump file into the WikiHandler and build the primary index.
+    pageExtractor = PageExtractor()
+    pages = iter_dump_pages(pageExtractor, input_offset, STREAM_INDEX_PATH)
+    if(SHARD_INDEX is not None):
+        pages = iter_shard_pages(pages)
+    for title, text in pages:
+        wikiHandler.add_page(title, text, pageExtractor.PageEndOffset)
+    wikiHandler.finish()
 
-    # Delete temporary index files.
-    purgeFiles(INDEX_FOLDER_PATH, "temp_index_")
+    # Delete temporary index files, and the checkpoint they belong to.
+    purgeFiles(BUILD_FOLDER_PATH, "temp_index_")
+    purgeFiles(BUILD_FOLDER_PATH, "checkpoint")
     primary_end_time = datetime.utcnow()
 
     # Store statistics about the indexing process.
@@ -117,11 +408,19 @@ if __name__ == "__main__":
     STATS["TotalUniqueWords"] = wikiHandler.TotalUniqueWords
     STATS["TitleFileCount"] = wikiHandler.TitleFileCount
     STATS["PrimaryIndexFileCount"] = wikiHandler.PrimaryIndexFileCount
+    stem_lookups = wikiHandler.StemCacheHits + wikiHandler.StemCacheMisses
+    STATS["StemCacheHitRate"] = (wikiHandler.StemCacheHits / stem_lookups) if stem_lookups > 0 else 0.0
+    STATS["StemCacheMemory"] = convertSize(wikiHandler.StemCacheMemory)
+    STATS["MaxTermCount"] = wikiHandler.MaxTermCount
+    STATS["MaxTermTableMemory"] = convertSize(wikiHandler.MaxTermTableMemory)
+    STATS["MaxTempIndexMemory"] = convertSize(wikiHandler.MaxTempIndexMemory)
+    STATS["TempIndexSize"] = convertSize(wikiHandler.MergeBytesRead)
+    STATS["MergeThroughput"] = (wikiHandler.MergeBytesRead / wikiHandler.MergeTime / (1024 * 1024)) if wikiHandler.MergeTime > 0 else 0.0
     STATS["PrimaryIndexTime"] = (primary_end_time - start_time).total_seconds()
     print("Primary Index creation time:", STATS["PrimaryIndexTime"], "seconds")
 
     # Build the secondary index.
-    secondaryIndexHandler = SecondaryIndexHandler(INDEX_FOLDER_PATH)
+    secondaryIndexHandler = SecondaryIndexHandler(BUILD_FOLDER_PATH, SECONDARY_INDEX_SAMPLE_RATE)
     secondaryIndexHandler.build_secondary_index()
     secondary_end_time = datetime.utcnow()
 
@@ -129,9 +428,22 @@ if __name__ == "__main__":
     STATS["SecondaryIndexFileCount"] = secondaryIndexHandler.SecondaryIndexFileCount
     STATS["SecondaryIndexTime"] = (secondary_end_time - primary_end_time).total_seconds()
     print("Secondary Index creation time:", STATS["SecondaryIndexTime"], "seconds")
+    wikiHandler.write_progress("secondary_index", force = True)
+    wikiHandler.progress_fp.close()
+
+    # Make the segment visible to searchers, and merge the small segments of the index folder in the background.
+    replaced_count = publish_segment(wikiHandler.TotalDocCount, args.add and args.replace)
+    if(args.add and args.replace):
+        print("Replaced", replaced_count, "documents")
+    if(args.add and not args.no_merge):
+        start_segment_merger()
 
     # Calculate the total size of index files.
-    STATS["IndexSize"] = get_index_size()
+    STATS["IndexBytes"] = get_index_size()
+    STATS["IndexSize"] = convertSize(STATS["IndexBytes"])
 
-    # Generate and write statistics to the specified stat file.
+    # Generate and write statistics to the specified stat file, and the per-stage statistics to the JSON report.
     generate_statistics()
+    build_stats = wikiHandler.get_build_stats()
+    build_stats["stages"]["secondary_index"] = STATS["SecondaryIndexTime"]
+    generate_json_statistics(build_stats)
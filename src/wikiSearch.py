@@ -1,16 +1,52 @@
 import os
-import sys
+import json
+import math
+import time
+import heapq
+import argparse
+import threading
+import multiprocessing
+from bisect import bisect_right
 from datetime import datetime
 
-from secondaryIndexHandler import SecondaryIndexHandler
-from titleHandler import TitleHandler
-from preprocessor import Preprocessor
+from segmentHandler import SegmentHandler, read_segment_manifest
+from fastPreprocessor import PREPROCESSORS
+from cacheHandler import CacheHandler
+from postingList import PostingList
+import postingCodec
+from topKScorer import TermCursor, get_top_k
+from queryTrace import QueryTrace, summarize_traces
+import numpyScorer
 
 # Global Variables
 INDEX_FOLDER_PATH = "indexFolder"
 
 MAX_WORD_CAP = 30
 TITLE_FILE_CAP = 20000
+# Load the full term dictionary to seek straight to a term's record. When disabled (or when the index has
+# no dictionary), terms are located through the sampled secondary index, which keeps far less in memory.
+LOAD_TERM_DICTIONARY = True
+# Retrieve the top k with MaxScore dynamic pruning, or score every posting exhaustively when disabled.
+USE_DYNAMIC_PRUNING = True
+# Score whole posting lists as NumPy arrays instead, when NumPy is installed.
+USE_NUMPY_SCORING = False
+# Query preprocessing backend: "nltk", or "fast", which returns the same tokens.
+PREPROCESSOR = "nltk"
+# Memory budgets in bytes of the query-result cache and of the decoded posting-list cache, 0 disables a cache.
+QUERY_CACHE_SIZE = 16 * 1024 * 1024
+POSTING_CACHE_SIZE = 128 * 1024 * 1024
+# Seconds between checks of the index folder for changes, which clear the caches and reload the index.
+INDEX_CHECK_INTERVAL = 1.0
+# Estimated bytes held per cached query term and per cached result.
+QUERY_CACHE_ENTRY_SIZE = 64
+# Estimated bytes held per cached document count of a word.
+DOC_COUNT_CACHE_ENTRY_SIZE = 64
+# File the query traces are written to as JSON lines, "-" for standard output, or None to not trace queries.
+TRACE_FILE_PATH = None
+# Worker processes scoring the queries of a query file as one batch, or 0 to run the queries one by one.
+BATCH_WORKER_COUNT = 0
+# Queries of a query file read and processed as one batch, which bounds the term records held at once.
+BATCH_SIZE = 1000
 k = 10
 section_weight = [1.0, 0.65, 0.05, 0.15, 0.2, 0.175]
 
@@ -32,79 +68,285 @@ field_mapping = {
     "r" : 5
 }
 
-secondaryIndexHandler = None
+# The IndexSnapshot of the loaded index, replaced as a whole when the index folder changes, and the number of times it was loaded.
+index_snapshot = None
+index_generation = 0
 preprocessor = None
-titleHandler = None
-
-
-def extract_field_count(posting_list):
-    # Extract field counts from a posting list.
-    fields = [0, 0, 0, 0, 0, 0]
-    posting_list = posting_list.split("-")
-    for posting in posting_list:
-        if(posting[0] == 't'):
-            fields[0] = int(posting[1:])
-        elif(posting[0] == 'i'):
-            fields[1] = int(posting[1:])
-        elif(posting[0] == 'b'):
-            fields[2] = int(posting[1:])
-        elif(posting[0] == 'c'):
-            fields[3] = int(posting[1:])
-        elif(posting[0] == 'l'):
-            fields[4] = int(posting[1:])
-        elif(posting[0] == 'r'):
-            fields[5] = int(posting[1:])
-    return fields
-    
-def get_fields_score(fields, IDF, field = None):
-    # Calculate the score for a given set of fields.
-    score = 0
-    for i in range(0, len(fields)):
-        if field is None:
-            score += (float(fields[i]) * float(section_weight[i]) * float(IDF))
-        elif(i == field):
-            score += (float(fields[i]) * float(IDF))
-    return score
+queryCache = None
+postingCache = None
+
+index_fingerprint = None
+last_index_check_time = 0
+index_lock = threading.Lock()
+
+# The QueryTrace of the query being processed by each thread, if it's traced.
+query_trace_state = threading.local()
+
+# The time.perf_counter() deadline of the query being processed by each thread, if it has one.
+query_deadline_state = threading.local()
+
+# The term records of every segment read for a batch of queries, and the segments' tombstone bitmaps and docID bases,
+# set in each batch worker process, which decodes the term records into posting lists at most once.
+batch_term_records = []
+batch_deleted_docs = []
+batch_doc_bases = []
+batch_posting_lists = {}
+
+
+class IndexSnapshot:
+    def __init__(self, segments, generation):
+        # Initialize the segments of the index in docID order, their docID bases, and the number of documents over all segments,
+        # as loaded at one time. A query reads the snapshot once, so an index reload while it runs doesn't mix old and new segments,
+        # and cache entries are keyed by the snapshot's generation, so the ones computed on an older index never hit.
+        self.segments = segments
+        self.doc_bases = [segment.doc_base for segment in segments]
+        self.total_doc_count = sum(segment.live_doc_count for segment in segments)
+        self.generation = generation
+
 
-def get_word_scores(word, field = None):
-    # Retrieve the scores for a word in a specific field.
-    index_file_idx = secondaryIndexHandler.get_index_file_idx(word)
-    index_file_name = "index_" + str(index_file_idx) + ".txt"
-    with open(os.path.join(INDEX_FOLDER_PATH, index_file_name), "r", encoding='utf-8') as index_fp:
-        score = {}
-        line = index_fp.readline()
-        while(line != ""):
-            line = line.strip("\n")
-            if(line != ""):
-                cur_word, idf, doc_count, word_freq, posting_list = line.split("=")
-                if(cur_word == word) :
-                    docs = posting_list.split("|")
-                    for doc in docs:
-                        docID, posting_list = doc.split(" ")
-                        fields = extract_field_count(posting_list)
-                        cur_score = get_fields_score(fields, idf, field)
-                        if cur_score > 0:
-                            score[int(docID)] = cur_score
-            line = index_fp.readline()
+def get_posting_scores(postingList, field, IDF, deleted_docs = None):
+    # Calculate the score of every document in a word's posting list, except the ones marked in deleted_docs.
+    # A document scores the IDF-weighted sum of its field counts, or only the count of the queried field.
+    score = {}
+    for docIDs, bitmaps, counts in postingList.iter_blocks():
+        check_query_deadline()
+        count_idx = 0
+        for docID, bitmap in zip(docIDs, bitmaps):
+            if(deleted_docs is not None and (deleted_docs[docID >> 3] >> (docID & 7)) & 1):
+                count_idx += len(postingCodec.BITMAP_FIELDS[bitmap])
+                continue
+            cur_score = 0
+            for i in postingCodec.BITMAP_FIELDS[bitmap]:
+                if field is None:
+                    cur_score += counts[count_idx] * section_weight[i] * IDF
+                elif(i == field):
+                    cur_score += counts[count_idx] * IDF
+                count_idx += 1
+            if cur_score > 0:
+                score[docID] = cur_score
     return score
 
-def process_non_field_query(query):
-    # Process a non-field query and retrieve the top-k documents.
-    words = preprocessor.process(query)
+def get_query_trace():
+    # The QueryTrace of the query being processed by the current thread, or None if it isn't traced.
+    return getattr(query_trace_state, "queryTrace", None)
+
+def get_query_deadline():
+    # The deadline of the query being processed by the current thread, or None if it has none.
+    return getattr(query_deadline_state, "deadline", None)
+
+def check_query_deadline():
+    # Stop the query being processed by the current thread with a TimeoutError once it's past its deadline.
+    deadline = get_query_deadline()
+    if(deadline is not None and time.perf_counter() > deadline):
+        raise TimeoutError("Query ran past its deadline")
+
+def run_with_deadline(deadline, function, *args):
+    # Run a query function in the current thread with a time.perf_counter() deadline. Past it, the query stops
+    # with a TimeoutError, so a query whose caller stopped waiting for it doesn't keep the thread busy, nor starts at all.
+    query_deadline_state.deadline = deadline
+    try:
+        check_query_deadline()
+        return function(*args)
+    finally:
+        query_deadline_state.deadline = None
+
+def add_trace_time(phase, start_time):
+    # Add the time since start_time to a phase of the current query's trace, if it's traced.
+    queryTrace = get_query_trace()
+    if queryTrace is not None:
+        queryTrace.add_time(phase, time.perf_counter() - start_time)
+
+def get_posting_list(segment, word, field = None):
+    # Return the PostingList of a word in a segment, or of its field term record for a field,
+    # or None if the word isn't indexed in it or doesn't occur in the field.
+    # Posting lists are cached with the blocks decoded so far, so hot terms are neither read nor decoded again.
+    queryTrace = get_query_trace()
+    cache_key = (segment.generation, segment.name, word, field)
+    postingList = postingCache.get(cache_key)
+    if postingList is not None:
+        if queryTrace is not None:
+            queryTrace.add_posting_list(postingList, True)
+        return postingList
+    record = segment.get_term_record(word, queryTrace, field)
+    if record is None:
+        return None
+    start_time = time.perf_counter()
+    postingList = PostingList(record)
+    postingCache.put(cache_key, postingList, postingList.get_size())
+    if queryTrace is not None:
+        queryTrace.add_time("decode", time.perf_counter() - start_time)
+        queryTrace.add_posting_list(postingList, False)
+    return postingList
+
+def get_doc_count(segment, word, postingList = None):
+    # Number of documents of a word in a segment that aren't deleted, cached, or 0 if the word isn't indexed in it.
+    # The header of the word's term record holds it, or its postingList if given, until the segment has deleted documents
+    # whose postings are still in its index files. Then the postings are counted, so the IDF is taken over the same documents
+    # as the IndexSnapshot's total_doc_count, and stays the same once the merger drops the postings of the deleted documents.
+    cache_key = (segment.generation, segment.name, word, "doc_count")
+    doc_count = postingCache.get(cache_key)
+    if doc_count is None:
+        if(segment.deleted_docs is not None and postingList is None):
+            postingList = get_posting_list(segment, word)
+        if postingList is not None:
+            doc_count = segment.count_live_docs(postingList)
+        elif segment.deleted_docs is not None:
+            doc_count = 0
+        else:
+            doc_count = segment.get_term_doc_count(word, get_query_trace())
+        postingCache.put(cache_key, doc_count, DOC_COUNT_CACHE_ENTRY_SIZE)
+    return doc_count
+
+def get_query_term_posting_lists(word, field, segments):
+    # The PostingList of a (word, field) query term in every segment, None where the segment doesn't have it.
+    # A field query term only reads the word's field term record, which holds the counts of that field alone.
+    return [get_posting_list(segment, word, field) for segment in segments]
+
+def get_query_term_doc_count(word, field, postingLists, segments):
+    # Number of documents of a query term over all segments: a field query term counts all the documents of the word.
+    if field is None:
+        return sum(get_doc_count(segment, word, postingList) for segment, postingList in zip(segments, postingLists) if postingList is not None)
+    return sum(get_doc_count(segment, word) for segment in segments)
+
+def get_segment_query_terms(query_terms, indexSnapshot, global_stats = None):
+    # The (PostingList, field, IDF) query terms of every segment of an IndexSnapshot.
+    # The IDF goes with the query term rather than onto the PostingList, which the posting cache shares between
+    # concurrent queries, some of them scored with the IDF over all shards given by a broker.
+    # A term's IDF is the word's, taken over all segments, so the scores of documents of different segments compare.
+    # The global_stats of a shard, the document count of the whole index and of every query term, give the IDF over all shards instead.
+    queryTrace = get_query_trace()
+    segment_query_terms = [[] for segment in indexSnapshot.segments]
+    index_doc_count = indexSnapshot.total_doc_count
+    if global_stats is not None:
+        index_doc_count, term_doc_counts = global_stats
+    for term_idx, (word, field) in enumerate(query_terms):
+        check_query_deadline()
+        if queryTrace is not None:
+            queryTrace.start_term(word, field)
+        postingLists = get_query_term_posting_lists(word, field, indexSnapshot.segments)
+        doc_count = 0
+        if global_stats is not None:
+            doc_count = term_doc_counts[term_idx]
+        elif any(postingList is not None for postingList in postingLists):
+            doc_count = get_query_term_doc_count(word, field, postingLists, indexSnapshot.segments)
+        if queryTrace is not None:
+            queryTrace.end_term()
+        if(doc_count == 0):
+            continue
+        IDF = math.log10(index_doc_count / doc_count)
+        for segment_idx, postingList in enumerate(postingLists):
+            if postingList is not None:
+                segment_query_terms[segment_idx].append((postingList, field, IDF))
+    return segment_query_terms
+
+def get_field_weights(field = None):
+    # Weights of the fields in a term's score: the section weights, or only the queried field.
+    if field is None:
+        return section_weight
+    field_weights = [0, 0, 0, 0, 0, 0]
+    field_weights[field] = 1
+    return field_weights
+
+def get_top_k_docs_exhaustive(query_terms, deleted_docs = None):
+    # Score every document of every (PostingList, field, IDF) query term and sort them all, by score then docID.
     docs_scores = {}
-    for word in words:
-        word_scores = get_word_scores(word)
+    for postingList, field, IDF in query_terms:
+        word_scores = get_posting_scores(postingList, field, IDF, deleted_docs)
         for docID, score in word_scores.items():
             if docID not in docs_scores:
                 docs_scores[docID] = score
             else:
                 docs_scores[docID] += score
-    docs_scores_sorted = sorted(docs_scores.items(), key=lambda x: x[1], reverse=True)
-    top_k_docs = [item[0] for item in docs_scores_sorted[:k]]
+    start_time = time.perf_counter()
+    docs_scores_sorted = sorted(docs_scores.items(), key=lambda x: (-x[1], x[0]))
+    add_trace_time("sort", start_time)
+    return docs_scores_sorted[:k]
+
+def get_top_k_docs_numpy(query_terms, deleted_docs = None):
+    # Score every posting of the (PostingList, field, IDF) query terms with vectorized NumPy operations.
+    term_records = []
+    for postingList, field, IDF in query_terms:
+        term_records.append((postingList.record, get_field_weights(field), IDF))
+    return numpyScorer.get_top_k(term_records, k, deleted_docs)
+
+def get_top_k_docs_pruned(query_terms, deleted_docs = None):
+    # Retrieve the top k with MaxScore dynamic pruning over cursors on the (PostingList, field, IDF) query terms.
+    cursors = []
+    for postingList, field, IDF in query_terms:
+        cursors.append(TermCursor(postingList, get_field_weights(field), IDF))
+    return get_top_k(cursors, k, deleted_docs, get_query_deadline())
+
+def get_top_k_docs(query_terms, indexSnapshot, global_stats = None):
+    # Retrieve the top-k (docID, score) pairs for a list of (word, field) query terms over the segments of an IndexSnapshot.
+    # Every segment retrieves its own top k, skipping its deleted documents, and they're merged by score into the top k over all segments.
+    # Results are cached by the normalized query terms, as every scorer returns the same top k, and the snapshot's generation.
+    queryTrace = get_query_trace()
+    query_key = (indexSnapshot.generation, tuple(query_terms), k)
+    if global_stats is not None:
+        query_key = (indexSnapshot.generation, tuple(query_terms), k, global_stats[0], tuple(global_stats[1]))
+    top_k_docs = queryCache.get(query_key)
+    if top_k_docs is not None:
+        if queryTrace is not None:
+            queryTrace.query_cache_hit = True
+        return top_k_docs
+
+    segment_query_terms_list = get_segment_query_terms(query_terms, indexSnapshot, global_stats)
+
+    # Scoring decodes the posting blocks it needs, whose time a trace counts apart, and sorts the candidates of the exhaustive scorer.
+    if queryTrace is not None:
+        queryTrace.start_scoring()
+        sort_time = queryTrace.phase_times["sort"]
+    start_time = time.perf_counter()
+    segment_top_k_docs = []
+    for segment, segment_query_terms in zip(indexSnapshot.segments, segment_query_terms_list):
+        if(len(segment_query_terms) == 0):
+            continue
+        check_query_deadline()
+        segment_top_k_docs.append(get_segment_top_k_docs(segment_query_terms, segment.deleted_docs, segment.doc_base))
+    if queryTrace is not None:
+        queryTrace.end_scoring(time.perf_counter() - start_time - (queryTrace.phase_times["sort"] - sort_time))
+
+    start_time = time.perf_counter()
+    top_k_docs = merge_top_k_docs(segment_top_k_docs)
+    add_trace_time("sort", start_time)
+    queryCache.put(query_key, top_k_docs, (len(query_terms) + len(top_k_docs) + 1) * QUERY_CACHE_ENTRY_SIZE)
     return top_k_docs
 
-def process_field_query(query):
-    # Process a field query and retrieve the top-k documents.
+def get_segment_top_k_docs(segment_query_terms, deleted_docs, doc_base):
+    # Retrieve the top-k (docID, score) pairs of a segment's (PostingList, field, IDF) query terms with the configured scorer,
+    # skipping the documents marked in its tombstone bitmap, and offset their docIDs by the segment's docID base.
+    if USE_NUMPY_SCORING:
+        cur_top_k_docs = get_top_k_docs_numpy(segment_query_terms, deleted_docs)
+    elif USE_DYNAMIC_PRUNING:
+        cur_top_k_docs = get_top_k_docs_pruned(segment_query_terms, deleted_docs)
+    else:
+        cur_top_k_docs = get_top_k_docs_exhaustive(segment_query_terms, deleted_docs)
+    return [(doc_base + docID, score) for docID, score in cur_top_k_docs]
+
+def merge_top_k_docs(segment_top_k_docs):
+    # Merge the top k of every segment, each sorted by score then docID, into the top k over all segments.
+    return list(heapq.merge(*segment_top_k_docs, key = lambda doc: (-doc[1], doc[0])))[:k]
+
+def get_query_terms(query):
+    # Preprocess a query, whether it's fielded or non-fielded, into its (word, field) query terms.
+    if ":" in query:
+        return get_field_query_terms(query)
+    start_time = time.perf_counter()
+    words = preprocessor.process(query)
+    add_trace_time("preprocess", start_time)
+    return [(word, None) for word in words]
+
+def process_non_field_query(query, indexSnapshot):
+    # Process a non-field query and retrieve the top-k (docID, score) pairs.
+    return get_top_k_docs(get_query_terms(query), indexSnapshot)
+
+def process_field_query(query, indexSnapshot):
+    # Process a field query and retrieve the top-k (docID, score) pairs.
+    return get_top_k_docs(get_field_query_terms(query), indexSnapshot)
+
+def get_field_query_terms(query):
+    # Preprocess a field query into its (word, field) query terms.
+    start_time = time.perf_counter()
     query = query.lower()
     for field, short_field in short_field_replace.items():
         query = query.replace(field, short_field)
@@ -117,63 +359,240 @@ def process_field_query(query):
         words = preprocessor.process(words)
         field_query[field_mapping[field]] += words
 
-    docs_scores = {}
+    query_terms = []
     for i in range(6):
         for word in field_query[i]:
-            word_scores = get_word_scores(word, i)
-            for docID, score in word_scores.items():
-                if docID not in docs_scores:
-                    docs_scores[docID] = score
-                else:
-                    docs_scores[docID] += score
-    docs_scores_sorted = sorted(docs_scores.items(), key=lambda x: x[1], reverse=True)
-    top_k_docs = [item[0] for item in docs_scores_sorted[:k]]
-    return top_k_docs
+            query_terms.append((word, i))
+    add_trace_time("preprocess", start_time)
+    return query_terms
 
-def process_query(query):
+def process_query(query, queryTrace = None):
     # Process a query, whether it's fielded or non-fielded.
+    # Returns the (docID, title, score) of the top-k documents and the processing time.
+    # A QueryTrace passed in records the time spent in each phase of the query and the bytes read.
     start_query_time = datetime.utcnow()
-    if ":" in query:
-        top_k_docs = process_field_query(query)
-    else:
-        top_k_docs = process_non_field_query(query)
-    topK_docs_details = []
-    for docID in top_k_docs:
-        title = titleHandler.get_title(docID)
-        topK_docs_details.append((docID, title))
+    query_trace_state.queryTrace = queryTrace
+    try:
+        indexSnapshot = check_index_changes()
+        if ":" in query:
+            top_k_docs = process_field_query(query, indexSnapshot)
+        else:
+            top_k_docs = process_non_field_query(query, indexSnapshot)
+        start_time = time.perf_counter()
+        topK_docs_details = []
+        for docID, score in top_k_docs:
+            title = get_title(docID, indexSnapshot)
+            topK_docs_details.append((docID, title, score))
+        add_trace_time("titles", start_time)
+    finally:
+        query_trace_state.queryTrace = None
     end_query_time = datetime.utcnow()
     query_processing_time = (end_query_time - start_query_time).total_seconds()
+    if queryTrace is not None:
+        queryTrace.total_time = query_processing_time
+        queryTrace.result_count = len(topK_docs_details)
     return topK_docs_details, query_processing_time
 
+def get_query_term_stats(query):
+    # Statistics of a query over the index of a shard, which a broker adds up over all shards for the IDF of its terms.
+    # Returns the query's (word, field) query terms, the document count of every term,
+    # whether the shard holds postings of every term, and the shard's document count.
+    indexSnapshot = check_index_changes()
+    query_terms = get_query_terms(query)
+    term_doc_counts = []
+    term_found = []
+    for word, field in query_terms:
+        postingLists = get_query_term_posting_lists(word, field, indexSnapshot.segments)
+        term_doc_counts.append(get_query_term_doc_count(word, field, postingLists, indexSnapshot.segments))
+        term_found.append(any(postingList is not None for postingList in postingLists))
+    return query_terms, term_doc_counts, term_found, indexSnapshot.total_doc_count
+
+def process_shard_query(query_terms, term_doc_counts, doc_count):
+    # Process the (word, field) query terms of a query in a shard, with the IDF of its terms over all shards:
+    # the document count of every term and of the whole index, added up by the broker.
+    # Returns the (docID, title, score) of the shard's top-k documents, with the shard's docIDs, and the processing time.
+    start_time = time.perf_counter()
+    indexSnapshot = check_index_changes()
+    query_terms = [(word, field) for word, field in query_terms]
+    top_k_docs = get_top_k_docs(query_terms, indexSnapshot, (doc_count, list(term_doc_counts)))
+    topK_docs_details = [(docID, get_title(docID, indexSnapshot), score) for docID, score in top_k_docs]
+    return topK_docs_details, time.perf_counter() - start_time
+
+def get_record_doc_count(segment, word, record):
+    # Number of documents of a word in a segment that aren't deleted, from its term record read for a batch.
+    if segment.deleted_docs is None:
+        return postingCodec.decode_term_header(record)[2]
+    return get_doc_count(segment, word, PostingList(record))
+
+def get_batch_query_terms(query_terms, term_records, indexSnapshot):
+    # The (term key, field, IDF) query terms of every segment of an IndexSnapshot for a query of a batch,
+    # like get_segment_query_terms but over the term records read for the batch, keyed by (word, field),
+    # which hold the word's own term record too for a field query term, as it counts all the documents of the word.
+    segments = indexSnapshot.segments
+    segment_query_terms = [[] for segment in segments]
+    for word, field in query_terms:
+        term_key = (word, field)
+        records = [segment_term_records.get(term_key) for segment_term_records in term_records]
+        doc_count = 0
+        if any(record is not None for record in records):
+            word_records = [segment_term_records.get((word, None)) for segment_term_records in term_records]
+            doc_count = sum(get_record_doc_count(segment, word, record) for segment, record in zip(segments, word_records) if record is not None)
+        if(doc_count == 0):
+            continue
+        IDF = math.log10(indexSnapshot.total_doc_count / doc_count)
+        for segment_idx, record in enumerate(records):
+            if record is not None:
+                segment_query_terms[segment_idx].append((term_key, field, IDF))
+    return segment_query_terms
+
+def init_batch_worker(term_records, deleted_docs, doc_bases, use_numpy_scoring, use_dynamic_pruning):
+    # Set the term records and segments of a batch, and the scorer, in a batch worker process.
+    global batch_term_records, batch_deleted_docs, batch_doc_bases, batch_posting_lists, USE_NUMPY_SCORING, USE_DYNAMIC_PRUNING
+    batch_term_records = term_records
+    batch_deleted_docs = deleted_docs
+    batch_doc_bases = doc_bases
+    batch_posting_lists = {}
+    USE_NUMPY_SCORING = use_numpy_scoring
+    USE_DYNAMIC_PRUNING = use_dynamic_pruning
+
+def get_batch_posting_list(segment_idx, term_key):
+    # The PostingList of a term record read for the batch, kept with its decoded blocks for the worker's next queries.
+    postingList = batch_posting_lists.get((segment_idx, term_key))
+    if postingList is None:
+        postingList = PostingList(batch_term_records[segment_idx][term_key])
+        batch_posting_lists[(segment_idx, term_key)] = postingList
+    return postingList
+
+def score_batch_query(batch_query_terms):
+    # Score a query of a batch in a batch worker process.
+    # Returns its top-k (docID, score) pairs, the same as get_top_k_docs, and the seconds spent scoring it.
+    start_time = time.perf_counter()
+    segment_top_k_docs = []
+    for segment_idx, segment_query_terms in enumerate(batch_query_terms):
+        if(len(segment_query_terms) == 0):
+            continue
+        query_terms = [(get_batch_posting_list(segment_idx, term_key), field, IDF) for term_key, field, IDF in segment_query_terms]
+        segment_top_k_docs.append(get_segment_top_k_docs(query_terms, batch_deleted_docs[segment_idx], batch_doc_bases[segment_idx]))
+    return merge_top_k_docs(segment_top_k_docs), time.perf_counter() - start_time
+
+def process_query_batch(queries):
+    # Process a batch of queries: preprocess all of them, read the term records they need once per segment,
+    # in index file order, and score the distinct queries across BATCH_WORKER_COUNT worker processes.
+    # Returns the (docID, title, score) of the top-k documents of every query and its processing time, in query order:
+    # the time spent preprocessing, scoring it and reading its titles, without the shared reads of the term records.
+    indexSnapshot = check_index_changes()
+    segments = indexSnapshot.segments
+    query_terms_list = []
+    preprocess_times = []
+    for query in queries:
+        start_time = time.perf_counter()
+        query_terms_list.append(get_query_terms(query))
+        preprocess_times.append(time.perf_counter() - start_time)
+
+    # Queries with the same query terms are scored once.
+    distinct_query_idx = {}
+    distinct_query_terms = []
+    for query_terms in query_terms_list:
+        if tuple(query_terms) not in distinct_query_idx:
+            distinct_query_idx[tuple(query_terms)] = len(distinct_query_terms)
+            distinct_query_terms.append(query_terms)
+
+    term_keys = set()
+    for query_terms in distinct_query_terms:
+        for word, field in query_terms:
+            term_keys.add((word, field))
+            term_keys.add((word, None))
+    term_records = [segment.get_term_records(term_keys) for segment in segments]
+    batch_query_terms_list = [get_batch_query_terms(query_terms, term_records, indexSnapshot) for query_terms in distinct_query_terms]
+
+    # Worker processes are handed the term records once, and score the queries in chunks.
+    initargs = (term_records, [segment.deleted_docs for segment in segments], [segment.doc_base for segment in segments], USE_NUMPY_SCORING, USE_DYNAMIC_PRUNING)
+    worker_count = min(BATCH_WORKER_COUNT, len(batch_query_terms_list))
+    if(worker_count > 1):
+        with multiprocessing.Pool(worker_count, initializer = init_batch_worker, initargs = initargs) as pool:
+            results = pool.map(score_batch_query, batch_query_terms_list, chunksize = max(1, len(batch_query_terms_list) // (worker_count * 4)))
+    else:
+        init_batch_worker(*initargs)
+        results = [score_batch_query(batch_query_terms) for batch_query_terms in batch_query_terms_list]
+
+    query_results = []
+    for query_terms, preprocess_time in zip(query_terms_list, preprocess_times):
+        top_k_docs, score_time = results[distinct_query_idx[tuple(query_terms)]]
+        start_time = time.perf_counter()
+        topK_docs_details = [(docID, get_title(docID, indexSnapshot), score) for docID, score in top_k_docs]
+        query_results.append((topK_docs_details, preprocess_time + score_time + time.perf_counter() - start_time))
+    return query_results
+
+def write_traces(queryTraces, summarize = False):
+    # Write query traces as JSON lines to the trace file, or to standard output, followed by their summary for a batch.
+    lines = [queryTrace.to_json() for queryTrace in queryTraces]
+    if summarize:
+        lines.append(json.dumps({"summary": summarize_traces(queryTraces)}))
+    if(TRACE_FILE_PATH == "-"):
+        print("\n".join(lines))
+    else:
+        with open(TRACE_FILE_PATH, "w", encoding='utf-8') as trace_fp:
+            trace_fp.write("\n".join(lines) + "\n")
+        print("Query traces written to the file '" + TRACE_FILE_PATH + "'")
+
 def start_interactive(query):
     # Start interactive mode and process user queries.
-    top_docs, query_processing_time = process_query(query)
+    queryTrace = QueryTrace(query) if TRACE_FILE_PATH is not None else None
+    top_docs, query_processing_time = process_query(query, queryTrace)
     print("----------------------------------------------------------")
     print("Query: '" + query + "'")
-    for docID, doc_title in top_docs:
+    for docID, doc_title, score in top_docs:
         print(str(docID) + ", " + doc_title)
     print("Processing Time: %.2f seconds" % query_processing_time)
     print("----------------------------------------------------------")
+    if queryTrace is not None:
+        write_traces([queryTrace])
+
+def read_query_chunks(query_in_fp, chunk_size):
+    # Iterate over the non-empty queries of a query file, in lists of at most chunk_size queries.
+    queries = []
+    for query in query_in_fp:
+        query = query.strip("\n").strip(" ")
+        if(query == ""):
+            continue
+        queries.append(query)
+        if(len(queries) == chunk_size):
+            yield queries
+            queries = []
+    if(len(queries) > 0):
+        yield queries
 
 def non_interactive(query_in_file_name):
     # Process queries from a file and write results to an output file.
     start_time = datetime.utcnow()
 
-    with open(query_in_file_name, "r", encoding='utf-8') as query_in_fp:
-        queries = query_in_fp.readlines()
-        queries = [query.strip("\n").strip(" ") for query in queries if query.strip("\n").strip(" ") != ""]
-
     query_out_file_name = "query_out.txt"
+    queryTraces = []
+    batch_count = 0
 
-    with open(query_out_file_name, "w", encoding='utf-8') as query_out_fp:
+    with open(query_in_file_name, "r", encoding='utf-8') as query_in_fp, open(query_out_file_name, "w", encoding='utf-8') as query_out_fp:
         query_out_fp.write("----------------------------------------------------------\n")
-        for query in queries:
-            top_docs, query_processing_time = process_query(query)
-            query_out_fp.write("Query: '" + query + "'\n")
-            for docID, doc_title in top_docs:
-                query_out_fp.write(str(docID) + ", " + doc_title + "\n")
-            query_out_fp.write("Processing Time: %.2f seconds\n" % query_processing_time)
-            query_out_fp.write("----------------------------------------------------------\n")
+        for queries in read_query_chunks(query_in_fp, BATCH_SIZE):
+            # Every BATCH_SIZE queries are processed at once as a batch, and written out in query order.
+            query_results = None
+            if(BATCH_WORKER_COUNT > 0):
+                query_results = process_query_batch(queries)
+                batch_count += 1
+
+            for query_idx, query in enumerate(queries):
+                if query_results is not None:
+                    top_docs, query_processing_time = query_results[query_idx]
+                else:
+                    queryTrace = None
+                    if TRACE_FILE_PATH is not None:
+                        queryTrace = QueryTrace(query)
+                        queryTraces.append(queryTrace)
+                    top_docs, query_processing_time = process_query(query, queryTrace)
+                query_out_fp.write("Query: '" + query + "'\n")
+                for docID, doc_title, score in top_docs:
+                    query_out_fp.write(str(docID) + ", " + doc_title + "\n")
+                query_out_fp.write("Processing Time: %.2f seconds\n" % query_processing_time)
+                query_out_fp.write("----------------------------------------------------------\n")
 
         end_time = datetime.utcnow()
         total_processing_time = (end_time - start_time).total_seconds()
@@ -182,30 +601,113 @@ def non_interactive(query_in_file_name):
 
     print("Queries Executed Successfully in %.2f seconds" % total_processing_time)
     print("Queries output written to the file '" + query_out_file_name + "'")
+    # Batches read their term records without the caches, so only queries processed one at a time report them.
+    if(BATCH_WORKER_COUNT > 0):
+        print("Queries processed in %d batches of at most %d queries" % (batch_count, BATCH_SIZE))
+    else:
+        for cache_name, cache_stats in get_cache_stats().items():
+            print("%s cache: %d hits, %d misses (%.1f%% hit rate)" % (cache_name, cache_stats["hits"], cache_stats["misses"], cache_stats["hit_rate"] * 100))
+    if(TRACE_FILE_PATH is not None and len(queryTraces) > 0):
+        write_traces(queryTraces, summarize = True)
+
+def get_title(docID, indexSnapshot):
+    # Retrieve the title of a document, from the segment of an IndexSnapshot holding its docID.
+    segment = indexSnapshot.segments[bisect_right(indexSnapshot.doc_bases, docID) - 1]
+    return segment.get_title(docID - segment.doc_base)
+
+def get_cache_stats():
+    # Return the counters of the query-result and posting-list caches.
+    return {"Query": queryCache.get_stats(), "Posting": postingCache.get_stats()}
+
+def get_index_fingerprint():
+    # Name, size and modification time of every file in the index folder, to notice when the index changes.
+    fingerprint = []
+    with os.scandir(INDEX_FOLDER_PATH) as entries:
+        for entry in entries:
+            if entry.is_file():
+                stat = entry.stat()
+                fingerprint.append((entry.name, stat.st_size, stat.st_mtime_ns))
+    return sorted(fingerprint)
+
+def check_index_changes():
+    # Every INDEX_CHECK_INTERVAL seconds, check whether the index folder changed,
+    # and if so clear the caches and reload the title store and term lookup structures.
+    # Returns the IndexSnapshot to process a query with.
+    global last_index_check_time, index_fingerprint
+    if(time.monotonic() - last_index_check_time < INDEX_CHECK_INTERVAL):
+        return index_snapshot
+    with index_lock:
+        if(time.monotonic() - last_index_check_time < INDEX_CHECK_INTERVAL):
+            return index_snapshot
+        fingerprint = get_index_fingerprint()
+        if(fingerprint != index_fingerprint):
+            print("Index folder changed, reloading the index")
+            load_index_files()
+        last_index_check_time = time.monotonic()
+    return index_snapshot
+
+def load_index_files():
+    # Load the title stores and term lookup structures of the segments listed in the index folder into a new IndexSnapshot, clearing the caches.
+    # The segments carry the snapshot's generation, which keys the posting lists and document counts cached for them.
+    global index_snapshot, index_generation, index_fingerprint
+    index_fingerprint = get_index_fingerprint()
+    index_generation += 1
+
+    curSegments = []
+    for segment in read_segment_manifest(INDEX_FOLDER_PATH)["segments"]:
+        segmentHandler = SegmentHandler(INDEX_FOLDER_PATH, segment, TITLE_FILE_CAP, LOAD_TERM_DICTIONARY)
+        segmentHandler.load()
+        segmentHandler.generation = index_generation
+        curSegments.append(segmentHandler)
+
+    index_snapshot = IndexSnapshot(curSegments, index_generation)
+    queryCache.clear()
+    postingCache.clear()
+
+def load_index(index_folder_path):
+    # Load the preprocessor, caches, and the segments of an index folder.
+    global INDEX_FOLDER_PATH, USE_NUMPY_SCORING, preprocessor, queryCache, postingCache, last_index_check_time
+    INDEX_FOLDER_PATH = index_folder_path
+
+    preprocessor = PREPROCESSORS[PREPROCESSOR](MAX_WORD_CAP)
+    queryCache = CacheHandler(QUERY_CACHE_SIZE)
+    postingCache = CacheHandler(POSTING_CACHE_SIZE)
+
+    if(USE_NUMPY_SCORING and not numpyScorer.is_available()):
+        print("NumPy isn't installed, scoring in pure Python")
+        USE_NUMPY_SCORING = False
+
+    load_index_files()
+    last_index_check_time = time.monotonic()
 
 
 if __name__ == "__main__":
-    if(len(sys.argv) != 4):
-        print("Invalid number of arguments")
-        print("Expected 3 arguments: <path_to_wiki_xml_dump> <path_to_index_folder> <stat_file_name>")
-        exit(1)
+    argParser = argparse.ArgumentParser(description = "Search an index, for a query or for the queries of a file.")
+    argParser.add_argument("index_folder_path", help = "path to the index folder")
+    argParser.add_argument("query", help = "the query in interactive mode, otherwise the file of queries, one per line")
+    argParser.add_argument("is_interactive", help = "'true' to run a single query, otherwise the queries of the file")
+    argParser.add_argument("--trace", default = None, help = "trace every query, writing the time and bytes read of each phase and term as JSON lines to this file, or '-' for standard output")
+    argParser.add_argument("--batch-workers", type = int, default = BATCH_WORKER_COUNT, help = "process a query file in batches, reading every term once per batch and scoring the queries in this many worker processes (default: %(default)s, i.e. one query at a time)")
+    argParser.add_argument("--batch-size", type = int, default = BATCH_SIZE, help = "number of queries of a batch, whose term records are held in memory at once (default: %(default)s)")
+    args = argParser.parse_args()
+    if(args.batch_workers > 0 and args.trace is not None):
+        argParser.error("--trace traces queries processed one at a time, and can't be used with --batch-workers")
+    if(args.batch_size < 1):
+        argParser.error("--batch-size must be at least 1")
 
-    # global WIKI_DUMP_XML_FILE_PATH, INDEX_FOLDER_PATH, STAT_FILE_NAME
     IS_INTERACTIVE = False
 
-    INDEX_FOLDER_PATH = os.path.abspath(sys.argv[1])
-    IS_INTERACTIVE = sys.argv[3].lower()
-    QUERY_IN = sys.argv[2]
+    INDEX_FOLDER_PATH = os.path.abspath(args.index_folder_path)
+    IS_INTERACTIVE = args.is_interactive.lower()
+    QUERY_IN = args.query
+    TRACE_FILE_PATH = args.trace
+    BATCH_WORKER_COUNT = args.batch_workers
+    BATCH_SIZE = args.batch_size
 
     
     print(INDEX_FOLDER_PATH, QUERY_IN, IS_INTERACTIVE)
-    
-    preprocessor = Preprocessor(MAX_WORD_CAP)
-    titleHandler = TitleHandler(INDEX_FOLDER_PATH, TITLE_FILE_CAP)
 
-    # Loading Secondary Index
-    secondaryIndexHandler = SecondaryIndexHandler(INDEX_FOLDER_PATH)
-    secondaryIndexHandler.load_secondary_index()
+    load_index(INDEX_FOLDER_PATH)
 
     if(IS_INTERACTIVE == "true"):
         start_interactive(QUERY_IN)